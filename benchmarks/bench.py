@@ -0,0 +1,347 @@
+"""Benchmarks for both apps against the offline fake model.
+
+Runs without network access or an API key, so it can guard against
+performance regressions in CI. For each app it measures:
+
+- pipeline: prompt construction, the model call, JSON extraction and CEFR
+  sorting, with p50/p95 latency, time to the first streamed word, the p50 of
+  each stage and the tokens per request;
+- word list: the same without examples, the first phase of two-phase
+  generation;
+- translation: the same request in another target language, which only
+  translates the cached Dutch content;
+- throughput: requests per second with N concurrent sessions going through
+  the shared request gateway;
+- parse failures: how many malformed responses are repaired, partially
+  recovered or lost, and the generation time lost to them;
+- hedging: the p99 of word lists from a model with a latency tail, with
+  and without hedged requests, and the extra calls the hedges cost;
+- render: a full Streamlit script run of the app via AppTest, with the
+  generation running as a job in two background workers.
+
+Usage::
+
+    python benchmarks/bench.py --runs 20 --sessions 8 --latency 0.5 --tps 400
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from dutch_words_coach.cache import ResponseCache
+from dutch_words_coach.core import get_cefr_order, keyword_of
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.gateway import DEFAULT_HEDGE_QUANTILE, MIN_LATENCY_SAMPLES, RequestGateway
+from dutch_words_coach.generation import extract_vocabulary, generate_situation_words
+from dutch_words_coach.jobs import start_workers
+from dutch_words_coach.metrics import start_trace
+from dutch_words_coach.parsing import ResponseParseError
+
+APPS = {
+    "coach": ROOT / "context-language-coach" / "streamlit_app.py",
+    "extractor": ROOT / "text-vocab-extractor" / "streamlit_app.py",
+}
+
+SAMPLE_TEXT = (
+    "Vanochtend ging ik met de fiets naar de markt. Het was druk, maar gezellig. "
+    "Ik heb verse groenten gekocht en een kop koffie gedronken op het terras."
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def make_input(app, index):
+    if app == "coach":
+        return f"bestellen in een café (sessie {index})"
+    return f"{SAMPLE_TEXT} ({index})"
+
+
+def run_flow(app, model, text, stream=False, on_word=None, with_examples=True, language="English", cache=None):
+    """One request through the app's pipeline, including the sort done before rendering."""
+    if app == "coach":
+        result_json = generate_situation_words(model, text, language, cache=cache, stream=stream, on_word=on_word,
+                                               with_examples=with_examples)
+    else:
+        result_json = extract_vocabulary(model, text, language, "B1", cache=cache, stream=stream, on_word=on_word,
+                                         with_examples=with_examples)
+    words = result_json.get("words", [])
+    return sorted(words, key=lambda x: get_cefr_order(keyword_of(x).get("level", "A1")))
+
+
+def bench_pipeline(app, model_factory, runs):
+    model = model_factory()
+    latencies = []
+    first_words = []
+    stage_times = {}
+    tokens = {"prompt": 0, "output": 0}
+    for index in range(runs):
+        trace = start_trace()
+        start = time.perf_counter()
+        first_word = []
+        run_flow(app, model, make_input(app, index), stream=True,
+                 on_word=lambda item: first_word or first_word.append(time.perf_counter() - start))
+        latencies.append(time.perf_counter() - start)
+        if first_word:
+            first_words.append(first_word[0])
+        for stage, ms in trace.stage_totals().items():
+            stage_times.setdefault(stage, []).append(ms / 1000)
+        for kind in tokens:
+            tokens[kind] += trace.tokens[kind]
+    metrics = {
+        "pipeline_p50_ms": percentile(latencies, 50) * 1000,
+        "pipeline_p95_ms": percentile(latencies, 95) * 1000,
+        "first_word_p50_ms": percentile(first_words, 50) * 1000,
+    }
+    # Where the time goes, e.g. parse_p50_ms for JSON extraction
+    for stage, seconds in stage_times.items():
+        metrics[f"{stage}_p50_ms"] = percentile(seconds, 50) * 1000
+    metrics["prompt_tokens"] = tokens["prompt"] // max(runs, 1)
+    metrics["output_tokens"] = tokens["output"] // max(runs, 1)
+    return metrics
+
+
+def bench_word_list(app, model_factory, runs):
+    """First phase of two-phase generation: the word list without examples."""
+    model = model_factory()
+    latencies = []
+    output_tokens = 0
+    for index in range(runs):
+        trace = start_trace()
+        start = time.perf_counter()
+        run_flow(app, model, make_input(app, f"words-{index}"), with_examples=False)
+        latencies.append(time.perf_counter() - start)
+        output_tokens += trace.tokens["output"]
+    return {
+        "word_list_p50_ms": percentile(latencies, 50) * 1000,
+        "word_list_output_tokens": output_tokens // max(runs, 1),
+    }
+
+
+def bench_translation(app, model_factory, runs):
+    """Switching the target language: the cached Dutch content is only translated."""
+    model = model_factory()
+    latencies = []
+    output_tokens = 0
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for index in range(runs):
+            # A fresh cache per run: the fake model repeats its sentences, which would hit the translation cache
+            cache = ResponseCache(Path(cache_dir) / f"cache-{index}.sqlite3")
+            text = make_input(app, f"translate-{index}")
+            run_flow(app, model, text, language="English", cache=cache)
+            trace = start_trace()
+            start = time.perf_counter()
+            run_flow(app, model, text, language="Korean", cache=cache)
+            latencies.append(time.perf_counter() - start)
+            output_tokens += trace.tokens["output"]
+    return {
+        "translate_p50_ms": percentile(latencies, 50) * 1000,
+        "translate_output_tokens": output_tokens // max(runs, 1),
+    }
+
+
+def bench_throughput(app, model_factory, sessions, requests_per_session):
+    gateway = RequestGateway(model_factory(), requests_per_minute=1_000_000, tokens_per_minute=10 ** 12,
+                             max_concurrency=sessions)
+    latencies = []
+
+    def session(session_index):
+        for request_index in range(requests_per_session):
+            start = time.perf_counter()
+            run_flow(app, gateway, make_input(app, f"{session_index}-{request_index}"))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(session, range(sessions)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput_req_per_s": sessions * requests_per_session / elapsed,
+        "concurrent_p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def bench_parse_failures(app, model_factory, runs, malformed_rate):
+    model = model_factory(malformed_rate=malformed_rate, seed=42)
+    partial = 0
+    failed = 0
+    call_times = []
+    for index in range(runs):
+        start = time.perf_counter()
+        try:
+            run_flow(app, model, make_input(app, f"parse-{index}"))
+        except ResponseParseError as e:
+            if e.partial:
+                partial += 1
+            else:
+                failed += 1
+        call_times.append(time.perf_counter() - start)
+    # A lost response has to be generated again by the user
+    lost_seconds = failed * statistics.mean(call_times) if call_times else 0.0
+    return {
+        "malformed": model.malformed,
+        "repaired": model.malformed - partial - failed,
+        "partial": partial,
+        "failed": failed,
+        "parse_failure_cost_ms": lost_seconds * 1000 / max(runs, 1),
+    }
+
+
+def bench_hedging(app, model_factory, runs, tail_rate, tail_latency):
+    """Word lists from a model whose calls are sometimes slow to start, without and with hedged requests."""
+    metrics = {}
+    calls = {}
+    for name, quantile in (("tail", 0), ("hedged", DEFAULT_HEDGE_QUANTILE)):
+        model = model_factory(tail_rate=tail_rate, tail_latency=tail_latency, seed=7)
+        gateway = RequestGateway(model, requests_per_minute=1_000_000, tokens_per_minute=10 ** 12,
+                                 hedge_quantile=quantile)
+        latencies = []
+        # The first requests only give the gateway the latencies to hedge on
+        for index in range(MIN_LATENCY_SAMPLES + runs):
+            start = time.perf_counter()
+            run_flow(app, gateway, make_input(app, f"{name}-{index}"), with_examples=False)
+            if index >= MIN_LATENCY_SAMPLES:
+                latencies.append(time.perf_counter() - start)
+        metrics[f"{name}_p99_ms"] = percentile(latencies, 99) * 1000
+        calls[name] = model.calls
+    metrics["hedge_extra_calls"] = calls["hedged"] - calls["tail"]
+    return metrics
+
+
+def bench_render(app, runs, fake_env):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ.update(fake_env)
+    render_times = []
+    for index in range(runs):
+        at = AppTest.from_file(str(APPS[app]), default_timeout=120)
+        # The deployed apps read the API key from Streamlit secrets
+        at.secrets["GEMINI_API_KEY"] = fake_env["GEMINI_API_KEY"]
+        at.run()
+        at.text_area[0].input(make_input(app, f"render-{index}-{time.time()}"))
+        at.run()
+        at.button[0].click()
+        start = time.perf_counter()
+        at.run()
+        # The page checks the job once per run and AppTest does not run the timed polling fragment
+        while (not any("Klaar" in success.value for success in at.success) and not (at.exception or at.error)
+               and time.perf_counter() - start < 120):
+            time.sleep(0.05)
+            at.run()
+        render_times.append(time.perf_counter() - start)
+        if at.exception or at.error:
+            raise RuntimeError(f"{app} failed: {(at.exception or at.error)[0].value}")
+    return {
+        "render_p50_ms": percentile(render_times, 50) * 1000,
+        "render_p95_ms": percentile(render_times, 95) * 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return the metrics that regressed by more than ``tolerance`` against ``baseline``."""
+    regressions = []
+    for app, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(app, {}).get(name)
+            if not old:
+                continue
+            if name.endswith("_ms") and value > old * (1 + tolerance):
+                regressions.append(f"{app}.{name}: {old:.1f} -> {value:.1f}")
+            elif name.endswith("_per_s") and value < old * (1 - tolerance):
+                regressions.append(f"{app}.{name}: {old:.1f} -> {value:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark both apps against the offline fake model.")
+    parser.add_argument("--apps", nargs="+", choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument("--runs", type=int, default=20, help="requests per measurement (default: 20)")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions (default: 8)")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake time to first token in s (default: 0.2)")
+    parser.add_argument("--tps", type=float, default=2000, help="fake tokens per second (default: 2000)")
+    parser.add_argument("--malformed-rate", type=float, default=0.2,
+                        help="share of malformed responses in the parse benchmark (default: 0.2)")
+    parser.add_argument("--tail-rate", type=float, default=0.03,
+                        help="share of slow calls in the hedging benchmark (default: 0.03)")
+    parser.add_argument("--tail-latency", type=float, default=2.0,
+                        help="fake time to first token of a slow call in s (default: 2.0)")
+    parser.add_argument("--recordings", help="batch output JSONL whose results are replayed instead of synthetic ones")
+    parser.add_argument("--skip-render", action="store_true", help="skip the Streamlit AppTest runs")
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    # Streamlit caches resources per process, so all AppTest runs share one cache directory
+    cache_dir = tempfile.TemporaryDirectory()
+    fake_env = {
+        "DUTCH_WORDS_COACH_FAKE_MODEL": "1",
+        "DUTCH_WORDS_COACH_CACHE": str(Path(cache_dir.name) / "cache.sqlite3"),
+        "DUTCH_WORDS_COACH_VOCABULARY": str(Path(cache_dir.name) / "vocabulary.sqlite3"),
+        "DUTCH_WORDS_COACH_JOBS": str(Path(cache_dir.name) / "jobs.sqlite3"),
+        # The workers are started here, so they can be stopped before the directory is removed
+        "DUTCH_WORDS_COACH_WORKERS": "0",
+        "GEMINI_API_KEY": "fake",
+        "GEMINI_RPM": "1000000",
+        "FAKE_MODEL_LATENCY": str(args.latency),
+        "FAKE_MODEL_TPS": str(args.tps),
+    }
+    workers = None
+    if not args.skip_render:
+        os.environ.update(fake_env)
+        workers = start_workers(fake_env["GEMINI_API_KEY"], count=2)
+    for app in args.apps:
+        kind = "situations" if app == "coach" else "texts"
+        responses = FakeGenerativeModel.load_recordings(args.recordings, kind) if args.recordings else None
+
+        def model_factory(**kwargs):
+            return FakeGenerativeModel(latency=args.latency, tokens_per_second=args.tps, responses=responses,
+                                       **kwargs)
+
+        metrics = {}
+        metrics.update(bench_pipeline(app, model_factory, args.runs))
+        metrics.update(bench_word_list(app, model_factory, args.runs))
+        metrics.update(bench_translation(app, model_factory, args.runs))
+        metrics.update(bench_throughput(app, model_factory, args.sessions, max(1, args.runs // args.sessions)))
+        metrics.update(bench_parse_failures(app, model_factory, args.runs, args.malformed_rate))
+        metrics.update(bench_hedging(app, model_factory, args.runs, args.tail_rate, args.tail_latency))
+        if not args.skip_render:
+            metrics.update(bench_render(app, max(1, args.runs // 4), fake_env))
+        results[app] = metrics
+
+        print(f"\n{app}")
+        for name, value in metrics.items():
+            print(f"  {name:<24} {value:10.1f}" if isinstance(value, float) else f"  {name:<24} {value:10d}")
+    if workers is not None:
+        workers.terminate()
+        workers.wait()
+    cache_dir.cleanup()
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,18 @@
 import streamlit as st
-import google.generativeai as genai
-import json
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Make the shared package at the repository root importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dutch_words_coach.cache import normalize_input
+from dutch_words_coach.core import LANGUAGE_MAPPING, get_cefr_order
+from dutch_words_coach.jobs import JobNotFound
+from dutch_words_coach.parsing import ResponseParseError
+from dutch_words_coach.ui import (RENDER_MODES, debug_panel, examples_loader, job_result, known_words_marker,
+                                  learner_vocabulary, render_words, resumed_job, setup_model, start_run_trace)
+
 # Load environment variables
 load_dotenv()
 
@@ -23,24 +32,10 @@ st.sidebar.header("🔧 Instellingen")
 # API key configuration
 api_key = os.getenv("GEMINI_API_KEY")
 # api_key = st.secrets.get("GEMINI_API_KEY", os.getenv("GEMINI_API_KEY"))
+api_key, jobs = setup_model(api_key)
 
-if api_key:
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        st.sidebar.success("✅ API sleutel ingesteld! (omgevingsvariabele)")
-    except Exception as e:
-        st.sidebar.error(f"❌ API sleutel fout: {str(e)}")
-else:
-    api_key = st.sidebar.text_input("Voer je Gemini API sleutel in:", type="password", 
-                                   help="Gemini API sleutel van Google AI Studio")
-    if api_key:
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-1.5-flash-latest')
-            st.sidebar.success("✅ API sleutel ingesteld!")
-        except Exception as e:
-            st.sidebar.error(f"❌ API sleutel fout: {str(e)}")
+# Stage timings and token usage of this run, shown in the optional debug panel
+trace = start_run_trace()
 
 # Text input area
 st.header("📝 Situatie")
@@ -54,27 +49,35 @@ situation = st.text_area(
 # Language selection
 target_language = st.selectbox(
     "In welke taal wil je de uitleg ontvangen?",
-    options=["Korean (한국어)", "English"],
+    options=list(LANGUAGE_MAPPING),
     help="Kies je moedertaal voor uitleg en vertalingen"
 )
 
-# Language code configuration
-language_mapping = {
-    "Korean (한국어)": {"code": "kr", "name": "한국어", "full": "Korean"},
-    "English": {"code": "en", "name": "English", "full": "English"},
-}
-
-lang_info = language_mapping[target_language]
+lang_info = LANGUAGE_MAPPING[target_language]
 lang_code = lang_info["code"]
 lang_name = lang_info["name"]
 lang_full = lang_info["full"]
 
-# CEFR level
-def get_cefr_order(level):
-    """CEFR 레벨을 숫자로 변환하여 정렬에 사용"""
-    level_order = {'A1': 1, 'A2': 2, 'B1': 3, 'B2': 4, 'C1': 5, 'C2': 6}
-    clean_level = level.split()[0] if level else "A1"
-    return level_order.get(clean_level, 0)
+# Streaming shows each word as soon as the model has generated it
+stream_mode = st.sidebar.toggle("⚡ Woorden direct tonen (streaming)", value=True)
+
+# Two-phase generation: the word list alone is much faster; examples are fetched on request
+lazy_examples = st.sidebar.toggle("🐇 Eerst de woordenlijst, voorbeelden later", value=False,
+                                  help="Toont de woorden sneller en haalt voorbeeldzinnen alleen op als je erom vraagt")
+
+# Compact modes send the whole list as one element instead of an expander per word
+render_mode = st.sidebar.radio("📋 Weergave", RENDER_MODES, help="Compact en Tabel laden sneller bij veel woorden")
+
+# Known words are left out and words seen before reuse their stored examples
+learner = learner_vocabulary()
+
+# The inputs that determine the result; the other widgets only change how it is shown.
+# Results are kept in the session so reruns re-render them without a new generation.
+current_inputs = {"situation": normalize_input(situation, casefold=True), "language": lang_full,
+                  "learner": [learner.id, learner.stats()[1]] if learner else None}
+stored = st.session_state.get("coach_result")
+# Generation runs as a background job; its id is kept in the URL so a reloaded page picks it up again
+pending_job = resumed_job(stored)
 
 # Summary execution button
 if st.button("🚀 Woorden ophalen", type="primary", disabled=not (api_key and situation)):
@@ -82,67 +85,85 @@ if st.button("🚀 Woorden ophalen", type="primary", disabled=not (api_key and s
         st.warning("⚠️ Voer eerst je API sleutel in!")
     elif not situation:
         st.warning("⚠️ Voer eerst een situatie in!")
+    elif stored is not None and stored["inputs"] == current_inputs and not stored["partial"]:
+        # Same inputs as the stored result: show it again instead of regenerating
+        pass
     else:
-        with st.spinner("Nederlandse woorden en voorbeeldzinnen worden opgehaald... Even geduld hebben."):
-            prompt = f"""Could you provide 20 useful Dutch words or phrases relevant to the following situation? {situation} 
-Requirements:
-- along with 4 example sentences for each 
-- provide {lang_full} translations
-- indicate the CEFR level for each word/phrase
-- Provide result in JSON format
-
-JSON structure:
-- words: [{{"keyword": {{"nl": "Dutch keyword", "target": "{lang_full} keyword", "level": "CEFR level"}}, "examples": [{{"nl": "Dutch example", "target": "{lang_full} example"}}] (4 items) }}] (20 items)"""
-            
-            # API call
-            response = model.generate_content(prompt)
-            result_text = response.text
-                
-            # JSON parsing
-            try:
-                if "```json" in result_text:
-                    json_start = result_text.find("```json") + 7
-                    json_end = result_text.find("```", json_start)
-                    json_text = result_text[json_start:json_end].strip()
-                elif "{" in result_text:
-                    json_start = result_text.find("{")
-                    json_end = result_text.rfind("}") + 1
-                    json_text = result_text[json_start:json_end]
-                else:
-                    json_text = result_text
-                
-                result_json = json.loads(json_text)
-                
-                # Display results
-                st.success("✅ Klaar!")                    
-                # words and expressions section
-                st.header("💬 Nuttige Woorden en Uitdrukkingen")
-                words = result_json.get("words", [])
-                
-                if words:
-                    sorted_words = sorted(words, key=lambda x: get_cefr_order(x.get('keyword', {}).get('level', 'A1')))
-
-                    for i, item in enumerate(sorted_words, 1):
-                        word_nl = item.get('keyword', {}).get('nl', 'N/A')
-                        word_target = item.get('keyword', {}).get('target', 'N/A')
-                        word_level = item.get('keyword', {}).get('level', 'N/A')
-                        with st.expander(f"**{word_nl}** ({word_level})"):
-                            st.write(f"{word_target}")
-                            st.write(f"**Voorbeelden:**")
-                            examples = item.get('examples', [])
-                            for idx, example in enumerate(examples, 1):
-                                example_nl = example.get('nl', 'N/A')
-                                example_target = example.get('target', 'N/A')
-                                st.write(f"- {example_nl} ({example_target})")
-                    
-                # Display original JSON
-                # with st.expander("🔧 Originele JSON Data for developer"):
-                #     st.json(result_json)
-                
-            except json.JSONDecodeError:
-                st.warning("⚠️ JSON verwerking mislukt. Originele respons:")
-                st.text_area("Originele respons:", value=result_text, height=300)
+        params = {"situation": situation, "language": lang_full, "stream": stream_mode,
+                  "with_examples": not lazy_examples, "learner": learner.id if learner else None}
+        # A cached result is shown right away; anything else is generated by a background job
+        result_json = jobs.cached("situation", params)
+        if result_json is not None:
+            stored = st.session_state["coach_result"] = {
+                "inputs": current_inputs, "result": result_json, "partial": False, "context": situation, "job": None
+            }
+            pending_job = None
+            if "job" in st.query_params:
+                del st.query_params["job"]
+        else:
+            pending_job = jobs.submit("situation", params, meta={"inputs": current_inputs, "context": situation})
+            st.query_params["job"] = pending_job
+
+# While the job runs, the page shows its progress and checks it again without blocking the script
+running = False
+if pending_job is not None and jobs is not None:
+    result_json = None
+    partial = False
+    try:
+        result_json = job_result(jobs, pending_job,
+                                 "Nederlandse woorden en voorbeeldzinnen worden opgehaald... Even geduld hebben.",
+                                 "💬 Nuttige Woorden en Uitdrukkingen" if stream_mode else None, render_mode)
+        running = result_json is None
+    except ResponseParseError as e:
+        if e.partial:
+            # Show the words that could be recovered instead of nothing
+            st.warning("⚠️ De respons was onvolledig. De herstelde woorden worden getoond.")
+            result_json = e.partial
+            partial = True
+        else:
+            st.warning("⚠️ JSON verwerking mislukt. Originele respons:")
+            st.text_area("Originele respons:", value=e.text, height=300)
+    except JobNotFound:
+        # Finished jobs are removed after a day
+        pass
+    except Exception as e:
+        st.error(f"❌ Woorden ophalen is mislukt. Probeer het later opnieuw. ({e})")
+
+    if result_json is not None:
+        meta = jobs.get(pending_job)["meta"]
+        stored = st.session_state["coach_result"] = {
+            "inputs": meta["inputs"], "result": result_json, "partial": partial, "context": meta["context"],
+            "job": pending_job
+        }
+    elif not running:
+        del st.query_params["job"]
+
+if stored is not None and not running:
+    result_json = stored["result"]
+    # Display results
+    if stored["inputs"] == current_inputs:
+        st.success("✅ Klaar!")
+    else:
+        st.info("ℹ️ Deze resultaten horen bij je vorige invoer. Klik op 'Woorden ophalen' voor nieuwe resultaten.")
+    # words and expressions section
+    st.header("💬 Nuttige Woorden en Uitdrukkingen")
+    words = result_json.get("words", [])
+    
+    if words:
+        sorted_words = sorted(words, key=lambda x: get_cefr_order(x.get('keyword', {}).get('level', 'A1')))
+
+        render_words(sorted_words, render_mode)
+
+        examples_loader(sorted_words, jobs, {"context": stored["context"], "language": stored["inputs"]["language"],
+                                             "learner": learner.id if learner else None}, "coach")
+        known_words_marker(sorted_words, learner, "coach")
+        
+    # Display original JSON
+    # with st.expander("🔧 Originele JSON Data for developer"):
+    #     st.json(result_json)
                 
+debug_panel(trace)
+
 # Markdown
 st.markdown("---")
 st.markdown("*Gemaakt met ❤️ door Ahkyeong*")
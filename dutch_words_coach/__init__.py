@@ -0,0 +1 @@
+"""Shared helpers for the Dutch learning apps."""
@@ -0,0 +1,179 @@
+"""Headless batch generation.
+
+Pre-generate vocabulary for many situations or Dutch texts without the
+Streamlit UI. Results are appended to a JSONL file as soon as each input is
+done, and inputs already present in the output are skipped, so an
+interrupted run continues where it stopped.
+
+Examples::
+
+    python -m dutch_words_coach situations situations.txt -o situations.jsonl
+    python -m dutch_words_coach texts corpus/ -o texts.jsonl --level B1 --concurrency 8
+    python -m dutch_words_coach situations situations.txt -o out.jsonl --fake
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from .cache import ResponseCache, normalize_input
+from .client import GeminiModel
+from .core import LANGUAGE_MAPPING
+from .corpus import ExampleCorpus
+from .fake import FakeGenerativeModel
+from .gateway import RequestGateway
+from .generation import extract_vocabulary, generate_situation_words
+from .metrics import start_export, write_textfile
+from .routing import ModelRouter
+
+LANGUAGES = {info["full"]: info for info in LANGUAGE_MAPPING.values()}
+LEVELS = ("A1", "A2", "B1", "B2")
+
+
+def input_id(text):
+    """Stable id of an input, used to resume interrupted runs."""
+    return hashlib.sha1(normalize_input(text).encode("utf-8")).hexdigest()[:16]
+
+
+def read_inputs(path, kind):
+    """Return ``(id, text)`` pairs from a file or directory.
+
+    - a directory: every ``*.txt`` file is one input
+    - a ``.jsonl`` file: one ``{"text": ..., "id": ...}`` object per line (``id`` optional)
+    - any other file: one situation per line for ``situations``, the whole
+      file as one text for ``texts``; blank lines and ``#`` comments are skipped
+    """
+    path = Path(path)
+    if path.is_dir():
+        texts = [(str(file.relative_to(path)), file.read_text(encoding="utf-8"))
+                 for file in sorted(path.rglob("*.txt"))]
+        return [(name, text) for name, text in texts if text.strip()]
+
+    content = path.read_text(encoding="utf-8")
+    if path.suffix == ".jsonl":
+        inputs = []
+        for line in content.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                inputs.append((str(record.get("id") or input_id(record["text"])), record["text"]))
+        return inputs
+
+    if kind == "texts":
+        return [(path.name, content)] if content.strip() else []
+    lines = [line.strip() for line in content.splitlines()]
+    return [(input_id(line), line) for line in lines if line and not line.startswith("#")]
+
+
+def completed_ids(output_path):
+    """``(id, language, level)`` of the inputs that already have a result in ``output_path``."""
+    done = set()
+    if not Path(output_path).exists():
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by an interrupted run
+                continue
+            if "result" in record:
+                done.add((record["id"], record.get("language"), record.get("level")))
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def run_batch(model, kind, inputs, output_path, lang_full="English", lang_level="B1", cache=None,
+              concurrency=4, on_record=None, corpus=None):
+    """Generate results for ``inputs`` and append them to ``output_path``.
+
+    Returns the number of newly written records. Failed inputs are written
+    with an ``error`` field and retried on the next run. The generated
+    examples are added to ``corpus``.
+    """
+    level = lang_level if kind == "texts" else None
+    done = completed_ids(output_path)
+    todo = list({item_id: text for item_id, text in inputs if (item_id, lang_full, level) not in done}.items())
+
+    def generate(text):
+        if kind == "situations":
+            return generate_situation_words(model, text, lang_full, cache=cache, corpus=corpus)
+        return extract_vocabulary(model, text, lang_full, lang_level, cache=cache, corpus=corpus)
+
+    written = 0
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if out.tell() and not _ends_with_newline(output_path):
+            # Do not append to a line cut off by an interrupted run
+            out.write("\n")
+        futures = {executor.submit(generate, text): (item_id, text) for item_id, text in todo}
+        for future in as_completed(futures):
+            item_id, text = futures[future]
+            record = {"id": item_id, "kind": kind, "input": text, "language": lang_full, "level": level}
+            try:
+                record["result"] = future.result()
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            written += 1
+            if on_record is not None:
+                on_record(record, written, len(todo))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dutch_words_coach", description=__doc__.split("\n\n")[0])
+    parser.add_argument("kind", choices=["situations", "texts"], help="which app's generation to run")
+    parser.add_argument("input", help="input file or directory")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append results to")
+    parser.add_argument("--language", choices=sorted(LANGUAGES), default="English",
+                        help="language for translations (default: English)")
+    parser.add_argument("--level", choices=LEVELS, default="B1", help="learner level for texts (default: B1)")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel requests (default: 4)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the shared response cache")
+    parser.add_argument("--no-corpus", action="store_true",
+                        help="do not add the generated examples to the shared example corpus")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model instead of Gemini")
+    parser.add_argument("--metrics", default=os.getenv("DUTCH_WORDS_COACH_METRICS_FILE"),
+                        help="write Prometheus metrics (timings, tokens, cache hits) to this file when done")
+    args = parser.parse_args(argv)
+    start_export()
+
+    if args.fake:
+        model = FakeGenerativeModel()
+    else:
+        try:
+            from dotenv import load_dotenv
+            load_dotenv()
+        except ImportError:
+            pass
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            parser.error("GEMINI_API_KEY is not set (or use --fake)")
+        # Routed like the apps, so their requests find the results in the cache; a batch has no deadline
+        model = ModelRouter.from_env(lambda model_name: RequestGateway.from_env(GeminiModel(api_key, model_name),
+                                                                                max_concurrency=args.concurrency),
+                                     deadline=None)
+
+    inputs = read_inputs(args.input, args.kind)
+    cache = None if args.no_cache else ResponseCache()
+    # The fake model's sentences would be served to learners later
+    corpus = None if args.no_corpus or args.fake else ExampleCorpus()
+
+    def report(record, written, total):
+        status = "error: " + record["error"] if "error" in record else "ok"
+        print(f"[{written}/{total}] {record['id']} {status}", file=sys.stderr)
+
+    written = run_batch(model, args.kind, inputs, args.output, LANGUAGES[args.language]["full"], args.level,
+                        cache=cache, concurrency=args.concurrency, on_record=report, corpus=corpus)
+    print(f"{written} new result(s) written to {args.output} ({len(inputs)} input(s))", file=sys.stderr)
+    if args.metrics:
+        write_textfile(args.metrics)
+    return 0
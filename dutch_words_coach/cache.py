@@ -0,0 +1,116 @@
+"""Disk-backed cache for parsed Gemini responses.
+
+Entries live in a small SQLite database so the cache is shared by every
+Streamlit session and by every process on the same machine. The cache is
+bounded by a maximum number of entries (least recently used entries are
+evicted first) and by a time-to-live.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import closing
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "dutch-words-coach" / "responses.sqlite3"
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+class CacheMiss(LookupError):
+    """Raised by a model that may only serve cached results when a result is not cached."""
+
+
+def normalize_input(text, casefold=False):
+    """Normalize user input so trivially different requests share a cache entry."""
+    text = unicodedata.normalize("NFC", text or "")
+    text = " ".join(text.split())
+    return text.casefold() if casefold else text
+
+
+def make_key(kind, text, language, level, model_name, prompt_version):
+    """Build a cache key from everything that influences the model output."""
+    parts = {
+        "kind": kind,
+        "text": text,
+        "language": language,
+        "level": level,
+        "model": model_name,
+        "prompt_version": prompt_version,
+    }
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded LRU/TTL cache of JSON-serialisable results stored in SQLite."""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        if path is None:
+            path = os.getenv("DUTCH_WORDS_COACH_CACHE", DEFAULT_CACHE_PATH)
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def get(self, key):
+        """Return the cached value for ``key`` or ``None`` on a miss."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store ``value`` under ``key`` and evict expired or excess entries."""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        if self.max_entries is not None:
+            conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
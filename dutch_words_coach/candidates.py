@@ -0,0 +1,330 @@
+"""Local candidate-word pre-extraction for the text vocab extractor.
+
+Before the model is called, the Dutch text is tokenized and lemmatized here,
+stopwords, proper nouns and very common words are dropped and the remaining
+lemmas are ranked by how much they matter in this text: words that occur
+often in the text but are rare in Dutch overall come first, as in tf-idf.
+Multi-word expressions are looked up in a bundled idiom list; their words do
+not come back as separate candidates. The model then gets the short
+candidate list instead of the whole text and only fills in translations,
+levels and examples.
+
+Everything runs in pure Python on the word lists in ``data/``. The overall
+frequencies come from ``frequency_nl.txt``, lemma frequencies derived from
+wordfreq (see the header of that file for the sources). The lemmatizer
+applies the regular Dutch inflection rules (plurals, adjective endings, verb
+forms, diminutives) and accepts a rule's result only if it is a lemma in that
+list; irregular forms come from a table.
+"""
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+DEFAULT_MAX_CANDIDATES = 20
+# Zipf frequency (log10 per billion words) from which a word counts as very common: about the 100 most
+# frequent lemmas (gaan, jaar, goed, willen), which every learner meets first
+COMMON_ZIPF = 6.0
+# Words missing from the frequency list, which stops at 3.0 (one per million words)
+_UNKNOWN_ZIPF = 2.5
+# Zipf frequency of a word that occurs once in a billion words; the rarity of a word is its distance to it
+_RARITY_BASE = 9.0
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+(?:['’-][^\W\d_]+)*")
+# Punctuation (or a line break) between two tokens that starts a new sentence
+_SENTENCE_BREAK_RE = re.compile(r"[.!?…:;]|\n")
+_VOWELS = "aeiouy"
+# Words in an idiom that stand for any reflexive or possessive pronoun
+_PRONOUN_SLOTS = {
+    "zich": {"zich", "me", "mij", "je", "jezelf", "zichzelf", "ons", "u", "jullie"},
+    "je": {"je", "jouw", "mijn", "zijn", "haar", "ons", "onze", "jullie", "hun", "uw"},
+}
+# An idiom still matches with this many other words between two of its words
+_MAX_IDIOM_GAP = 2
+
+
+def _read_lines(name):
+    with open(DATA_DIR / name, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+# The lists are loaded on first use and shared by all sessions
+@lru_cache(maxsize=None)
+def _frequencies():
+    """``{lemma: Zipf frequency}`` from the bundled frequency list."""
+    return {lemma: float(zipf) for lemma, zipf in (line.split("\t", 1) for line in _read_lines("frequency_nl.txt"))}
+
+
+@lru_cache(maxsize=None)
+def _stopwords():
+    return frozenset(_read_lines("stopwords_nl.txt"))
+
+
+@lru_cache(maxsize=None)
+def _irregular_lemmas():
+    return dict(line.split("\t", 1) for line in _read_lines("lemmas_nl.tsv"))
+
+
+@lru_cache(maxsize=None)
+def _idioms():
+    """``(expression, lemmas)`` for every idiom in the list."""
+    return tuple((line, tuple(word if word in _PRONOUN_SLOTS else lemmatize(word) for word in line.split()))
+                 for line in _read_lines("idioms_nl.txt"))
+
+
+def tokenize(text):
+    """Split ``text`` into ``(token, sentence_start, sentence_index)`` tuples."""
+    tokens = []
+    sentence = 0
+    previous_end = 0
+    for match in _TOKEN_RE.finditer(text):
+        sentence_start = not tokens or bool(_SENTENCE_BREAK_RE.search(text, previous_end, match.start()))
+        if sentence_start and tokens:
+            sentence += 1
+        tokens.append((match.group(), sentence_start, sentence))
+        previous_end = match.end()
+    return tokens
+
+
+def _undouble(stem):
+    # katt(en) -> kat, dikk(e) -> dik
+    if len(stem) > 2 and stem[-1] == stem[-2] and stem[-1] not in _VOWELS:
+        return stem[:-1]
+    return stem
+
+
+def _devoice(stem):
+    # huiz(en) -> huis, briev(en) -> brief
+    return stem[:-1] + {"z": "s", "v": "f"}.get(stem[-1:], stem[-1:])
+
+
+def _voice(stem):
+    # reis -> reizen, leef -> leven
+    return stem[:-1] + {"s": "z", "f": "v"}.get(stem[-1:], stem[-1:])
+
+
+def _lengthen(stem):
+    # bom(en) -> boom, grot(e) -> groot: an open syllable is written with one vowel
+    if len(stem) >= 3 and stem[-1] not in _VOWELS and stem[-2] in "aeou" and stem[-3] not in _VOWELS:
+        return stem[:-2] + stem[-2] * 2 + stem[-1]
+    return stem
+
+
+def _shorten(stem):
+    # woon -> wonen, maak -> maken
+    if len(stem) >= 3 and stem[-1] not in _VOWELS and stem[-2] == stem[-3] and stem[-2] in "aeou":
+        return stem[:-2] + stem[-1]
+    return stem
+
+
+def _base_forms(stem):
+    """Singular noun or uninflected adjective for the stem of a plural or ``-e`` form."""
+    yield stem
+    yield _undouble(stem)
+    yield _devoice(stem)
+    yield _lengthen(_devoice(stem))
+
+
+def _infinitives(stem):
+    """Possible infinitives for a verb stem: werk -> werken, woon -> wonen, zet -> zetten.
+
+    The most frequent come first, as the spelling does not show whether a
+    vowel is short: bestel -> bestellen, not bestelen.
+    """
+    if not stem:
+        return []
+    frequencies = _frequencies()
+    infinitives = dict.fromkeys((stem + "en", _shorten(_voice(stem)) + "en", stem + stem[-1] + "en", stem + "n"))
+    return sorted(infinitives, key=lambda infinitive: -frequencies.get(infinitive, 0))
+
+
+def _lemma_candidates(word):
+    # Nouns and adjectives
+    if word.endswith("'s"):
+        yield word[:-2]
+    if word.endswith("eren"):
+        yield word[:-4]
+    if word.endswith("en"):
+        yield from _base_forms(word[:-2])
+    if word.endswith(("s", "n")):
+        yield word[:-1]
+    if word.endswith("e"):
+        yield from _base_forms(word[:-1])
+    for suffix in ("ste", "er"):
+        if word.endswith(suffix):
+            yield from _base_forms(word[:-len(suffix)])
+    for suffix in ("etje", "tje", "pje", "kje", "je"):
+        if word.endswith(suffix):
+            yield _undouble(word[:-len(suffix)])
+
+    # Verbs: past participles (also of separable verbs: opgebeld -> opbellen)
+    for position in (match.start() for match in re.finditer("ge", word)):
+        prefix, participle = word[:position], word[position + 2:]
+        if participle.endswith(("t", "d")):
+            yield from (prefix + infinitive for infinitive in _infinitives(participle[:-1]))
+        elif participle.endswith("en"):
+            yield prefix + participle
+    # Past tense, present tense and the bare stem
+    for suffix in ("ten", "den", "te", "de", "t", "d", ""):
+        if word.endswith(suffix):
+            yield from _infinitives(word[:len(word) - len(suffix)])
+
+
+@lru_cache(maxsize=65536)
+def lemmatize(word):
+    """Dictionary form of a Dutch word, or the lowercased word if none is known."""
+    word = word.lower()
+    irregular = _irregular_lemmas().get(word)
+    if irregular is not None:
+        return irregular
+    frequencies = _frequencies()
+    if word in frequencies or word in _stopwords():
+        return word
+    for candidate in _lemma_candidates(word):
+        if candidate in frequencies:
+            return candidate
+    return word
+
+
+_ARTICLES = ("de ", "het ", "een ", "'t ")
+
+
+def lemma_of(text):
+    """Lemma of a Dutch word or expression as shown to learners ("de huizen" -> "huis")."""
+    phrase = " ".join(str(text).casefold().split())
+    for article in _ARTICLES:
+        if phrase.startswith(article):
+            phrase = phrase[len(article):]
+            break
+    return " ".join(lemmatize(word) for word in phrase.split())
+
+
+def content_lemmas(text):
+    """Lemmas of the words in ``text`` that are no stopwords."""
+    stopwords = _stopwords()
+    return {lemma for lemma in (lemmatize(token) for token, _, _ in tokenize(text)) if lemma not in stopwords}
+
+
+def _is_proper_noun(token, sentence_start, names, lowercase):
+    if token.isupper() and len(token) > 1:
+        # Abbreviations and acronyms (NS, KLM)
+        return True
+    if not token[0].isupper() or token.lower() in lowercase:
+        return False
+    if not sentence_start:
+        return True
+    # Capitalized at the start of a sentence: a name if it is capitalized elsewhere
+    # too, or if it is no known word
+    return token.lower() in names or lemmatize(token) not in _frequencies()
+
+
+def _slot(word):
+    return _PRONOUN_SLOTS.get(word, {word})
+
+
+def _idiom_at(idiom, lemmas, start):
+    """Positions of ``idiom``'s words in ``lemmas`` if it occurs from ``start``, allowing small gaps, else ``None``."""
+    if lemmas[start] not in _slot(idiom[0]):
+        return None
+    positions = [start]
+    for word in idiom[1:]:
+        for offset, lemma in enumerate(lemmas[positions[-1] + 1:positions[-1] + _MAX_IDIOM_GAP + 2]):
+            if lemma in _slot(word):
+                positions.append(positions[-1] + offset + 1)
+                break
+        else:
+            return None
+    return positions
+
+
+def _variants(idiom):
+    # Main clauses move the verb forward: "rekening houden met" -> "ik houd rekening met"
+    yield idiom
+    for index in range(1, len(idiom)):
+        yield (idiom[index],) + idiom[:index] + idiom[index + 1:]
+
+
+def _expression_matches(tokens):
+    """``(idiom, token positions)`` for the first occurrence of each idiom per sentence of ``tokens``."""
+    sentences = {}
+    for position, (token, _, sentence) in enumerate(tokens):
+        sentences.setdefault(sentence, []).append((position, lemmatize(token)))
+    matches = []
+    for entries in sentences.values():
+        lemmas = [lemma for _, lemma in entries]
+        present = set(lemmas)
+        for expression, idiom in _idioms():
+            if not all(_slot(word) & present for word in idiom):
+                continue
+            found = next((positions for variant in _variants(idiom) for start in range(len(lemmas))
+                          for positions in [_idiom_at(variant, lemmas, start)] if positions is not None), None)
+            if found is not None:
+                matches.append((expression, [entries[index][0] for index in found]))
+    return matches
+
+
+def find_expressions(tokens):
+    """Idioms from the bundled list in ``tokens`` (from :func:`tokenize`).
+
+    Returns ``{idiom: number of sentences it occurs in}``.
+    """
+    found = {}
+    for expression, _ in _expression_matches(tokens):
+        found[expression] = found.get(expression, 0) + 1
+    return found
+
+
+def _score(entry):
+    # tf-idf: sublinear in the count in the text, times the rarity in Dutch overall
+    zipf = entry["frequency"] if entry["frequency"] is not None else _UNKNOWN_ZIPF
+    return (1 + math.log(entry["count"])) * (_RARITY_BASE - zipf)
+
+
+def extract_candidates(text, max_candidates=DEFAULT_MAX_CANDIDATES):
+    """Rank the vocabulary of ``text`` for the model to explain.
+
+    Returns up to ``max_candidates`` (``None`` for all) entries ``{"nl", "forms", "count",
+    "frequency", "expression"}``: first the expressions found in the idiom
+    list, then the single words by how much they matter in this text, i.e.
+    how often they occur in it and how rare they are in Dutch overall
+    (``frequency`` is the Zipf frequency, ``None`` for words missing from the
+    list, which count as rarer than any word in it). Very common words
+    (:data:`COMMON_ZIPF`) are left out, and so are words that only occur as
+    part of a detected expression. Ties go to the word that occurs first.
+    """
+    tokens = tokenize(text)
+    names = {token.lower() for token, sentence_start, _ in tokens if token[0].isupper() and not sentence_start}
+    lowercase = {token for token, _, _ in tokens if token.islower()}
+    stopwords = _stopwords()
+    frequencies = _frequencies()
+
+    matches = _expression_matches(tokens)
+    in_expressions = {position for _, positions in matches for position in positions}
+    expressions = {}
+    for expression, _ in matches:
+        entry = expressions.setdefault(expression, {"nl": expression, "forms": [], "count": 0, "frequency": None,
+                                                    "expression": True})
+        entry["count"] += 1
+
+    words = {}
+    for position, (token, sentence_start, _) in enumerate(tokens):
+        if len(token) < 2 or position in in_expressions or _is_proper_noun(token, sentence_start, names, lowercase):
+            continue
+        form = token.lower()
+        lemma = lemmatize(form)
+        if form in stopwords or lemma in stopwords or frequencies.get(lemma, 0) >= COMMON_ZIPF:
+            continue
+        entry = words.setdefault(lemma, {"nl": lemma, "forms": [], "count": 0, "frequency": frequencies.get(lemma),
+                                         "expression": False, "_first": position})
+        entry["count"] += 1
+        if form != lemma and form not in entry["forms"]:
+            entry["forms"].append(form)
+
+    ranked = sorted(words.values(), key=lambda entry: (-_score(entry), entry["_first"]))
+    for entry in ranked:
+        del entry["_first"]
+    return (sorted(expressions.values(), key=lambda entry: -entry["count"]) + ranked)[:max_candidates]
@@ -0,0 +1,154 @@
+"""Long-text pipeline: split, extract concurrently and merge.
+
+Long articles are split on paragraph and sentence boundaries into chunks that
+fit a token budget. Every chunk is sent to the model on its own, in a bounded
+thread pool, so the wall-clock time follows the slowest chunk instead of the
+whole document. The per-chunk results are merged back into a single result
+with the same shape as a normal extraction.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .core import CEFR_LEVELS, normalize_level
+from .metrics import run_in_context
+
+DEFAULT_CHUNK_TOKENS = 1200
+DEFAULT_MAX_WORKERS = 4
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token for Dutch text)."""
+    return (len(text) + 3) // 4
+
+
+def _split_oversized(text, max_tokens):
+    """Split a single paragraph into sentence-aligned pieces within the budget."""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        if estimate_tokens(sentence) > max_tokens:
+            # A single run-on sentence: fall back to word boundaries
+            words = sentence.split()
+            for word in words:
+                candidate = f"{current} {word}".strip()
+                if current and estimate_tokens(candidate) > max_tokens:
+                    pieces.append(current)
+                    current = word
+                else:
+                    current = candidate
+            continue
+        candidate = f"{current} {sentence}".strip()
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text(text, max_tokens=DEFAULT_CHUNK_TOKENS):
+    """Split ``text`` into chunks of at most ``max_tokens`` estimated tokens.
+
+    Paragraphs are kept together where possible; paragraphs that are too long
+    on their own are split on sentence boundaries.
+    """
+    chunks = []
+    current = ""
+    for paragraph in _PARAGRAPH_RE.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_oversized(paragraph, max_tokens))
+            continue
+        candidate = f"{current}\n\n{paragraph}" if current else paragraph
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def run_chunks(chunks, extract_fn, max_workers=DEFAULT_MAX_WORKERS):
+    """Run ``extract_fn`` on every chunk concurrently.
+
+    Yields ``(index, result, error)`` tuples in completion order so callers can
+    report progress from the calling thread. Workers run in a copy of the
+    caller's context, so their timings land in the caller's trace.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_in_context(extract_fn), chunk): index for index, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                yield index, None, e
+
+
+def _level_rank(level):
+    clean_level = normalize_level(level)
+    return CEFR_LEVELS.index(clean_level) if clean_level else len(CEFR_LEVELS)
+
+
+def merge_results(results, max_examples=4):
+    """Merge per-chunk extraction results, given in document order.
+
+    ``rewritten_text`` parts are stitched together in order. Words are
+    deduplicated case-insensitively on their Dutch form; for duplicates the
+    lowest valid CEFR level is kept and the examples are combined up to
+    ``max_examples``.
+    """
+    rewritten_nl = []
+    rewritten_target = []
+    merged = {}
+    for result in results:
+        if not result:
+            continue
+        rewritten = result.get("rewritten_text", {})
+        if rewritten.get("nl"):
+            rewritten_nl.append(rewritten["nl"])
+        if rewritten.get("target"):
+            rewritten_target.append(rewritten["target"])
+
+        for item in result.get("words", []):
+            key = " ".join(str(item.get("nl", "")).split()).casefold()
+            if not key:
+                continue
+            if key not in merged:
+                merged[key] = dict(item)
+                if "examples" in item:
+                    merged[key]["examples"] = list(item["examples"])[:max_examples]
+                continue
+            best = merged[key]
+            if _level_rank(item.get("level")) < _level_rank(best.get("level")):
+                best["level"] = item.get("level")
+            if not best.get("target") and item.get("target"):
+                best["target"] = item["target"]
+            # Word-list-only results (see ``with_examples``) have no examples to combine
+            if "examples" not in item:
+                continue
+            examples = best.setdefault("examples", [])
+            seen = {example.get("nl") for example in examples}
+            for example in item["examples"]:
+                if len(examples) >= max_examples:
+                    break
+                if example.get("nl") not in seen:
+                    examples.append(example)
+                    seen.add(example.get("nl"))
+
+    return {
+        "rewritten_text": {"nl": "\n\n".join(rewritten_nl), "target": "\n\n".join(rewritten_target)},
+        "words": list(merged.values()),
+    }
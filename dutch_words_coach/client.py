@@ -0,0 +1,32 @@
+"""Gemini model client.
+
+``google.generativeai`` is slow to import, so it is only imported when the
+first generation is requested instead of on every app start.
+"""
+import threading
+
+from .core import MODEL_NAME
+
+_configure_lock = threading.Lock()
+
+
+class GeminiModel:
+    """Lazily created ``genai.GenerativeModel`` with the same ``generate_content`` API."""
+
+    def __init__(self, api_key, model_name=MODEL_NAME):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            with _configure_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate_content(self, prompt, **kwargs):
+        return self._load().generate_content(prompt, **kwargs)
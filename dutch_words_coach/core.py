@@ -0,0 +1,36 @@
+"""Settings and helpers shared by both apps."""
+import re
+
+MODEL_NAME = "gemini-1.5-flash-latest"
+
+CEFR_LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+
+# Language code configuration
+LANGUAGE_MAPPING = {
+    "Korean (한국어)": {"code": "kr", "name": "한국어", "full": "Korean"},
+    "English": {"code": "en", "name": "English", "full": "English"},
+}
+
+
+def normalize_level(level):
+    """The first CEFR level in a level string from the model ("B1/B2" -> "B1"), or ``None``."""
+    for token in re.split(r"[^0-9A-Z]+", str(level or "").upper()):
+        if token in CEFR_LEVELS:
+            return token
+    return None
+
+
+def get_cefr_order(level):
+    """CEFR 레벨을 숫자로 변환하여 정렬에 사용"""
+    level_order = {'A1': 1, 'A2': 2, 'B1': 3, 'B2': 4, 'C1': 5, 'C2': 6}
+    clean_level = normalize_level(level) if level else "A1"
+    return level_order.get(clean_level, 0)
+
+
+def keyword_of(item):
+    """Return the dict holding ``nl``/``target``/``level`` for a word entry.
+
+    The coach nests these under ``keyword`` while the extractor keeps them on
+    the entry itself.
+    """
+    return item.get("keyword", item)
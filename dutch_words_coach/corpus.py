@@ -0,0 +1,165 @@
+"""Local corpus of generated example sentences.
+
+Every example sentence the model generates is kept in a SQLite database with
+its translations and the CEFR level it was written for. An inverted index
+maps each lemma to the sentences it occurs in, so the examples for a word or
+expression are found by intersecting the postings of its lemmas, in any
+inflected form: sentences stored for "koffie drinken" also serve "de koffie"
+and "drinken".
+
+:func:`~dutch_words_coach.generation.generate_examples` serves words the
+examples the corpus has and asks the model only for the ones still missing.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+
+from .candidates import content_lemmas, lemma_of
+from .core import CEFR_LEVELS, keyword_of, normalize_level
+
+DEFAULT_CORPUS_PATH = Path.home() / ".cache" / "dutch-words-coach" / "examples.sqlite3"
+# Examples per word, as in the prompts
+DEFAULT_EXAMPLES_PER_WORD = 4
+# Sentences outside this number of words make poor examples
+MIN_SENTENCE_WORDS = 3
+MAX_SENTENCE_WORDS = 25
+
+
+def _index_lemmas(text):
+    # Content lemmas; expressions of stopwords only ("er is") are looked up by all their words
+    return content_lemmas(text) or set(lemma_of(text).split())
+
+
+def _level_rank(level):
+    level = normalize_level(level)
+    return CEFR_LEVELS.index(level) if level else None
+
+
+class ExampleCorpus:
+    """SQLite-backed example sentences with an inverted lemma index."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.getenv("DUTCH_WORDS_COACH_CORPUS", DEFAULT_CORPUS_PATH)
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS sentences (
+                    id INTEGER PRIMARY KEY,
+                    nl TEXT NOT NULL UNIQUE,
+                    headword TEXT NOT NULL,
+                    level INTEGER
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS translations (
+                    sentence INTEGER NOT NULL,
+                    language TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    PRIMARY KEY (sentence, language)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS postings (
+                    lemma TEXT NOT NULL,
+                    sentence INTEGER NOT NULL,
+                    PRIMARY KEY (lemma, sentence)
+                ) WITHOUT ROWID"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sentences_headword ON sentences (headword)")
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+
+    def add(self, word, examples, language, level=None):
+        """Store the ``examples`` generated for ``word`` with their ``language`` translations.
+
+        ``level`` is the CEFR level the sentences were written for. Sentences
+        already in the corpus only get the translation added. Returns the
+        number of new sentences.
+        """
+        headword = lemma_of(word)
+        rank = _level_rank(level)
+        rows = []
+        for example in examples:
+            nl = " ".join(str(example.get("nl") or "").split())
+            target = example.get("target")
+            if not nl or not target:
+                continue
+            lemmas = _index_lemmas(nl)
+            if MIN_SENTENCE_WORDS <= len(nl.split()) <= MAX_SENTENCE_WORDS and lemmas:
+                rows.append((nl, target, lemmas))
+        added = 0
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN")
+            for nl, target, lemmas in rows:
+                cursor = conn.execute("INSERT OR IGNORE INTO sentences (nl, headword, level) VALUES (?, ?, ?)",
+                                      (nl, headword, rank))
+                if cursor.rowcount:
+                    sentence = cursor.lastrowid
+                    conn.executemany("INSERT OR IGNORE INTO postings (lemma, sentence) VALUES (?, ?)",
+                                     [(lemma, sentence) for lemma in lemmas])
+                    added += 1
+                else:
+                    sentence = conn.execute("SELECT id FROM sentences WHERE nl = ?", (nl,)).fetchone()[0]
+                conn.execute("INSERT OR IGNORE INTO translations (sentence, language, target) VALUES (?, ?, ?)",
+                             (sentence, language, target))
+            conn.execute("COMMIT")
+        return added
+
+    def add_words(self, words, language, level=None):
+        """Store the examples of every word entry in ``words`` (a result of either app).
+
+        Sentences are tagged with ``level`` or, without it, with the level of
+        their word.
+        """
+        added = 0
+        for item in words:
+            keyword = keyword_of(item)
+            if item.get("examples") and keyword.get("nl"):
+                added += self.add(keyword["nl"], item["examples"], language, level or keyword.get("level"))
+        return added
+
+    def find(self, word, language, max_level=None, limit=DEFAULT_EXAMPLES_PER_WORD):
+        """Up to ``limit`` stored examples ``{"nl", "target"}`` using ``word``, translated into ``language``.
+
+        A sentence qualifies if it was generated for the word or contains all
+        the word's lemmas; sentences written for a higher level than
+        ``max_level`` are skipped. Sentences generated for the word itself come
+        first, then the most recent ones.
+        """
+        lemmas = sorted(_index_lemmas(word))
+        if not lemmas:
+            return []
+        headword = lemma_of(word)
+        max_rank = _level_rank(max_level)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""SELECT s.nl, t.target FROM sentences s
+                JOIN translations t ON t.sentence = s.id AND t.language = ?
+                WHERE (s.headword = ? OR s.id IN (SELECT sentence FROM postings
+                                                  WHERE lemma IN ({", ".join("?" * len(lemmas))})
+                                                  GROUP BY sentence HAVING COUNT(*) = ?))
+                AND (? IS NULL OR s.level IS NULL OR s.level <= ?)
+                ORDER BY s.headword = ? DESC, s.id DESC LIMIT ?""",
+                (language, headword, *lemmas, len(lemmas), max_rank, max_rank, headword, limit),
+            ).fetchall()
+        return [{"nl": nl, "target": target} for nl, target in rows]
+
+    def lookup(self, words, language, max_level=None, count=DEFAULT_EXAMPLES_PER_WORD):
+        """``{word: examples}`` with up to ``count`` examples for the ``words`` that have any in the corpus."""
+        found = {}
+        for word in words:
+            examples = self.find(word, language, max_level, count)
+            if examples:
+                found[word] = examples
+        return found
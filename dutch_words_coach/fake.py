@@ -0,0 +1,178 @@
+"""Local stand-in for ``genai.GenerativeModel``.
+
+:class:`FakeGenerativeModel` answers every prompt with synthetic JSON that
+follows the response schema of the request, so the pipelines, the batch CLI,
+the benchmarks and the apps can run without network access or an API key.
+
+Latency is modelled as a time to first token plus a generation speed in
+tokens per second; streamed responses are delivered in small chunks at that
+speed. A fraction of the responses can be slow to start (a latency tail, to
+exercise hedged requests and deadlines) or malformed (to measure what parse
+failures cost).
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from .chunking import estimate_tokens
+from .schemas import SITUATION_SCHEMA
+
+_DUTCH_WORDS = (
+    "bestellen", "de rekening", "alstublieft", "het terras", "koffie", "de afspraak",
+    "boodschappen doen", "de huisarts", "vriendelijk", "op tijd", "het recept", "betalen",
+    "de fiets", "het weer", "gezellig", "afspreken", "de trein", "overstappen",
+    "de buurman", "verhuizen", "solliciteren", "de vergadering", "uitstellen", "aanraden",
+)
+
+# Defects injected into malformed responses
+MALFORMATIONS = ("missing-comma", "trailing-comma", "truncated")
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _usage(prompt_tokens, output_tokens):
+    return SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+                           total_token_count=prompt_tokens + output_tokens)
+
+
+class FakeGenerativeModel:
+    """Offline model with a ``generate_content`` like the Gemini SDK.
+
+    ``latency`` is the time to the first token in seconds and
+    ``tokens_per_second`` the generation speed (``None`` for instant output).
+    Top-level lists get the item count a prompt asks for at its end
+    (``"(5 items)"``) or in ``"Extract 5 ..."``, or ``n_words`` items; examples the number a prompt
+    asks for (``"3 example sentences"``), or ``n_examples``.
+    A ``tail_rate`` fraction of the calls takes ``tail_latency`` seconds to
+    the first token instead of ``latency``.
+    ``responses`` is an optional list of response texts that are replayed in
+    turn instead of synthesised ones. ``malformed_rate`` is the fraction of
+    responses that get one of :data:`MALFORMATIONS`.
+    """
+
+    def __init__(self, model_name="fake-model", latency=0.0, tokens_per_second=None, n_words=20, n_examples=4,
+                 chunk_chars=80, responses=None, malformed_rate=0.0, tail_rate=0.0, tail_latency=0.0, seed=None):
+        self.model_name = model_name
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.n_words = n_words
+        self.n_examples = n_examples
+        self.chunk_chars = chunk_chars
+        self.responses = list(responses or [])
+        self.malformed_rate = malformed_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.calls = 0
+        self.malformed = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Fake model configured by ``FAKE_MODEL_LATENCY``, ``FAKE_MODEL_TPS``, ``FAKE_MODEL_MALFORMED_RATE``,
+        ``FAKE_MODEL_TAIL_RATE`` and ``FAKE_MODEL_TAIL_LATENCY``."""
+        settings = {
+            "latency": os.getenv("FAKE_MODEL_LATENCY"),
+            "tokens_per_second": os.getenv("FAKE_MODEL_TPS"),
+            "malformed_rate": os.getenv("FAKE_MODEL_MALFORMED_RATE"),
+            "tail_rate": os.getenv("FAKE_MODEL_TAIL_RATE"),
+            "tail_latency": os.getenv("FAKE_MODEL_TAIL_LATENCY"),
+        }
+        settings = {name: float(value) for name, value in settings.items() if value}
+        settings.update(kwargs)
+        return cls(**settings)
+
+    @staticmethod
+    def load_recordings(path, kind=None):
+        """Response texts from a batch output file (see :mod:`dutch_words_coach.batch`)."""
+        responses = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "result" in record and kind in (None, record.get("kind")):
+                    responses.append(json.dumps(record["result"], ensure_ascii=False))
+        return responses
+
+    def generate_content(self, prompt, stream=False, generation_config=None, **kwargs):
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+            malformation = None
+            if self.malformed_rate and self._random.random() < self.malformed_rate:
+                malformation = self._random.choice(MALFORMATIONS)
+                self.malformed += 1
+            slow = bool(self.tail_rate) and self._random.random() < self.tail_rate
+        latency = self.tail_latency if slow else self.latency
+
+        if self.responses:
+            text = self.responses[call % len(self.responses)]
+        else:
+            schema = (generation_config or {}).get("response_schema", SITUATION_SCHEMA)
+            seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+            requested = re.search(r"\((\d+) items\)\s*$", prompt) or re.search(r"Extract (\d+) ", prompt)
+            n_items = int(requested.group(1)) if requested else self.n_words
+            requested = re.search(r"(\d+) (?:natural Dutch )?example sentences", prompt)
+            n_examples = int(requested.group(1)) if requested else self.n_examples
+            text = json.dumps(self._synthesize(schema, seed, "root", n_items=n_items, n_examples=n_examples),
+                              ensure_ascii=False)
+        if malformation is not None:
+            text = self._malform(text, malformation)
+
+        usage = _usage(estimate_tokens(prompt), estimate_tokens(text))
+        if stream:
+            return self._stream(text, usage, latency)
+        time.sleep(latency + self._generation_time(text))
+        return FakeResponse(text, usage)
+
+    def _generation_time(self, text):
+        return estimate_tokens(text) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _stream(self, text, usage, latency):
+        time.sleep(latency)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        for index, chunk in enumerate(chunks):
+            time.sleep(self._generation_time(chunk))
+            yield FakeResponse(chunk, usage if index == len(chunks) - 1 else None)
+
+    def _malform(self, text, malformation):
+        if malformation == "missing-comma" and ", " in text:
+            index = text.find(", ", len(text) // 2)
+            index = index if index != -1 else text.find(", ")
+            return text[:index] + text[index + 1:]
+        if malformation == "trailing-comma" and "]" in text:
+            index = text.rfind("]")
+            return text[:index] + "," + text[index:]
+        # Cut the response off, as a response hitting the output token limit would be
+        return text[:max(1, int(len(text) * 0.6))]
+
+    def _synthesize(self, schema, seed, name, context=None, n_items=None, n_examples=None, position=0):
+        schema_type = schema.get("type", "string").lower()
+        if schema_type == "integer":
+            # Numbers refer to the requested items, in order
+            return position + 1
+        if schema_type == "object":
+            # Strings inside examples and rewritten texts become sentences
+            child_context = name if name in ("examples", "rewritten_text") else context
+            # Optional properties are left out, as the prompts ask for them only where needed
+            required = schema.get("required", list(schema.get("properties", {})))
+            return {key: self._synthesize(value, seed, key, child_context, n_items if name == "root" else None,
+                                          n_examples, position)
+                    for key, value in schema.get("properties", {}).items() if key in required}
+        if schema_type == "array":
+            count = (n_examples or self.n_examples) if name == "examples" else n_items or self.n_words
+            return [self._synthesize(schema["items"], seed + i, name, context, n_examples=n_examples, position=i)
+                    for i in range(count)]
+        if "enum" in schema:
+            return schema["enum"][seed % len(schema["enum"])]
+        word = _DUTCH_WORDS[seed % len(_DUTCH_WORDS)]
+        text = f"Dit is een voorbeeldzin met {word}." if context else word
+        return text if name == "nl" else f"{text} ({name})"
@@ -0,0 +1,513 @@
+"""Shared request layer around the model call.
+
+:class:`RequestGateway` wraps a model and keeps its ``generate_content`` API.
+Every call goes through:
+
+- admission: at most ``max_concurrency`` calls run at once; callers beyond
+  that wait in FIFO order and are told their queue position;
+- rate limiting: token buckets for requests and tokens per minute;
+- retries: retryable errors (quota, overload, timeouts) are retried with
+  jittered exponential backoff;
+- single flight: concurrent calls with the same prompt and options share one
+  upstream call, streamed or not;
+- hedging: a call without any output after the observed p95 of the time to
+  first output gets a duplicate request, and whichever answers first is
+  used;
+- deadlines: a caller passing ``deadline`` gets what has arrived by then and
+  :class:`RequestDeadlineExceeded`.
+
+Queue waits, upstream outcomes, retries, hedges and coalesced calls are
+recorded in :mod:`dutch_words_coach.metrics`.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from .chunking import estimate_tokens
+from .metrics import inc, observe, run_in_context, span
+
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "ConnectionError", "TimeoutError",
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Free-tier limits of the Gemini API
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+# Calls without output after this quantile of the recent times to first output are hedged
+DEFAULT_HEDGE_QUANTILE = 0.95
+# Recent calls the quantile is taken over, and the number needed before hedging starts
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class RequestDeadlineExceeded(Exception):
+    """The caller's deadline passed before the model finished its response.
+
+    Not retried: the deadline is the caller's own. Streamed output that
+    arrived before it has already been handed to the caller.
+    """
+
+
+def is_retryable(error):
+    """Whether ``error`` is a transient API error worth retrying."""
+    if any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Token bucket refilled at ``per_minute`` tokens per minute.
+
+    The balance may go negative when more is consumed than was reserved (e.g.
+    output tokens that are only known afterwards); later callers then wait
+    until the debt is paid back.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Block until ``amount`` tokens are available and take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def try_acquire(self, amount=1):
+        """Take ``amount`` tokens if they are available now; returns whether it did."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return True
+            return False
+
+    def consume(self, amount):
+        """Take ``amount`` tokens without waiting."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+    def set_rate(self, per_minute):
+        """Refill at ``per_minute`` tokens per minute from now on, with that as the new capacity."""
+        with self._lock:
+            self._refill()
+            self.rate = per_minute / 60.0
+            self.capacity = per_minute
+            self._tokens = min(self._tokens, self.capacity)
+
+
+class LatencyTracker:
+    """Recent latencies per key, for quantiles over a sliding window."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, key, q, min_samples=MIN_LATENCY_SAMPLES):
+        """The ``q`` quantile of the recent latencies for ``key``, or ``None`` with fewer than ``min_samples``."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class _Expired(Exception):
+    """A caller's deadline passed while waiting for a flight."""
+
+
+class _Response:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class _Flight:
+    """One upstream call whose output is shared by every caller with the same key."""
+
+    def __init__(self):
+        self.chunks = []
+        self.usage_metadata = None
+        self.error = None
+        self.done = False
+        # Callers still waiting for the output; when all gave up, the upstream call is dropped
+        self.waiters = 1
+        self.abandoned = False
+        self.cond = threading.Condition()
+
+    def add(self, text):
+        with self.cond:
+            self.chunks.append(text)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def iter_chunks(self, deadline_at=None):
+        """Yield the output as it arrives; past ``deadline_at`` (``time.monotonic()``), raise :class:`_Expired`."""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.chunks) and not self.done:
+                    timeout = None if deadline_at is None else deadline_at - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        raise _Expired
+                    self.cond.wait(timeout)
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield chunk
+
+
+class _Race:
+    """The attempts at one upstream call: the first to produce output feeds the flight, the others are dropped."""
+
+    def __init__(self):
+        self.started = 0
+        self.running = 0
+        self.winner = None
+        self.finished = False
+        self.error = None
+        self.usage_metadata = None
+        self.cond = threading.Condition()
+
+    def claim(self, attempt):
+        """Make ``attempt`` the winner unless another one already is; returns whether it is."""
+        with self.cond:
+            if self.winner is None:
+                self.winner = attempt
+                self.cond.notify_all()
+            return self.winner == attempt
+
+    def end(self, attempt, error=None, usage_metadata=None):
+        with self.cond:
+            self.running -= 1
+            if self.winner is None and error is None:
+                # Finished without any output
+                self.winner = attempt
+            if self.winner == attempt:
+                self.error = error
+                self.usage_metadata = usage_metadata
+                self.finished = True
+            elif self.winner is None:
+                self.error = self.error or error
+                # Every attempt failed before producing output
+                self.finished = self.running == 0
+            self.cond.notify_all()
+
+
+class RequestGateway:
+    """Rate-limited, retrying, coalescing wrapper with the ``generate_content`` API."""
+
+    def __init__(self, model, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_concurrency=4,
+                 max_retries=4, base_delay=1.0, max_delay=30.0, expected_output_tokens=3000,
+                 hedge_quantile=DEFAULT_HEDGE_QUANTILE, min_latency_samples=MIN_LATENCY_SAMPLES, share=1):
+        self.model = model
+        self.model_name = getattr(model, "model_name", None)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expected_output_tokens = expected_output_tokens
+        self.hedge_quantile = hedge_quantile
+        self.min_latency_samples = min_latency_samples
+        # Time to first output of the upstream calls, streamed and not
+        self.latency = LatencyTracker()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.share = share
+        self.request_bucket = TokenBucket(requests_per_minute * share)
+        self.token_bucket = TokenBucket(tokens_per_minute * share)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._active = 0
+        self._queue = deque()
+        self._admission = threading.Condition()
+
+    @classmethod
+    def from_env(cls, model, share=1, **kwargs):
+        """Gateway configured by ``GEMINI_RPM``, ``GEMINI_TPM``, ``GEMINI_MAX_CONCURRENCY`` and hedging settings.
+
+        With ``share`` below 1 the gateway gets only that part of the rate
+        limits, for one of several processes using the same API key.
+        ``GEMINI_HEDGE_QUANTILE`` sets the hedging quantile; 0 turns hedging off.
+        """
+        settings = {
+            "requests_per_minute": os.getenv("GEMINI_RPM"),
+            "tokens_per_minute": os.getenv("GEMINI_TPM"),
+            "max_concurrency": os.getenv("GEMINI_MAX_CONCURRENCY"),
+        }
+        settings = {name: int(value) for name, value in settings.items() if value}
+        if os.getenv("GEMINI_HEDGE_QUANTILE"):
+            settings["hedge_quantile"] = float(os.getenv("GEMINI_HEDGE_QUANTILE"))
+        settings.update(kwargs)
+        return cls(model, share=share, **settings)
+
+    def set_share(self, share):
+        """Use only ``share`` of the rate limits from now on, e.g. when other processes start using the key."""
+        if share == self.share:
+            return
+        self.share = share
+        self.request_bucket.set_rate(self.requests_per_minute * share)
+        self.token_bucket.set_rate(self.tokens_per_minute * share)
+
+    @property
+    def queue_length(self):
+        with self._admission:
+            return len(self._queue)
+
+    def generate_content(self, prompt, stream=False, on_queue=None, deadline=None, **kwargs):
+        """Same as ``GenerativeModel.generate_content``.
+
+        ``on_queue(position)`` is called from the calling thread while the
+        request waits for a free slot (position 1 is next), and with 0 once
+        it starts. ``deadline`` is the number of seconds the response may
+        take once it started; after that :class:`RequestDeadlineExceeded` is
+        raised, for streams after the chunks that did arrive.
+        """
+        flight, leader = self._join_flight(prompt, stream, kwargs)
+        if leader:
+            try:
+                with span("queue"):
+                    self._acquire_slot(on_queue)
+            except BaseException as e:
+                self._land(prompt, stream, kwargs, flight, e)
+                raise
+            thread = threading.Thread(target=run_in_context(self._pump), args=(prompt, stream, kwargs, flight),
+                                      daemon=True)
+            thread.start()
+        else:
+            inc("coalesced_requests_total")
+
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        chunks = self._iter_chunks(prompt, stream, kwargs, flight, deadline_at, deadline)
+        # Only the leader reports token usage, so a shared upstream call is counted once
+        if stream:
+            return self._iter_responses(flight, chunks, leader)
+        text = "".join(chunks)
+        return _Response(text, flight.usage_metadata if leader else None)
+
+    @staticmethod
+    def _iter_responses(flight, chunks, leader):
+        for text in chunks:
+            yield _Response(text)
+        if leader and flight.usage_metadata is not None:
+            yield _Response("", flight.usage_metadata)
+
+    def _iter_chunks(self, prompt, stream, kwargs, flight, deadline_at, deadline):
+        try:
+            yield from flight.iter_chunks(deadline_at)
+        except _Expired:
+            inc("deadline_exceeded_total", model=self.model_name, stream=stream)
+            self._leave(prompt, stream, kwargs, flight)
+            raise RequestDeadlineExceeded(f"Het model heeft niet binnen {deadline:g} seconden geantwoord") from None
+
+    def _key(self, prompt, stream, kwargs):
+        payload = json.dumps([prompt, stream, kwargs], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _join_flight(self, prompt, stream, kwargs):
+        key = self._key(prompt, stream, kwargs)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _leave(self, prompt, stream, kwargs, flight):
+        """A caller stops waiting for ``flight``; without callers left, its output is no longer wanted."""
+        key = self._key(prompt, stream, kwargs)
+        with self._flights_lock:
+            flight.waiters -= 1
+            if flight.waiters == 0:
+                flight.abandoned = True
+                # New callers get a fresh call instead of the rest of this one
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def _land(self, prompt, stream, kwargs, flight, error=None):
+        key = self._key(prompt, stream, kwargs)
+        with self._flights_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+    def _acquire_slot(self, on_queue):
+        ticket = object()
+        waited = False
+        last_position = None
+        with self._admission:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._admission:
+                    if self._queue[0] is ticket and self._active < self.max_concurrency:
+                        self._queue.popleft()
+                        self._active += 1
+                        self._admission.notify_all()
+                        break
+                    position = self._queue.index(ticket) + 1
+                    if position == last_position:
+                        self._admission.wait(timeout=1.0)
+                        continue
+                if on_queue is not None:
+                    on_queue(position)
+                waited = True
+                last_position = position
+        except BaseException:
+            with self._admission:
+                self._queue.remove(ticket)
+                self._admission.notify_all()
+            raise
+        if waited and on_queue is not None:
+            on_queue(0)
+
+    def _release_slot(self):
+        with self._admission:
+            self._active -= 1
+            self._admission.notify_all()
+
+    def _pump(self, prompt, stream, kwargs, flight):
+        error = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.request_bucket.acquire()
+                self.token_bucket.acquire(estimate_tokens(prompt) + self.expected_output_tokens)
+                try:
+                    self._call(prompt, stream, kwargs, flight)
+                    inc("model_requests_total", outcome="ok")
+                    break
+                except Exception as e:
+                    # Output already handed to callers cannot be taken back
+                    if flight.chunks or flight.abandoned or attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    inc("model_retries_total", error=type(e).__name__)
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+            inc("model_requests_total", outcome="error")
+        finally:
+            self._release_slot()
+            self._land(prompt, stream, kwargs, flight, error)
+
+    def hedge_delay(self, stream):
+        """Seconds without output after which a call is hedged, or ``None`` (off, or too few calls seen)."""
+        if not self.hedge_quantile:
+            return None
+        return self.latency.quantile(stream, self.hedge_quantile, self.min_latency_samples)
+
+    def _call(self, prompt, stream, kwargs, flight):
+        race = _Race()
+        self._start_attempt(prompt, stream, kwargs, flight, race)
+        hedged = False
+        delay = self.hedge_delay(stream)
+        if delay is not None:
+            with race.cond:
+                race.cond.wait_for(lambda: race.winner is not None or race.finished, timeout=delay)
+                slow = race.winner is None and not race.finished
+            # A hedge must not wait for the rate limits: it is only sent if the budget allows it right now
+            if slow and self.request_bucket.try_acquire():
+                self.token_bucket.consume(estimate_tokens(prompt) + self.expected_output_tokens)
+                self._start_attempt(prompt, stream, kwargs, flight, race)
+                hedged = True
+        with race.cond:
+            race.cond.wait_for(lambda: race.finished)
+        if hedged:
+            winner = {None: "none", 0: "first", 1: "hedge"}[race.winner if race.error is None else None]
+            inc("hedged_requests_total", model=self.model_name, winner=winner)
+        if race.error is not None:
+            raise race.error
+        flight.usage_metadata = race.usage_metadata
+
+        # Settle the token budget with the real usage when the API reports it
+        total = getattr(flight.usage_metadata, "total_token_count", None)
+        if total:
+            reserved = estimate_tokens(prompt) + self.expected_output_tokens
+            self.token_bucket.consume(total - reserved)
+
+    def _start_attempt(self, prompt, stream, kwargs, flight, race):
+        with race.cond:
+            attempt = race.started
+            race.started += 1
+            race.running += 1
+        threading.Thread(target=run_in_context(self._attempt), args=(prompt, stream, kwargs, flight, race, attempt),
+                         daemon=True).start()
+
+    def _attempt(self, prompt, stream, kwargs, flight, race, attempt):
+        start = time.monotonic()
+        usage_metadata = None
+        error = None
+        claimed = False
+        try:
+            for text, usage in self._upstream(prompt, stream, kwargs):
+                usage_metadata = usage or usage_metadata
+                if not text:
+                    continue
+                if not claimed:
+                    if not race.claim(attempt):
+                        # The other attempt answered first
+                        return
+                    claimed = True
+                    seconds = time.monotonic() - start
+                    self.latency.observe(stream, seconds)
+                    observe("model_first_output_seconds", seconds, model=self.model_name, stream=stream)
+                if flight.abandoned:
+                    return
+                flight.add(text)
+        except Exception as e:
+            error = e
+        finally:
+            race.end(attempt, error, usage_metadata)
+
+    def _upstream(self, prompt, stream, kwargs):
+        """``(text, usage_metadata)`` for each chunk of the model's response."""
+        if not stream:
+            response = self.model.generate_content(prompt, **kwargs)
+            yield response.text, getattr(response, "usage_metadata", None)
+            return
+        for chunk in self.model.generate_content(prompt, stream=True, **kwargs):
+            try:
+                text = chunk.text
+            except ValueError:
+                text = ""
+            yield text, getattr(chunk, "usage_metadata", None)
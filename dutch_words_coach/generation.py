@@ -0,0 +1,702 @@
+"""Generation pipelines for both apps, usable without Streamlit.
+
+``model`` is anything with a ``generate_content(prompt, stream=False)`` method
+that behaves like ``genai.GenerativeModel``; ``cache`` is an optional
+:class:`~dutch_words_coach.cache.ResponseCache`.
+
+The Dutch content of a result (words, levels, examples, rewritten text) does
+not depend on the target language. Every result is therefore also cached
+without a language, and a request in another language translates the
+``target`` fields of that copy (:func:`translate_result`) instead of
+generating everything again.
+
+A :class:`~dutch_words_coach.routing.ModelRouter` as ``model`` picks the
+model tier, the numbers of words and examples and the deadline per request.
+"""
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import CacheMiss, make_key, normalize_input
+from .candidates import DEFAULT_MAX_CANDIDATES, extract_candidates, lemma_of
+from .chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_MAX_WORKERS, merge_results, run_chunks, split_text
+from .core import MODEL_NAME, keyword_of, normalize_level
+from .gateway import RequestDeadlineExceeded
+from .levels import assign_level, assign_levels, filter_by_level, is_above, level_candidates
+from .metrics import inc, record_usage, run_in_context, span
+from .parsing import ResponseParseError, extract_json
+from .prompts import (PROMPT_VERSION, build_candidates_prompt, build_examples_prompt, build_levels_prompt,
+                      build_rewrite_prompt, build_situation_prompt, build_translation_prompt, build_vocabulary_prompt)
+from .routing import route_of
+from .schemas import (CANDIDATES_SCHEMA, CANDIDATES_WORDS_SCHEMA, EXAMPLES_SCHEMA, LEVELS_SCHEMA, REWRITE_SCHEMA,
+                      SITUATION_SCHEMA, SITUATION_WORDS_SCHEMA, TRANSLATION_SCHEMA, VOCABULARY_SCHEMA,
+                      VOCABULARY_WORDS_SCHEMA, json_generation_config)
+from .streaming import WordsStreamParser, iter_stream_text
+
+# Word lists known before the request are only generated without their examples (taken from the corpus
+# afterwards) when the corpus has all examples of at least this share of the words
+CORPUS_SPLIT_SHARE = 0.75
+
+
+def model_name_of(model):
+    return getattr(model, "model_name", MODEL_NAME)
+
+
+def _cache_get(cache, kind, cache_key):
+    if cache is None:
+        return None
+    with span("cache", kind=kind):
+        result_json = cache.get(cache_key)
+    inc("cache_requests_total", kind=kind, result="miss" if result_json is None else "hit")
+    return result_json
+
+
+def _tracking_usage(response, usage):
+    """Yield the chunks of a streamed response, keeping the last ``usage_metadata`` in ``usage``."""
+    for chunk in response:
+        usage[0] = getattr(chunk, "usage_metadata", None) or usage[0]
+        yield chunk
+
+
+def generate_text(model, prompt, schema=None, stream=False, on_word=None, on_queue=None, deadline=None):
+    """Call the model and return the response text.
+
+    ``schema`` requests structured JSON output in that shape. With
+    ``stream=True`` every completed entry of the ``words`` array is passed to
+    ``on_word`` while the response is still being generated. ``on_queue`` and
+    ``deadline`` are handed to a :class:`~dutch_words_coach.gateway.RequestGateway`
+    to report the queue position and to stop waiting after ``deadline``
+    seconds. A stream cut off by the deadline raises :class:`ResponseParseError`
+    with the words that did arrive as ``partial``.
+    """
+    kwargs = {"generation_config": json_generation_config(schema)} if schema is not None else {}
+    if on_queue is not None:
+        kwargs["on_queue"] = on_queue
+    if deadline is not None:
+        kwargs["deadline"] = deadline
+    with span("model", model=model_name_of(model), stream=stream):
+        if not stream:
+            response = model.generate_content(prompt, **kwargs)
+            record_usage(getattr(response, "usage_metadata", None), model_name_of(model))
+            return response.text
+
+        parser = WordsStreamParser()
+        usage = [None]
+        words = []
+        response = _tracking_usage(model.generate_content(prompt, stream=True, **kwargs), usage)
+        try:
+            for chunk_text in iter_stream_text(response):
+                for item in parser.feed(chunk_text):
+                    words.append(item)
+                    if on_word is not None:
+                        on_word(item)
+        except RequestDeadlineExceeded as e:
+            if not words:
+                raise
+            raise ResponseParseError(str(e), parser.text, {"words": words}) from e
+        record_usage(usage[0], model_name_of(model))
+        return parser.text
+
+
+def _word_key(word):
+    return " ".join(str(word).split()).casefold()
+
+
+def _match_items(texts, items):
+    """Pair each requested Dutch text with its entry in a response, by the entry's ``index``.
+
+    The prompts number the texts from 1. Entries with a missing, unknown or
+    repeated number are dropped rather than guessed at; their texts are left
+    out of the result, so they are requested again. Returns ``{text: entry}``.
+    """
+    paired = {}
+    for item in items:
+        index = item.get("index")
+        if isinstance(index, bool) or not isinstance(index, int) or not 1 <= index <= len(texts):
+            continue
+        paired.setdefault(texts[index - 1], item)
+    return paired
+
+
+def _translatable_entries(node):
+    """Every ``{"nl": ..., "target": ...}`` entry in a result, at any depth."""
+    if isinstance(node, dict):
+        if isinstance(node.get("nl"), str) and "target" in node:
+            yield node
+        for value in node.values():
+            yield from _translatable_entries(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _translatable_entries(value)
+
+
+def _fetch_translations(model, texts, lang_full):
+    with span("prompt", kind="translation"):
+        prompt = build_translation_prompt(texts, lang_full)
+    result_text = generate_text(model, prompt, TRANSLATION_SCHEMA)
+    with span("parse", kind="translation"):
+        items = extract_json(result_text).get("translations", [])
+    return {text: item["target"] for text, item in _match_items(texts, items).items() if item.get("target")}
+
+
+def translate_result(model, result_json, lang_full, cache=None, batch_size=100, max_workers=DEFAULT_MAX_WORKERS):
+    """Return a copy of ``result_json`` with every ``target`` field in ``lang_full``.
+
+    The Dutch texts are translated in batches of ``batch_size`` per request;
+    the translations of all texts are cached as one entry, so translating
+    the same result again costs nothing and takes a single cache slot.
+    Texts missing from a response are requested once more. Raises
+    :class:`ValueError` if a text still got no translation.
+    """
+    result_json = copy.deepcopy(result_json)
+    entries = list(_translatable_entries(result_json))
+    texts = list(dict.fromkeys(entry["nl"] for entry in entries))
+    cache_key = make_key("translation", "\n".join(sorted(normalize_input(text) for text in texts)), lang_full, None,
+                         model_name_of(model), PROMPT_VERSION)
+    translations = _cache_get(cache, "translation", cache_key) or {}
+    missing = [text for text in texts if text not in translations]
+    fetched = bool(missing)
+
+    for _ in range(2):
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        for _, batch_translations, error in run_chunks(batches,
+                                                       lambda batch: _fetch_translations(model, batch, lang_full),
+                                                       max_workers):
+            if error is not None:
+                raise error
+            translations.update(batch_translations)
+        missing = [text for text in missing if text not in translations]
+
+    untranslated = [entry["nl"] for entry in entries if entry["nl"] not in translations]
+    if untranslated:
+        raise ValueError(f"{len(untranslated)} text(s) were not translated, e.g. {untranslated[0]!r}")
+    if cache is not None and fetched:
+        cache.set(cache_key, translations)
+    for entry in entries:
+        entry["target"] = translations[entry["nl"]]
+    return result_json
+
+
+def _translate_base(model, kind, base, lang_full, cache):
+    """Translate a cached result from another language; ``None`` if that fails."""
+    try:
+        return translate_result(model, base, lang_full, cache)
+    except CacheMiss:
+        raise
+    except Exception as e:
+        # Translating is only a shortcut; the caller generates the result instead
+        inc("translation_fallbacks_total", kind=kind, error=type(e).__name__)
+        return None
+
+
+def _lookup(model, kind, text, lang_full, lang_level, cache):
+    """Cached result for these inputs, translated from another target language if needed.
+
+    Returns ``(result_json, store)``; ``result_json`` is ``None`` on a miss and
+    ``store(result_json)`` caches a newly generated result.
+    """
+    cache_key = make_key(kind, text, lang_full, lang_level, model_name_of(model), PROMPT_VERSION)
+    # The same result without a language: the Dutch content, in whichever language it was first made
+    base_key = make_key(kind, text, None, lang_level, model_name_of(model), PROMPT_VERSION)
+
+    def store(result_json):
+        if cache is not None:
+            cache.set(cache_key, result_json)
+            if base is None:
+                cache.set(base_key, result_json)
+
+    base = None
+    result_json = _cache_get(cache, kind, cache_key)
+    if result_json is None and cache is not None:
+        base = _cache_get(cache, f"{kind}-base", base_key)
+        if base is not None:
+            result_json = _translate_base(model, kind, base, lang_full, cache)
+            if result_json is not None:
+                cache.set(cache_key, result_json)
+    return result_json, store
+
+
+def _route_key(route):
+    """Cache key text for the numbers of words and examples a routed prompt asks for."""
+    return "" if route.is_default else f"\nroute: {route.n_words} words, {route.n_examples} examples"
+
+
+def _generate_stage(route, kind, text, lang_full, lang_level, cache, build_prompt, schema, stream=False,
+                    on_word=None, on_queue=None):
+    """Cached generation of one JSON response on ``route``; ``build_prompt()`` is only called on a cache miss."""
+    result_json, store = _lookup(route.model, kind, text + _route_key(route), lang_full, lang_level, cache)
+    if result_json is not None:
+        return result_json
+
+    with span("prompt", kind=kind):
+        prompt = build_prompt()
+    result_text = generate_text(route.model, prompt, schema, stream, on_word, on_queue, route.deadline)
+    with span("parse", kind=kind):
+        result_json = extract_json(result_text)
+    store(result_json)
+    return result_json
+
+
+def generate_levels(model, words, cache=None):
+    """CEFR levels of Dutch ``words`` the lexicon does not know, from one request: ``{word: level}``.
+
+    The levels of a word list are cached together, whatever the target
+    language, once every word got one. Words the response has no valid level
+    for are left out.
+    """
+    words = sorted(dict.fromkeys(words))
+    words_text = "\n".join(words)
+    route = route_of(model, "levels", words_text)
+    cache_key = make_key("levels", words_text + _route_key(route), None, None, model_name_of(route.model),
+                         PROMPT_VERSION)
+    levels = _cache_get(cache, "levels", cache_key)
+    if levels is not None:
+        return levels
+    with span("prompt", kind="levels"):
+        prompt = build_levels_prompt(words)
+    result_text = generate_text(route.model, prompt, LEVELS_SCHEMA, deadline=route.deadline)
+    with span("parse", kind="levels"):
+        items = extract_json(result_text).get("levels", [])
+    levels = {word: normalize_level(item.get("level")) for word, item in _match_items(words, items).items()
+              if normalize_level(item.get("level"))}
+    if cache is not None and len(levels) == len(words):
+        cache.set(cache_key, levels)
+    return levels
+
+
+def _with_levels(result_json, max_level=None, model=None, cache=None):
+    """``result_json`` with lexicon levels on its words, without the words above ``max_level``.
+
+    With a ``model``, the levels of words the lexicon does not know are
+    asked for in one request (:func:`generate_levels`); if that fails, those
+    words stay without a level.
+    """
+    words = assign_levels(result_json.get("words", []))
+    unknown = [keyword_of(item).get("nl") for item in words if not keyword_of(item).get("level")]
+    unknown = [word for word in unknown if word]
+    if model is not None and unknown:
+        try:
+            levels = generate_levels(model, unknown, cache)
+        except CacheMiss:
+            raise
+        except Exception as e:
+            inc("level_fallbacks_total", error=type(e).__name__)
+            levels = {}
+        for item in words:
+            keyword = keyword_of(item)
+            if keyword.get("nl") in levels:
+                keyword["level"] = levels[keyword["nl"]]
+    return dict(result_json, words=filter_by_level(words, max_level))
+
+
+def _exclusion_key(exclude):
+    """Cache key text for the known words left out of a prompt."""
+    return "\nexclude: " + ", ".join(sorted(_word_key(word) for word in exclude)) if exclude else ""
+
+
+def _without_known(result_json, learner):
+    """``result_json`` without the words the learner knows; the prompt asked for that, but models slip."""
+    if learner is None:
+        return result_json
+    known = learner.known_lemmas()
+    return dict(result_json, words=[item for item in result_json.get("words", [])
+                                    if lemma_of(keyword_of(item).get("nl", "")) not in known])
+
+
+def _add_to_corpus(corpus, result_json, lang_full, level=None):
+    """Keep the examples of a result in the example ``corpus``; returns ``result_json``."""
+    if corpus is not None:
+        corpus.add_words(result_json.get("words", []), lang_full, level)
+    return result_json
+
+
+def _covered_by_corpus(corpus, words, lang_full, n_examples):
+    """Whether the ``corpus`` has all ``n_examples`` examples for at least :data:`CORPUS_SPLIT_SHARE` of ``words``."""
+    if corpus is None or not words:
+        return False
+    with span("corpus"):
+        found = corpus.lookup(words, lang_full, None, n_examples)
+    complete = sum(len(found.get(word, [])) >= n_examples for word in words)
+    return complete >= CORPUS_SPLIT_SHARE * len(words)
+
+
+def _with_examples(model, result_json, context, lang_full, lang_level, cache, learner, corpus):
+    """A word list with its examples from :func:`generate_examples`: the ``corpus`` first, then the model.
+
+    Words whose examples could not be fetched are left without them, so the
+    apps offer to load them later; the list is then raised as the partial
+    result of a :class:`ResponseParseError`, so it is not reused as it is.
+    """
+    words = [keyword_of(item).get("nl") for item in result_json.get("words", [])]
+    error = None
+    try:
+        examples = generate_examples(model, [word for word in words if word], context, lang_full, lang_level, cache,
+                                     learner=learner, corpus=corpus)
+    except ResponseParseError as e:
+        if isinstance(e.__cause__, CacheMiss):
+            raise e.__cause__
+        # Some example requests failed or passed their deadline; the others are kept
+        error, examples = e, e.partial or {}
+    except CacheMiss:
+        raise
+    except Exception as e:
+        error, examples = e, {}
+    result_json = dict(result_json, words=[dict(item, examples=examples[word]) if word in examples else item
+                                           for item, word in zip(result_json.get("words", []), words)])
+    if error is not None:
+        inc("example_fallbacks_total", error=type(error.__cause__ or error).__name__)
+        raise ResponseParseError(str(error), "", result_json) from error
+    return result_json
+
+
+def _leveled(on_word, max_level=None):
+    """``on_word`` for streamed entries, which get the same treatment as :func:`_with_levels`."""
+    if on_word is None:
+        return None
+
+    def callback(item):
+        assign_level(item)
+        if not is_above(keyword_of(item).get("level"), max_level):
+            on_word(item)
+
+    return callback
+
+
+def generate_situation_words(model, situation, lang_full, cache=None, stream=False, on_word=None, on_queue=None,
+                             with_examples=True, learner=None, corpus=None):
+    """Return useful words with examples for ``situation`` (context language coach).
+
+    With ``with_examples=False`` only the word list is generated, which is
+    much faster; fetch the examples afterwards with :func:`generate_examples`.
+    Levels come from the CEFR lexicon (:mod:`~dutch_words_coach.levels`);
+    the model is only asked for those of the words it does not know. Words a ``learner``
+    (:class:`~dutch_words_coach.vocabulary.Learner`) already knows are left
+    out. Generated examples are kept in ``corpus``
+    (:class:`~dutch_words_coach.corpus.ExampleCorpus`).
+    """
+    exclude = learner.exclusions() if learner is not None else []
+    kind = "situation" if with_examples else "situation-words"
+    route = route_of(model, "situation", situation)
+    result_json = _generate_stage(route, kind, normalize_input(situation, casefold=True) + _exclusion_key(exclude),
+                                  lang_full, None, cache,
+                                  lambda: build_situation_prompt(situation, lang_full, with_examples, exclude,
+                                                                 route.n_words, route.n_examples),
+                                  SITUATION_SCHEMA if with_examples else SITUATION_WORDS_SCHEMA,
+                                  stream, _leveled(on_word), on_queue)
+    return _add_to_corpus(corpus, _with_levels(_without_known(result_json, learner), model=model, cache=cache),
+                          lang_full)
+
+
+def rewrite_text(model, text, lang_full, lang_level, cache=None, on_queue=None):
+    """Rewrite stage of the text vocab extractor: ``{"rewritten_text": {"nl", "target"}}``.
+
+    Depends on ``lang_level``; the vocabulary stage does not.
+    """
+    return _generate_stage(route_of(model, "rewrite", text, lang_level), "rewrite", normalize_input(text), lang_full,
+                           lang_level, cache, lambda: build_rewrite_prompt(text, lang_full, lang_level), REWRITE_SCHEMA,
+                           on_queue=on_queue)
+
+
+def extract_words(model, text, lang_full, cache=None, stream=False, on_word=None, on_queue=None,
+                  with_examples=True, use_candidates=False, max_level=None, learner=None, corpus=None):
+    """Vocabulary stage of the text vocab extractor: ``{"words": [...]}``.
+
+    With ``use_candidates=True`` the words are selected locally
+    (:func:`~dutch_words_coach.candidates.extract_candidates`) and the model
+    only gets that list, not the text; it is only asked for the levels the
+    CEFR lexicon does not know. Texts without candidates fall back to sending
+    the text. Words above ``max_level`` are left out, with candidates before
+    anything is generated for them.
+
+    The words a ``learner`` knows are left out too. With candidates, words
+    the learner was shown before come from the learner's vocabulary instead
+    of the model. As the candidates are known before the request, the model
+    is only asked for their translations when the example ``corpus`` has
+    the examples of most of them; the examples then come from
+    :func:`generate_examples`, in the context of the whole text.
+    """
+    on_word = _leveled(on_word, max_level)
+    if use_candidates:
+        known = learner.known_lemmas() if learner is not None else set()
+        with span("candidates"):
+            candidates = [candidate for candidate in extract_candidates(text, None)
+                          if lemma_of(candidate["nl"]) not in known]
+            candidates = level_candidates(candidates, max_level)[:DEFAULT_MAX_CANDIDATES]
+        if candidates:
+            stored = _stored_entries(learner, candidates, lang_full, with_examples)
+            words = [dict(stored[candidate["nl"]]) for candidate in candidates if candidate["nl"] in stored]
+            if stream and on_word is not None:
+                for item in words:
+                    on_word(item)
+            remaining = [candidate for candidate in candidates if candidate["nl"] not in stored]
+            if remaining:
+                # Texts with the same candidates share the cached response
+                words_text = "\n".join(candidate["nl"] for candidate in remaining)
+                route = route_of(model, "candidates", words_text)
+                from_corpus = with_examples and _covered_by_corpus(corpus, [candidate["nl"] for candidate in remaining],
+                                                                   lang_full, route.n_examples)
+                in_response = with_examples and not from_corpus
+                result_json = _generate_stage(route, "candidates" if in_response else "candidates-words", words_text,
+                                              lang_full, None, cache,
+                                              lambda: build_candidates_prompt(remaining, lang_full, in_response,
+                                                                              route.n_examples),
+                                              CANDIDATES_SCHEMA if in_response else CANDIDATES_WORDS_SCHEMA,
+                                              stream, on_word, on_queue)
+                if from_corpus:
+                    try:
+                        result_json = _with_examples(model, result_json, text, lang_full, None, cache, learner,
+                                                     corpus)
+                    except ResponseParseError as e:
+                        e.partial = _with_levels({"words": words + e.partial.get("words", [])}, max_level)
+                        raise
+                words += result_json.get("words", [])
+            return _with_levels({"words": words}, max_level)
+
+    exclude = learner.exclusions() if learner is not None else []
+    kind = "vocabulary" if with_examples else "vocabulary-words"
+    route = route_of(model, "vocabulary", text)
+    result_json = _generate_stage(route, kind, normalize_input(text) + _exclusion_key(exclude), lang_full, None, cache,
+                                  lambda: build_vocabulary_prompt(text, lang_full, with_examples, exclude,
+                                                                  route.n_words, route.n_examples),
+                                  VOCABULARY_SCHEMA if with_examples else VOCABULARY_WORDS_SCHEMA,
+                                  stream, on_word, on_queue)
+    return _with_levels(_without_known(result_json, learner), max_level, model, cache)
+
+
+def _stored_entries(learner, candidates, lang_full, with_examples):
+    """Entries from the learner's vocabulary for the candidates served before: ``{nl: entry}``."""
+    if learner is None:
+        return {}
+    stored = learner.entries([candidate["nl"] for candidate in candidates], lang_full)
+    if with_examples:
+        stored = {word: entry for word, entry in stored.items() if entry.get("examples")}
+    if stored:
+        inc("vocabulary_reused_total", len(stored), kind="words")
+    return stored
+
+
+def _combine(rewrite_json, words_json, max_level=None, learner=None):
+    return {"rewritten_text": rewrite_json.get("rewritten_text", {}),
+            "words": _with_levels(_without_known(words_json, learner), max_level)["words"]}
+
+
+def extract_vocabulary(model, text, lang_full, lang_level, cache=None, stream=False, on_word=None,
+                       on_queue=None, on_chunk=None, chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                       max_workers=DEFAULT_MAX_WORKERS, with_examples=True, use_candidates=False, max_level=None,
+                       learner=None, corpus=None):
+    """Rewrite ``text`` for ``lang_level`` and extract its vocabulary (text vocab extractor).
+
+    The rewrite (:func:`rewrite_text`) and the vocabulary (:func:`extract_words`)
+    are generated concurrently and cached separately, so changing only the
+    level regenerates only the rewrite. Texts longer than ``chunk_tokens`` are
+    split and every stage of every chunk runs concurrently;
+    ``on_chunk(done, total, index, error)`` is called from the calling thread
+    as each of them finishes. ``with_examples`` is the same as for
+    :func:`generate_situation_words`.
+
+    With ``use_candidates`` the vocabulary is selected locally from the whole
+    text, so that stage is a single short request even for long texts; see
+    :func:`extract_words`.
+    ``max_level`` (e.g. the learner's level) leaves out the words above it,
+    and ``learner`` the words the learner knows. Generated examples are kept
+    in ``corpus``; with candidates, examples the corpus already has may be
+    served from it instead.
+    """
+    chunks = split_text(text, chunk_tokens)
+    if len(chunks) <= 1:
+        return _add_to_corpus(corpus, _extract_single(model, text, lang_full, lang_level, cache, stream, on_word,
+                                                      on_queue, with_examples, use_candidates, max_level, learner,
+                                                      corpus),
+                              lang_full)
+
+    results = {}
+    stores = {}
+    # Merged results are cached under the route of the whole text
+    route = route_of(model, "rewrite", text, lang_level)
+    results["rewrite"], stores["rewrite"] = _lookup(route.model, "rewrite", normalize_input(text) + _route_key(route),
+                                                    lang_full, lang_level, cache)
+    stage_chunks = {"rewrite": chunks, "words": chunks}
+    if use_candidates:
+        # One request for the whole text; extract_words caches it
+        stage_chunks["words"] = [text]
+        results["words"], stores["words"] = None, lambda result_json: None
+    else:
+        words_kind = "vocabulary" if with_examples else "vocabulary-words"
+        exclude = learner.exclusions() if learner is not None else []
+        route = route_of(model, "vocabulary", text)
+        results["words"], stores["words"] = _lookup(route.model, words_kind,
+                                                    normalize_input(text) + _exclusion_key(exclude) + _route_key(route),
+                                                    lang_full, None, cache)
+    tasks = [(stage, index, chunk) for stage in ("rewrite", "words") if results[stage] is None
+             for index, chunk in enumerate(stage_chunks[stage])]
+
+    def run_task(task):
+        stage, _, chunk = task
+        if stage == "rewrite":
+            return rewrite_text(model, chunk, lang_full, lang_level, cache)
+        # Merged chunk results are cached for every level, so only candidates are filtered up front
+        return extract_words(model, chunk, lang_full, cache, with_examples=with_examples,
+                             use_candidates=use_candidates, max_level=max_level if use_candidates else None,
+                             learner=learner, corpus=corpus)
+
+    chunk_results = {stage: [None] * len(stage_chunks[stage]) for stage in ("rewrite", "words")}
+    first_errors = {}
+    for done, (task_index, chunk_json, error) in enumerate(run_chunks(tasks, run_task, max_workers), 1):
+        stage, index, _ = tasks[task_index]
+        chunk_results[stage][index] = chunk_json
+        if error is not None:
+            first_errors.setdefault(stage, error)
+        if on_chunk is not None:
+            on_chunk(done, len(tasks), index, error)
+
+    for stage in ("rewrite", "words"):
+        if results[stage] is not None:
+            continue
+        if not any(chunk_results[stage]):
+            results[stage] = {}
+            continue
+        with span("merge", kind=stage):
+            results[stage] = merge_results(chunk_results[stage])
+        if all(chunk_results[stage]):
+            stores[stage](results[stage])
+    result_json = _combine(results["rewrite"], results["words"], max_level, learner)
+    if first_errors:
+        error = next(iter(first_errors.values()))
+        if not result_json["rewritten_text"] and not result_json["words"]:
+            raise error
+        # Chunks that failed or passed their deadline are missing: what did finish is shown, but not reused
+        raise ResponseParseError(str(error), "", result_json) from error
+    return _add_to_corpus(corpus, result_json, lang_full)
+
+
+def _extract_single(model, text, lang_full, lang_level, cache, stream=False, on_word=None, on_queue=None,
+                    with_examples=True, use_candidates=False, max_level=None, learner=None, corpus=None):
+    # The rewrite runs in a worker; the vocabulary stays in the calling thread,
+    # which is the one allowed to call the Streamlit callbacks
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        rewrite_future = executor.submit(run_in_context(rewrite_text), model, text, lang_full, lang_level, cache)
+        try:
+            words_json = extract_words(model, text, lang_full, cache, stream, on_word, on_queue, with_examples,
+                                       use_candidates, max_level, learner, corpus)
+        except ResponseParseError as e:
+            if e.partial is not None and rewrite_future.exception() is None:
+                e.partial.update(rewritten_text=rewrite_future.result().get("rewritten_text", {}))
+            raise
+        except RequestDeadlineExceeded as e:
+            # No words arrived in time, but the rewrite may have
+            if rewrite_future.exception() is not None:
+                raise
+            raise ResponseParseError(str(e), "", {"rewritten_text": rewrite_future.result().get("rewritten_text", {}),
+                                                  "words": []}) from e
+        try:
+            rewrite_json = rewrite_future.result()
+        except RequestDeadlineExceeded as e:
+            # The words are done; they are shown without the rewrite instead of not at all
+            raise ResponseParseError(str(e), "", _combine({}, words_json, max_level, learner)) from e
+    return _combine(rewrite_json, words_json, max_level, learner)
+
+
+def _fetch_examples(route, words, context, lang_full, lang_level, n_examples=None):
+    """One model call for ``n_examples`` (default: the route's) examples of each of ``words``; returns
+    ``{word: examples}``."""
+    with span("prompt", kind="examples"):
+        prompt = build_examples_prompt(words, context, lang_full, lang_level, n_examples or route.n_examples)
+    result_text = generate_text(route.model, prompt, EXAMPLES_SCHEMA, deadline=route.deadline)
+    with span("parse", kind="examples"):
+        items = extract_json(result_text).get("words", [])
+
+    return {word: item["examples"] for word, item in _match_items(words, items).items() if item.get("examples")}
+
+
+def generate_examples(model, words, context, lang_full, lang_level=None, cache=None, batch_size=5,
+                      max_workers=DEFAULT_MAX_WORKERS, learner=None, corpus=None):
+    """Second phase of two-phase generation: example sentences for ``words``.
+
+    ``words`` are Dutch words or phrases from a word list generated with
+    ``with_examples=False`` and ``context`` is the situation or text they come
+    from. Examples are cached per word; examples cached for another target
+    language are translated, and the remaining words are requested in
+    batches of ``batch_size``, run concurrently. Words a ``learner`` was
+    shown before with examples get those again.
+
+    Before the model is asked, words get the examples in the example
+    ``corpus`` (:class:`~dutch_words_coach.corpus.ExampleCorpus`) at or below
+    ``lang_level``; the model is only asked for the number still missing.
+    Newly generated examples are added to it. Returns ``{word: examples}``
+    for the words that got examples. If a request fails or passes its
+    deadline, :class:`ResponseParseError` is raised with the examples the
+    other words did get as ``partial``.
+    """
+    examples = {}
+    if learner is not None:
+        stored = learner.entries(words, lang_full)
+        examples = {word: entry["examples"] for word, entry in stored.items() if entry.get("examples")}
+        if examples:
+            inc("vocabulary_reused_total", len(examples), kind="examples")
+    route = route_of(model, "examples", context, lang_level)
+    base_examples = {}
+    cache_keys = {}
+    base_keys = {}
+    for word in words:
+        if word in examples:
+            continue
+        cache_text = f"{normalize_input(context, casefold=True)}\n{_word_key(word)}{_route_key(route)}"
+        cache_keys[word] = make_key("examples", cache_text, lang_full, lang_level, model_name_of(route.model),
+                                    PROMPT_VERSION)
+        base_keys[word] = make_key("examples", cache_text, None, lang_level, model_name_of(route.model),
+                                   PROMPT_VERSION)
+        cached = _cache_get(cache, "examples", cache_keys[word])
+        if cached is not None:
+            examples[word] = cached
+            continue
+        base = _cache_get(cache, "examples-base", base_keys[word])
+        if base is not None:
+            base_examples[word] = base
+
+    if base_examples:
+        translated = _translate_base(model, "examples", base_examples, lang_full, cache) or {}
+        for word, word_examples in translated.items():
+            examples[word] = word_examples
+            cache.set(cache_keys[word], word_examples)
+    missing = [word for word in words if word not in examples]
+    found = {}
+    if corpus is not None and missing:
+        with span("corpus"):
+            found = corpus.lookup(missing, lang_full, lang_level, route.n_examples)
+        complete = [word for word in missing if len(found.get(word, [])) >= route.n_examples]
+        for result, amount in (("hit", len(complete)), ("partial", len(found) - len(complete)),
+                               ("miss", len(missing) - len(found))):
+            if amount:
+                inc("corpus_lookups_total", amount, result=result)
+        examples.update((word, found[word]) for word in complete)
+        missing = [word for word in missing if word not in examples]
+
+    # Each request asks for the same number of examples for all its words
+    needed = {word: route.n_examples - len(found.get(word, [])) for word in missing}
+    batches = []
+    for count in sorted(set(needed.values()), reverse=True):
+        group = [word for word in missing if needed[word] == count]
+        batches += [(count, group[i:i + batch_size]) for i in range(0, len(group), batch_size)]
+
+    def fetch(batch):
+        count, batch_words = batch
+        return _fetch_examples(route, batch_words, context, lang_full, lang_level, count)
+
+    first_error = None
+    for index, batch_examples, error in run_chunks(batches, fetch, max_workers):
+        if error is not None:
+            first_error = first_error or error
+            continue
+        for word, new_examples in batch_examples.items():
+            word_examples = examples[word] = found.get(word, []) + new_examples[:needed[word]]
+            if corpus is not None:
+                corpus.add(word, new_examples, lang_full, lang_level)
+            if cache is not None:
+                cache.set(cache_keys[word], word_examples)
+                if word not in base_examples:
+                    cache.set(base_keys[word], word_examples)
+
+    # Words whose request failed keep the examples the corpus had
+    examples.update((word, found[word]) for word in missing if word not in examples and word in found)
+    if first_error is not None:
+        raise ResponseParseError(str(first_error), "", examples) from first_error
+    return examples
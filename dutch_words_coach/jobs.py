@@ -0,0 +1,719 @@
+"""Background generation jobs.
+
+The apps do not call the model from the Streamlit script thread. They submit
+a job to a queue in a local SQLite database and poll it for progress: the
+queue position, streamed words, chunk progress and finally the result or
+error. Worker processes claim queued jobs one at a time and run the
+generation pipelines of :mod:`~dutch_words_coach.generation`.
+
+- The number of workers is the concurrency limit for generation.
+- A job keeps running when the browser is closed or reloaded; the apps keep
+  its id in the URL (``?job=...``) and pick it up again.
+- Workers can run apart from the UI, on the same machine::
+
+      python -m dutch_words_coach.jobs --workers 4
+
+  Every app process also starts ``DUTCH_WORDS_COACH_WORKERS`` workers of its
+  own (default 2; 0 to rely on separately started workers only), for at most
+  ``DUTCH_WORDS_COACH_MAX_KEYS`` API keys at once (default 4).
+- The workers of one API key register in the queue and split its rate limits
+  evenly among all of them, in whichever process they run.
+- A job identical to one of the same API key that is still queued or running
+  (e.g. the same situation asked for in two sessions) is not run again: both
+  sessions poll the same job.
+
+Jobs are only claimed by workers with the API key they were submitted with,
+and only shown to clients with that key; the key itself is never written to
+the queue.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+
+from .cache import CacheMiss, ResponseCache
+from .client import GeminiModel
+from .corpus import ExampleCorpus
+from .fake import FakeGenerativeModel
+from .gateway import RequestGateway
+from .generation import extract_vocabulary, generate_examples, generate_situation_words
+from .metrics import current_trace, start_export, start_trace
+from .parsing import ResponseParseError
+from .routing import ModelRouter
+from .vocabulary import VocabularyStore
+
+DEFAULT_JOBS_PATH = Path.home() / ".cache" / "dutch-words-coach" / "jobs.sqlite3"
+DEFAULT_WORKERS = 2
+POLL_INTERVAL = 0.1
+# A running job whose worker has not reported for this long is handed to another worker
+DEFAULT_STALE_SECONDS = 60
+HEARTBEAT_SECONDS = 5
+MAX_ATTEMPTS = 3
+# A worker that has not registered for this long no longer counts for the split of the rate limits
+WORKER_STALE_SECONDS = 3 * HEARTBEAT_SECONDS
+# API keys an app process runs workers for at once, and how long unused ones keep theirs
+DEFAULT_MAX_KEYS = 4
+DEFAULT_IDLE_SECONDS = 15 * 60
+# Ports after DUTCH_WORDS_COACH_METRICS_PORT that the worker processes serve their metrics on, one each
+WORKER_METRICS_PORTS = 64
+# Finished jobs (and their results) are kept this long, so a reloaded page still finds them
+DEFAULT_KEEP_SECONDS = 24 * 60 * 60
+
+JOB_KINDS = ("situation", "vocabulary", "examples")
+
+
+class JobNotFound(LookupError):
+    """The job does not exist (any more)."""
+
+
+class JobFailed(RuntimeError):
+    """A job ended with an error that has no counterpart in this process."""
+
+
+def pool_of(api_key):
+    """Queue partition for jobs of one API key: only workers with that key claim them."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _model_name(model_name):
+    # Results of the fake model are cached apart from real ones
+    return f"fake-{model_name}" if os.getenv("DUTCH_WORDS_COACH_FAKE_MODEL") else model_name
+
+
+def build_model(api_key):
+    """The workers' model: a router over one request gateway per model tier.
+
+    ``DUTCH_WORDS_COACH_FAKE_MODEL`` selects the offline stand-in for every
+    tier. The part of the rate limits the gateways use is set by the
+    :class:`Worker` running them.
+    """
+    def make_model(model_name):
+        if os.getenv("DUTCH_WORDS_COACH_FAKE_MODEL"):
+            model = FakeGenerativeModel.from_env(model_name=_model_name(model_name))
+        else:
+            model = GeminiModel(api_key, model_name)
+        return RequestGateway.from_env(model)
+
+    return ModelRouter.from_env(make_model)
+
+
+class _CacheOnlyModel:
+    """Stand-in for a workers' model that has its name but raises :class:`CacheMiss` when called."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        raise CacheMiss(self.model_name)
+
+
+def build_cache_only_model():
+    """A router like :func:`build_model`'s that only serves results from the response cache."""
+    return ModelRouter.from_env(lambda model_name: _CacheOnlyModel(_model_name(model_name)))
+
+
+def open_corpus():
+    """The shared example corpus, or ``None`` with the fake model, whose sentences would be served to learners
+    later."""
+    return None if os.getenv("DUTCH_WORDS_COACH_FAKE_MODEL") else ExampleCorpus()
+
+
+def generate(model, kind, params, cache=None, corpus=None, vocabulary=None, on_word=None, on_queue=None,
+             on_chunk=None):
+    """Run the generation pipeline of a job of ``kind`` with ``params`` and return its result.
+
+    The words of the result are recorded in the learner's vocabulary, if
+    the job has a learner.
+    """
+    learner_id = params.get("learner")
+    learner = vocabulary.learner(learner_id) if learner_id and vocabulary is not None else None
+    if kind == "situation":
+        result = generate_situation_words(model, params["situation"], params["language"], cache=cache,
+                                          stream=params.get("stream", False), on_word=on_word, on_queue=on_queue,
+                                          with_examples=params.get("with_examples", True), learner=learner,
+                                          corpus=corpus)
+    elif kind == "vocabulary":
+        result = extract_vocabulary(model, params["text"], params["language"], params["level"], cache=cache,
+                                    stream=params.get("stream", False), on_word=on_word, on_queue=on_queue,
+                                    on_chunk=on_chunk, with_examples=params.get("with_examples", True),
+                                    use_candidates=params.get("use_candidates", False),
+                                    max_level=params.get("max_level"), learner=learner, corpus=corpus)
+    else:
+        examples = generate_examples(model, params["words"], params["context"], params["language"],
+                                     params.get("level"), cache=cache, learner=learner, corpus=corpus)
+        if learner is not None:
+            learner.record([{"nl": word, "examples": word_examples} for word, word_examples in examples.items()],
+                           params["language"], served=False)
+        return examples
+    if learner is not None:
+        learner.record(result.get("words", []), params["language"])
+    return result
+
+
+def _error_of(error):
+    fields = {"type": type(error).__name__, "message": str(error)}
+    if isinstance(error, ResponseParseError):
+        fields.update(text=error.text, partial=error.partial)
+    return fields
+
+
+def _exception_of(error):
+    """The exception to raise in the app for the ``error`` of a failed job."""
+    if error["type"] == "ResponseParseError":
+        return ResponseParseError(error["message"], error.get("text", ""), error.get("partial"))
+    return JobFailed(error["message"])
+
+
+class JobQueue:
+    """SQLite-backed queue of generation jobs, shared by the apps and the workers."""
+
+    def __init__(self, path=None, stale_seconds=DEFAULT_STALE_SECONDS, keep_seconds=DEFAULT_KEEP_SECONDS):
+        if path is None:
+            path = os.getenv("DUTCH_WORDS_COACH_JOBS", DEFAULT_JOBS_PATH)
+        self.path = Path(path)
+        self.stale_seconds = stale_seconds
+        self.keep_seconds = keep_seconds
+        self._last_cleanup = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    pool TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    meta TEXT,
+                    status TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    heartbeat REAL,
+                    finished REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    trace TEXT,
+                    request TEXT
+                )"""
+            )
+            # Queues created before identical jobs were shared lack the request hash
+            if "request" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN request TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (pool, status, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_request ON jobs (pool, request, status)")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS job_words (
+                    job TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (job, seq)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    pool TEXT NOT NULL,
+                    heartbeat REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def submit(self, pool, kind, params, meta=None):
+        """Queue a job and return its id. ``meta`` is kept for the app, e.g. the inputs of the result.
+
+        If a job of ``pool`` with the same ``kind`` and ``params`` is queued or
+        running, its id is returned instead, so identical requests from
+        different sessions are generated once.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"unknown job kind: {kind}")
+        params_json = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        request = hashlib.sha256(f"{kind}\n{params_json}".encode("utf-8")).hexdigest()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT id FROM jobs WHERE pool = ? AND request = ? AND status IN ('queued', 'running')
+                ORDER BY created LIMIT 1""",
+                (pool, request),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row[0]
+            job_id = uuid.uuid4().hex[:16]
+            conn.execute(
+                """INSERT INTO jobs (id, pool, kind, params, meta, status, created, request)
+                VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)""",
+                (job_id, pool, kind, params_json, json.dumps(meta, ensure_ascii=False), time.time(), request),
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self, pool):
+        """Take the oldest queued job of ``pool``: ``(job_id, attempt, kind, params)``, or ``None``.
+
+        ``attempt`` identifies this run of the job: the reports of a worker
+        whose job was handed to another one are ignored.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Jobs of workers that stopped reporting are run again, a limited number of times,
+            # without the words the lost run had streamed
+            conn.execute(
+                """DELETE FROM job_words WHERE job IN
+                (SELECT id FROM jobs WHERE pool = ? AND status = 'running' AND heartbeat < ?)""",
+                (pool, now - self.stale_seconds),
+            )
+            conn.execute(
+                """UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    error = CASE WHEN attempts >= ? THEN ? END, finished = CASE WHEN attempts >= ? THEN ? END
+                WHERE pool = ? AND status = 'running' AND heartbeat < ?""",
+                (MAX_ATTEMPTS, MAX_ATTEMPTS, json.dumps({"type": "WorkerLost", "message": "worker stopped"}),
+                 MAX_ATTEMPTS, now, pool, now - self.stale_seconds),
+            )
+            row = conn.execute(
+                """UPDATE jobs SET status = 'running', heartbeat = ?, attempts = attempts + 1
+                WHERE id = (SELECT id FROM jobs WHERE pool = ? AND status = 'queued' ORDER BY created LIMIT 1)
+                RETURNING id, attempts, kind, params""",
+                (now, pool),
+            ).fetchone()
+            conn.execute("COMMIT")
+        if row is None:
+            self._cleanup()
+            return None
+        return row[0], row[1], row[2], json.loads(row[3])
+
+    def _cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        with self._connect() as conn:
+            conn.execute("DELETE FROM job_words WHERE job IN (SELECT id FROM jobs WHERE finished < ?)",
+                         (now - self.keep_seconds,))
+            conn.execute("DELETE FROM jobs WHERE finished < ?", (now - self.keep_seconds,))
+            conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - WORKER_STALE_SECONDS,))
+
+    # The reports of a run below only apply while the job is still running as that attempt
+
+    def heartbeat(self, job_id, attempt, progress=None):
+        """Report that the job is still running, optionally with new ``progress``.
+
+        Returns whether the job still belongs to this ``attempt``.
+        """
+        with self._connect() as conn:
+            if progress is None:
+                cursor = conn.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                    (time.time(), job_id, attempt))
+            else:
+                cursor = conn.execute(
+                    "UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+                    (time.time(), json.dumps(progress, ensure_ascii=False), job_id, attempt))
+        return cursor.rowcount > 0
+
+    def add_word(self, job_id, attempt, item):
+        """Publish a streamed word entry of a running job."""
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT INTO job_words (job, seq, value)
+                SELECT ?, (SELECT COUNT(*) FROM job_words WHERE job = ?), ?
+                WHERE EXISTS (SELECT 1 FROM jobs WHERE id = ? AND attempts = ? AND status = 'running')""",
+                (job_id, job_id, json.dumps(item, ensure_ascii=False), job_id, attempt),
+            )
+
+    def finish(self, job_id, attempt, result, trace=None):
+        self._end(job_id, attempt, "done", result=json.dumps(result, ensure_ascii=False), trace=trace)
+
+    def fail(self, job_id, attempt, error, trace=None):
+        self._end(job_id, attempt, "failed", error=json.dumps(_error_of(error), ensure_ascii=False), trace=trace)
+
+    def _end(self, job_id, attempt, status, result=None, error=None, trace=None):
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE jobs SET status = ?, finished = ?, result = ?, error = ?, trace = ?
+                WHERE id = ? AND attempts = ? AND status = 'running'""",
+                (status, time.time(), result, error, json.dumps(trace) if trace is not None else None, job_id,
+                 attempt),
+            )
+
+    def register_worker(self, worker_id, pool):
+        """Report that a worker of ``pool`` is alive; returns the number of live workers of the pool."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (id, pool, heartbeat) VALUES (?, ?, ?)",
+                         (worker_id, pool, now))
+            count, = conn.execute("SELECT COUNT(*) FROM workers WHERE pool = ? AND heartbeat >= ?",
+                                  (pool, now - WORKER_STALE_SECONDS)).fetchone()
+        return count
+
+    def unregister_worker(self, worker_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def pending(self, pool):
+        """Number of queued and running jobs of ``pool``."""
+        with self._connect() as conn:
+            count, = conn.execute("SELECT COUNT(*) FROM jobs WHERE pool = ? AND status IN ('queued', 'running')",
+                                  (pool,)).fetchone()
+        return count
+
+    def get(self, job_id, pool=None):
+        """The job as a dict (``status``, ``position``, ``progress``, ``result``, ``error``, ...).
+
+        With a ``pool``, jobs of other pools are not found either.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT kind, meta, status, progress, result, error, trace, attempts,
+                    (SELECT COUNT(*) FROM jobs AS ahead WHERE ahead.pool = jobs.pool AND ahead.status = 'queued'
+                     AND ahead.created <= jobs.created)
+                FROM jobs WHERE id = ? AND (? IS NULL OR pool = ?)""",
+                (job_id, pool, pool),
+            ).fetchone()
+        if row is None:
+            raise JobNotFound(job_id)
+        kind, meta, status, progress, result, error, trace, attempts, position = row
+        return {
+            "id": job_id, "kind": kind, "status": status, "attempts": attempts,
+            "position": position if status == "queued" else 0,
+            "meta": json.loads(meta) if meta else None,
+            "progress": json.loads(progress) if progress else {},
+            "result": json.loads(result) if result else None,
+            "error": json.loads(error) if error else None,
+            "trace": json.loads(trace) if trace else None,
+        }
+
+    def words(self, job_id, after=0, pool=None):
+        """Streamed word entries of the job from number ``after`` on; none for jobs of other pools than ``pool``."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT value FROM job_words JOIN jobs ON jobs.id = job_words.job
+                WHERE job = ? AND seq >= ? AND (? IS NULL OR jobs.pool = ?) ORDER BY seq""",
+                (job_id, after, pool, pool),
+            ).fetchall()
+        return [json.loads(value) for value, in rows]
+
+    def result(self, job_id, pool=None):
+        """The result of the job, or ``None`` while it is queued or running.
+
+        Does not wait: the apps check once per script run and show the
+        progress of :meth:`get` and :meth:`words` in between. A failed job
+        raises its error again (:class:`ResponseParseError` with the partial
+        result, or :class:`JobFailed`). The job's measurements are added to
+        the current trace. ``pool`` is as for :meth:`get`.
+        """
+        job = self.get(job_id, pool)
+        if job["status"] not in ("done", "failed"):
+            return None
+        trace = current_trace()
+        if trace is not None and job["trace"]:
+            trace.merge(job["trace"])
+        if job["status"] == "failed":
+            raise _exception_of(job["error"])
+        return job["result"]
+
+    def wait(self, job_id, poll_interval=POLL_INTERVAL, pool=None):
+        """Poll the job until it ends and return its result, for scripts; the apps use :meth:`result`."""
+        while True:
+            result = self.result(job_id, pool)
+            if result is not None:
+                return result
+            time.sleep(poll_interval)
+
+
+class JobClient:
+    """Submits jobs for one API key and polls them; see :class:`JobQueue`.
+
+    Jobs of other API keys raise :class:`JobNotFound`, even with their id.
+
+    With ``workers`` (:class:`WorkerSets`) every use makes sure workers for
+    the key are running. With the workers' ``cache``, ``corpus`` and
+    ``vocabulary``, :meth:`cached` serves cached results without a job.
+    """
+
+    def __init__(self, queue, api_key, workers=None, cache=None, corpus=None, vocabulary=None):
+        self.queue = queue
+        self.pool = pool_of(api_key)
+        self.cache = cache
+        self.corpus = corpus
+        self.vocabulary = vocabulary
+        self._api_key = api_key
+        self._workers = workers
+        self._cache_model = build_cache_only_model() if cache is not None else None
+
+    def _use(self):
+        if self._workers is not None:
+            self._workers.ensure(self._api_key)
+
+    def cached(self, kind, params):
+        """The result of a job with ``kind`` and ``params`` if the response cache has it, else ``None``.
+
+        Runs the job's pipeline in this process, without a model: a cached
+        result is there in milliseconds, instead of after a trip through the
+        queue and the polling of the apps. Anything not cached is left to a
+        job.
+        """
+        if self.cache is None:
+            return None
+        try:
+            return generate(self._cache_model, kind, params, self.cache, self.corpus, self.vocabulary)
+        except Exception:
+            # A miss, or an error the job will report
+            return None
+
+    def submit(self, kind, params, meta=None):
+        self._use()
+        return self.queue.submit(self.pool, kind, params, meta)
+
+    def get(self, job_id):
+        self._use()
+        return self.queue.get(job_id, self.pool)
+
+    def words(self, job_id, after=0):
+        return self.queue.words(job_id, after, self.pool)
+
+    def result(self, job_id):
+        return self.queue.result(job_id, self.pool)
+
+    def wait(self, job_id):
+        return self.queue.wait(job_id, pool=self.pool)
+
+    def run(self, kind, params):
+        """Submit a job and wait for its result."""
+        return self.wait(self.submit(kind, params))
+
+
+class Worker:
+    """Runs the jobs of one pool, one at a time, in the calling thread."""
+
+    def __init__(self, queue, model, pool, cache=None, corpus=None, vocabulary=None):
+        self.queue = queue
+        self.model = model
+        self.pool = pool
+        self.cache = cache
+        self.corpus = corpus
+        self.vocabulary = vocabulary
+
+    def run(self, should_stop=lambda: False, poll_interval=POLL_INTERVAL):
+        """Claim and run jobs until ``should_stop()`` returns true.
+
+        While it runs, the worker is registered in the queue and uses an even
+        part of the rate limits of all live workers of its pool.
+        """
+        worker_id = uuid.uuid4().hex[:16]
+        stopped = threading.Event()
+
+        def register():
+            while True:
+                count = self.queue.register_worker(worker_id, self.pool)
+                if hasattr(self.model, "set_share"):
+                    self.model.set_share(1 / max(1, count))
+                if stopped.wait(HEARTBEAT_SECONDS):
+                    return
+
+        self.queue.register_worker(worker_id, self.pool)
+        threading.Thread(target=register, daemon=True).start()
+        try:
+            while not should_stop():
+                claimed = self.queue.claim(self.pool)
+                if claimed is None:
+                    time.sleep(poll_interval)
+                    continue
+                self.run_job(*claimed)
+        finally:
+            stopped.set()
+            self.queue.unregister_worker(worker_id)
+
+    def run_job(self, job_id, attempt, kind, params):
+        trace = start_trace()
+        progress = {}
+        lock = threading.Lock()
+        stopped = threading.Event()
+
+        def report(**changes):
+            with lock:
+                progress.update(changes)
+                self.queue.heartbeat(job_id, attempt, progress)
+
+        def beat():
+            # Stops once the job was handed to another worker; this run's reports are ignored from then on
+            while not stopped.wait(HEARTBEAT_SECONDS):
+                if not self.queue.heartbeat(job_id, attempt):
+                    return
+
+        def on_chunk(done, total, index, error):
+            report(chunks=progress.get("chunks", []) + [[done, total, index, str(error) if error else None]])
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            result = generate(self.model, kind, params, self.cache, self.corpus, self.vocabulary,
+                              lambda item: self.queue.add_word(job_id, attempt, item),
+                              lambda position: report(queue=position), on_chunk)
+        except Exception as e:
+            self.queue.fail(job_id, attempt, e, trace.to_dict())
+        else:
+            self.queue.finish(job_id, attempt, result, trace.to_dict())
+        finally:
+            stopped.set()
+
+
+def _run_worker(api_key, metrics_path=None):
+    # The model, cache and parse measurements are only made here: every worker exports its own, after the
+    # app process's port
+    port = os.getenv("DUTCH_WORDS_COACH_METRICS_PORT")
+    start_export(metrics_file=metrics_path or "", metrics_port=int(port) + 1 if port else "",
+                 ports=WORKER_METRICS_PORTS)
+    worker = Worker(JobQueue(), build_model(api_key), pool_of(api_key), ResponseCache(), open_corpus(),
+                    VocabularyStore())
+    parent = os.getppid()
+    try:
+        # A worker stops with the process that started it
+        worker.run(should_stop=lambda: os.getppid() != parent)
+    except KeyboardInterrupt:
+        pass
+
+
+def start_workers(api_key, count=None):
+    """Start ``count`` workers (``DUTCH_WORDS_COACH_WORKERS``, default 2) for ``api_key``.
+
+    The workers run in a separate ``python -m dutch_words_coach.jobs``
+    process, share the rate limits of the API key with all its other workers
+    and stop when this process exits. Returns the process, or ``None``
+    without workers.
+    """
+    if count is None:
+        count = int(os.getenv("DUTCH_WORDS_COACH_WORKERS") or DEFAULT_WORKERS)
+    if count <= 0:
+        return None
+    # Not multiprocessing: Streamlit replaces __main__ with the app script, which
+    # spawned children would run again
+    env = dict(os.environ, GEMINI_API_KEY=api_key,
+               PYTHONPATH=os.pathsep.join(filter(None, [str(Path(__file__).resolve().parent.parent),
+                                                        os.getenv("PYTHONPATH")])))
+    return subprocess.Popen([sys.executable, "-m", "dutch_words_coach.jobs", "--workers", str(count),
+                             "--with-parent"], env=env)
+
+
+class WorkerSets:
+    """The worker processes this process started, one set per API key.
+
+    Workers run for at most ``max_keys`` keys (``DUTCH_WORDS_COACH_MAX_KEYS``,
+    default 4): a set for one more key stops the set used least recently.
+    Sets unused for ``idle_seconds`` without queued or running jobs are
+    stopped too. A stopped set starts again on the next use of its key.
+    """
+
+    def __init__(self, queue, count=None, max_keys=None, idle_seconds=DEFAULT_IDLE_SECONDS):
+        if max_keys is None:
+            max_keys = int(os.getenv("DUTCH_WORDS_COACH_MAX_KEYS") or DEFAULT_MAX_KEYS)
+        self.queue = queue
+        self.count = count
+        self.max_keys = max(1, max_keys)
+        self.idle_seconds = idle_seconds
+        # pool -> [process, last use], least recently used first
+        self._sets = {}
+        self._stopping = []
+        self._lock = threading.Lock()
+
+    def ensure(self, api_key):
+        """Start the workers for ``api_key`` unless they run; call on every use of the key."""
+        pool = pool_of(api_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sets.pop(pool, None)
+            if entry is not None and entry[0].poll() is not None:
+                entry = None
+            if entry is None:
+                while len(self._sets) >= self.max_keys:
+                    self._stop(next(iter(self._sets)))
+                process = start_workers(api_key, self.count)
+                if process is None:
+                    return
+                entry = [process, now]
+            entry[1] = now
+            self._sets[pool] = entry
+            self._reap(now)
+
+    def _reap(self, now):
+        for pool, (process, last_used) in list(self._sets.items()):
+            if process.poll() is not None:
+                del self._sets[pool]
+            elif now - last_used > self.idle_seconds and not self.queue.pending(pool):
+                self._stop(pool)
+        # Wait for stopped processes without blocking, so they do not linger as zombies
+        self._stopping = [process for process in self._stopping if process.poll() is None]
+
+    def _stop(self, pool):
+        process, _ = self._sets.pop(pool)
+        process.terminate()
+        self._stopping.append(process)
+
+    def stop_all(self):
+        with self._lock:
+            for pool in list(self._sets):
+                self._stop(pool)
+            for process in self._stopping:
+                process.wait()
+            self._stopping = []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dutch_words_coach.jobs",
+                                     description="Run generation workers for the apps' job queue.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"worker processes (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model instead of Gemini")
+    parser.add_argument("--metrics", default=os.getenv("DUTCH_WORDS_COACH_METRICS_FILE"),
+                        help="write Prometheus metrics to this file (one file per worker, suffixed with the "
+                             "API key's pool and the worker's number)")
+    parser.add_argument("--with-parent", action="store_true", help="stop when the parent process exits")
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        parser.error("GEMINI_API_KEY is not set; workers only run the jobs of the apps using the same key")
+    if args.fake:
+        os.environ["DUTCH_WORDS_COACH_FAKE_MODEL"] = "1"
+    # Exit normally on SIGTERM, so the worker processes are stopped too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    context = multiprocessing.get_context("spawn")
+    # Workers of different API keys may share the metrics file setting
+    metrics_prefix = args.metrics and f"{args.metrics}.{pool_of(api_key)}"
+    processes = [context.Process(target=_run_worker, args=(api_key,),
+                                 kwargs={"metrics_path": metrics_prefix and f"{metrics_prefix}.{index}"}, daemon=True)
+                 for index in range(args.workers)]
+    for process in processes:
+        process.start()
+    parent = os.getppid()
+    if not args.with_parent:
+        print(f"{args.workers} worker(s) running; stop with Ctrl+C", file=sys.stderr)
+    try:
+        while any(process.is_alive() for process in processes):
+            if args.with_parent and os.getppid() != parent:
+                break
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""CEFR levels from a bundled lexicon of Dutch lemmas and expressions.
+
+Levels returned by the model are inconsistent ("B1/B2", "b1 (intermediate)"
+or none at all) and cost output tokens for every word. Words found in the
+lexicon get its level, whatever the model said; the model is only asked for
+the words the lexicon does not know, and its level is normalized. With the
+levels known locally, sorting and filtering by level need no model call.
+
+The lexicon (``data/cefr_nl.tsv``) is compiled by hand for common everyday
+words and is not an official CEFR list.
+"""
+import bisect
+from functools import lru_cache
+
+from .candidates import DATA_DIR, lemma_of
+from .core import CEFR_LEVELS, keyword_of, normalize_level
+
+
+class CefrLexicon:
+    """Read-only lemma -> CEFR level lookup.
+
+    The lemmas are kept in one sorted tuple and searched with :mod:`bisect`;
+    the levels are one byte each. Apart from the strings themselves this
+    takes about a third of the memory of a dict.
+    """
+
+    def __init__(self, entries):
+        pairs = sorted(entries)
+        self._lemmas = tuple(lemma for lemma, _ in pairs)
+        self._levels = bytes(CEFR_LEVELS.index(level) for _, level in pairs)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a ``lemma<TAB>level`` file; lines starting with ``#`` are comments."""
+        with open(path, encoding="utf-8") as f:
+            lines = [line.rstrip("\n") for line in f]
+        return cls(line.split("\t", 1) for line in lines if line.strip() and not line.startswith("#"))
+
+    def __len__(self):
+        return len(self._lemmas)
+
+    def get(self, lemma):
+        """Level of ``lemma`` as given (lowercase, dictionary form), or ``None``."""
+        index = bisect.bisect_left(self._lemmas, lemma)
+        if index < len(self._lemmas) and self._lemmas[index] == lemma:
+            return CEFR_LEVELS[self._levels[index]]
+        return None
+
+    def level_of(self, text):
+        """Level of a Dutch word or expression in any form ("de fietsen", "gekocht"), or ``None``."""
+        phrase = " ".join(str(text).casefold().split())
+        return self.get(phrase) or self.get(lemma_of(phrase))
+
+
+# Loaded on first use and shared by all sessions
+@lru_cache(maxsize=None)
+def lexicon():
+    return CefrLexicon.from_file(DATA_DIR / "cefr_nl.tsv")
+
+
+def assign_level(item):
+    """Set the level of a word entry from the lexicon, or normalize the model's level.
+
+    Entries whose level is unknown to both lose their ``level`` field.
+    Returns ``item``.
+    """
+    keyword = keyword_of(item)
+    level = lexicon().level_of(keyword.get("nl", "")) or normalize_level(keyword.get("level"))
+    if level:
+        keyword["level"] = level
+    else:
+        keyword.pop("level", None)
+    return item
+
+
+def assign_levels(words):
+    for item in words:
+        assign_level(item)
+    return words
+
+
+def is_above(level, max_level):
+    """Whether ``level`` is higher than ``max_level``; unknown levels never are."""
+    level = normalize_level(level)
+    return bool(level and max_level) and CEFR_LEVELS.index(level) > CEFR_LEVELS.index(max_level)
+
+
+def filter_by_level(words, max_level):
+    """The word entries at or below ``max_level`` (all of them if it is ``None``)."""
+    return [item for item in words if not is_above(keyword_of(item).get("level"), max_level)]
+
+
+def level_candidates(candidates, max_level=None):
+    """Add the lexicon level to candidates (``None`` if unknown) and drop those above ``max_level``."""
+    for candidate in candidates:
+        candidate["level"] = lexicon().level_of(candidate["nl"])
+    return [candidate for candidate in candidates if not is_above(candidate["level"], max_level)]
@@ -0,0 +1,351 @@
+"""Timings, token usage and counters for the generation pipelines.
+
+Every stage of a request (prompt building, cache lookup, queueing, the model
+call, JSON extraction, rendering) is timed with :func:`span`. Measurements go
+to three places:
+
+- the process-wide :data:`REGISTRY`, exported in the Prometheus text format
+  to a file and/or a small HTTP endpoint (see :func:`start_export`);
+- structured logs: one JSON object per event on the ``dutch_words_coach``
+  logger;
+- the current :class:`Trace`, if one was started with :func:`start_trace`,
+  which the apps show in their debug panel.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger("dutch_words_coach")
+
+PREFIX = "dutch_words_coach_"
+# Upper bounds in seconds, from a cache hit to a long streamed generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DESCRIPTIONS = {
+    "stage_seconds": "Time spent per pipeline stage.",
+    "model_tokens_total": "Tokens reported by the model, by kind (prompt or output).",
+    "model_requests_total": "Upstream model calls by outcome.",
+    "model_retries_total": "Upstream model calls retried after a transient error.",
+    "coalesced_requests_total": "Requests served by an identical request already in flight.",
+    "cache_requests_total": "Response cache lookups by result (hit or miss).",
+    "parse_results_total": "Responses that needed repair, were partially recovered or failed to parse.",
+    "translation_fallbacks_total": "Cached results that could not be translated and were generated instead.",
+    "corpus_lookups_total": "Words with all (hit), some (partial) or none (miss) of their examples in the example corpus.",
+    "example_fallbacks_total": "Word lists shown without (some of) their examples because they could not be fetched.",
+    "vocabulary_reused_total": "Words or examples served from a learner's vocabulary instead of generated.",
+    "model_first_output_seconds": "Time from an upstream model call to its first output.",
+    "hedged_requests_total": "Slow model calls that got a duplicate request, by the attempt that answered first.",
+    "deadline_exceeded_total": "Model calls whose caller's deadline passed before the response was complete.",
+    "model_routes_total": "Routing decisions by request kind and model tier.",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Registry:
+    """Thread-safe counters and histograms with a Prometheus text rendering."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[name, _label_key(labels)] += amount
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def value(self, name, **labels):
+        """Current value of a counter (0 if it was never incremented)."""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"])))
+                                for key, value in self._histograms.items())
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, label_key), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{_format_labels(label_key)} {value:g}")
+        for (name, label_key), histogram in histograms:
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(label_key, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(label_key, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(label_key)} {histogram['sum']:g}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(label_key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _buckets_from_env():
+    """Histogram bounds from ``DUTCH_WORDS_COACH_METRICS_BUCKETS`` (seconds, comma-separated), or the defaults."""
+    value = os.getenv("DUTCH_WORDS_COACH_METRICS_BUCKETS")
+    return tuple(sorted(float(bound) for bound in value.split(","))) if value else DEFAULT_BUCKETS
+
+
+REGISTRY = Registry(_buckets_from_env())
+
+
+class Trace:
+    """Measurements of one request (one Streamlit script run in the apps)."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self.tokens = defaultdict(int)
+        self.events = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, seconds, labels):
+        with self._lock:
+            self.spans.append({"stage": stage, "ms": seconds * 1000, **labels})
+
+    def add_tokens(self, kind, count):
+        with self._lock:
+            self.tokens[kind] += count
+
+    def add_event(self, name):
+        with self._lock:
+            self.events[name] += 1
+
+    def to_dict(self):
+        """JSON-serialisable copy of the measurements, e.g. to send them to another process."""
+        with self._lock:
+            return {"spans": list(self.spans), "tokens": dict(self.tokens), "events": dict(self.events)}
+
+    def merge(self, data):
+        """Add measurements from :meth:`to_dict` (e.g. of a background job) to this trace."""
+        with self._lock:
+            self.spans.extend(data.get("spans", []))
+            for kind, count in data.get("tokens", {}).items():
+                self.tokens[kind] += count
+            for name, count in data.get("events", {}).items():
+                self.events[name] += count
+
+    def stage_totals(self):
+        """Total milliseconds per stage, in the order the stages first ran."""
+        totals = {}
+        with self._lock:
+            for span_record in self.spans:
+                totals[span_record["stage"]] = totals.get(span_record["stage"], 0.0) + span_record["ms"]
+        return totals
+
+
+_current_trace = contextvars.ContextVar("dutch_words_coach_trace", default=None)
+
+
+def start_trace():
+    """Start a new trace for the current context and return it.
+
+    Threads started through :func:`run_in_context` (chunk workers, the
+    gateway's upstream call) record into the trace of the thread that
+    started them.
+    """
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def run_in_context(fn):
+    """Wrap ``fn`` so it runs with a copy of the caller's context (and trace)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def log_event(event, **fields):
+    trace = current_trace()
+    if trace is not None:
+        fields["trace"] = trace.id
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False, default=str))
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter and count it as an event of the current trace."""
+    REGISTRY.inc(name, amount, **labels)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_event(name + _format_labels(_label_key(labels)))
+    log_event(name, amount=amount, **labels)
+
+
+def observe(name, value, **labels):
+    """Add ``value`` to a histogram; unlike :func:`span` it is not part of the current trace."""
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time the block as ``stage``; the elapsed seconds end up in ``.seconds``."""
+    record = _SpanRecord()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record.seconds = time.perf_counter() - start
+        REGISTRY.observe("stage_seconds", record.seconds, stage=stage, **labels)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span(stage, record.seconds, labels)
+        log_event("span", stage=stage, ms=round(record.seconds * 1000, 2), error=error, **labels)
+
+
+class _SpanRecord:
+    seconds = None
+
+
+def record_usage(usage_metadata, model=None):
+    """Count the prompt and output tokens of a ``generate_content`` response."""
+    if usage_metadata is None:
+        return
+    labels = {"model": model} if model else {}
+    trace = current_trace()
+    for kind, attribute in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage_metadata, attribute, None)
+        if count:
+            REGISTRY.inc("model_tokens_total", count, kind=kind, **labels)
+            if trace is not None:
+                trace.add_tokens(kind, count)
+    log_event("usage", prompt_tokens=getattr(usage_metadata, "prompt_token_count", None),
+              output_tokens=getattr(usage_metadata, "candidates_token_count", None), **labels)
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Write the metrics to ``path`` atomically, for a textfile collector or scraper."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(registry.render(), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve ``/metrics`` on ``host:port`` from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _write_periodically(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_textfile(path)
+        except OSError as e:
+            logger.warning("Writing metrics to %s failed: %s", path, e)
+
+
+def start_export(metrics_file=None, metrics_port=None, ports=1):
+    """Set up logging and metrics export from the environment.
+
+    - ``DUTCH_WORDS_COACH_LOG_LEVEL``: log level for the structured logs on stderr
+    - ``DUTCH_WORDS_COACH_METRICS_FILE``: Prometheus text file, rewritten every
+      ``DUTCH_WORDS_COACH_METRICS_INTERVAL`` seconds (default 15)
+    - ``DUTCH_WORDS_COACH_METRICS_PORT``: serve ``/metrics`` on this local port
+
+    ``metrics_file`` and ``metrics_port`` replace the environment's settings
+    (an empty value turns that export off), e.g. for the worker processes,
+    which each need their own; the first free port of the ``ports`` from
+    ``metrics_port`` on is used. Call once per process. Returns the HTTP
+    server, if one was started.
+    """
+    level = os.getenv("DUTCH_WORDS_COACH_LOG_LEVEL")
+    if level and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(level.upper())
+        logger.propagate = False
+
+    path = os.getenv("DUTCH_WORDS_COACH_METRICS_FILE") if metrics_file is None else metrics_file
+    if path:
+        interval = float(os.getenv("DUTCH_WORDS_COACH_METRICS_INTERVAL") or 15)
+        threading.Thread(target=_write_periodically, args=(path, interval), daemon=True).start()
+
+    port = os.getenv("DUTCH_WORDS_COACH_METRICS_PORT") if metrics_port is None else metrics_port
+    if not port:
+        return None
+    error = None
+    for candidate in range(int(port), int(port) + ports):
+        try:
+            server = serve(candidate)
+        except OSError as e:
+            error = e
+            continue
+        log_event("metrics_endpoint", port=candidate, pid=os.getpid())
+        return server
+    # Another app process on this machine already serves the port
+    logger.warning("Metrics endpoint on port %s not started: %s", port, error)
+    return None
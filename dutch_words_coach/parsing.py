@@ -0,0 +1,160 @@
+"""Turning model output into JSON.
+
+Model output is not always valid JSON: the extractor's own template used to
+miss a comma after ``"level"``, and models like to leave trailing commas or
+raw newlines inside strings. Throwing such a response away costs a full
+generation, so :func:`repair_json` fixes these defects in a single pass
+before the document is parsed.
+
+A response cut off by the output token limit is not repaired: closing its
+strings and brackets would turn it into a valid but incomplete document that
+gets cached as a full result. It raises :class:`ResponseParseError` with the
+words that did arrive instead.
+"""
+import json
+
+from .metrics import inc
+
+_LITERAL_CHARS = set("0123456789+-.eE") | set("truefalsn")
+
+
+class ResponseParseError(ValueError):
+    """Raised when a model response does not contain valid JSON.
+
+    ``partial`` holds the word entries that could still be recovered from the
+    response (see :func:`salvage_words`), if any.
+    """
+
+    def __init__(self, message, text, partial=None):
+        super().__init__(message)
+        self.text = text
+        self.partial = partial
+
+
+def _json_text(result_text):
+    """Cut the JSON document out of a response, with or without a code fence."""
+    if "```json" in result_text:
+        json_start = result_text.find("```json") + 7
+        json_end = result_text.find("```", json_start)
+        return result_text[json_start:json_end if json_end != -1 else None].strip()
+    if "{" in result_text:
+        json_start = result_text.find("{")
+        json_end = result_text.rfind("}") + 1
+        return result_text[json_start:json_end if json_end > json_start else None]
+    return result_text
+
+
+def repair_json(json_text):
+    """Fix common defects in model-generated JSON in one pass.
+
+    - inserts missing commas between values (``"level": "B1" "examples": ...``)
+    - drops trailing commas before ``}`` and ``]``
+    - escapes raw newlines, tabs and other control characters inside strings
+
+    Strings, objects and arrays left open by a truncated response stay open,
+    so the result does not parse.
+    """
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    in_literal = False
+    # Last significant token outside strings: "value" (a complete value),
+    # "key" (an object key awaiting ':'), or the punctuation character itself
+    last = None
+
+    for char in json_text:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == '"':
+                in_string = False
+                out.append(char)
+            elif char < " ":
+                out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(char, f"\\u{ord(char):04x}"))
+            else:
+                out.append(char)
+            continue
+
+        if in_literal and char not in _LITERAL_CHARS:
+            in_literal = False
+
+        if char.isspace():
+            out.append(char)
+            continue
+
+        starts_value = char in '"{[' or (char in _LITERAL_CHARS and not in_literal)
+        if starts_value and last in ("value", "key"):
+            # Two values in a row: the comma between them is missing
+            out.append(",")
+            last = ","
+
+        if char == '"':
+            in_string = True
+            # Strings directly inside an object, after '{' or ',', are keys
+            last = "key" if stack and stack[-1] == "}" and last in ("{", ",") else "value"
+            out.append(char)
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            last = char
+            out.append(char)
+        elif char in "}]":
+            if last == ",":
+                _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            last = "value"
+            out.append(char)
+        elif char == ",":
+            if last != ",":
+                out.append(char)
+            last = ","
+        elif char == ":":
+            last = ":"
+            out.append(char)
+        else:
+            if not in_literal:
+                in_literal = True
+                last = "value"
+            out.append(char)
+    return "".join(out)
+
+
+def _drop_trailing_comma(out):
+    for i in range(len(out) - 1, -1, -1):
+        if out[i] == ",":
+            del out[i]
+            return
+        if not out[i].isspace():
+            return
+
+
+def salvage_words(result_text):
+    """Recover the complete entries of the ``words`` array from a broken response."""
+    # Imported here because the stream parser itself repairs entries with repair_json
+    from .streaming import WordsStreamParser
+
+    return WordsStreamParser().feed(result_text)
+
+
+def extract_json(result_text):
+    """Parse the JSON document from a model response, repairing it if needed."""
+    json_text = _json_text(result_text)
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        result_json = json.loads(repair_json(json_text))
+    except json.JSONDecodeError as e:
+        words = salvage_words(result_text)
+        partial = {"words": words} if words else None
+        inc("parse_results_total", result="partial" if partial else "failed")
+        raise ResponseParseError(f"JSON verwerking mislukt: {e}", result_text, partial) from e
+    inc("parse_results_total", result="repaired")
+    return result_json
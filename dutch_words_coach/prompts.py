@@ -0,0 +1,202 @@
+"""Prompt templates for both apps.
+
+Bump ``PROMPT_VERSION`` whenever a template changes so cached responses
+generated from the old wording are not reused. The numbers of words and
+examples asked for (``n_words``, ``n_examples``) come from the request's
+:class:`~dutch_words_coach.routing.Route`; with the defaults the prompts
+are unchanged.
+"""
+
+PROMPT_VERSION = "5"
+
+
+def _exclude_requirement(exclude):
+    if not exclude:
+        return ""
+    return f"- Do NOT include these words, the learner already knows them: {', '.join(exclude)}\n"
+
+
+def build_situation_prompt(situation, lang_full, with_examples=True, exclude=(), n_words=20, n_examples=4):
+    """Prompt for the context language coach: words for a situation.
+
+    Without examples only the word list is asked for; the examples are
+    fetched later with :func:`build_examples_prompt`. ``exclude`` lists Dutch
+    words the learner already knows. Levels come from the CEFR lexicon, or
+    from :func:`build_levels_prompt` for words it does not know.
+    """
+    examples_requirement = f"- along with {n_examples} example sentences for each \n" if with_examples else ""
+    examples_structure = (f', "examples": [{{"nl": "Dutch example", "target": "{lang_full} example"}}] '
+                          f'({n_examples} items)' if with_examples else "")
+    return f"""Could you provide {n_words} useful Dutch words or phrases relevant to the following situation? {situation} 
+Requirements:
+{examples_requirement}{_exclude_requirement(exclude)}- provide {lang_full} translations
+- Provide result in JSON format
+
+JSON structure:
+- words: [{{"keyword": {{"nl": "Dutch keyword", "target": "{lang_full} keyword"}}{examples_structure} }}] ({n_words} items)"""
+
+
+def build_vocabulary_prompt(text, lang_full, with_examples=True, exclude=(), n_words=20, n_examples=4):
+    """Prompt for the text vocab extractor: extract words from the text.
+
+    The word list does not depend on the learner's level, so it is generated
+    and cached apart from the rewrite (:func:`build_rewrite_prompt`).
+    ``exclude`` lists Dutch words the learner already knows.
+    """
+    examples_requirement = f"- Provide {n_examples} example sentences for each expressions\n" if with_examples else ""
+    examples_structure = f""",
+      "examples": [
+        {{
+          "nl": "Natural Dutch example sentence",
+          "target": "{lang_full} translation"
+        }}
+      ]""" if with_examples else ""
+    return f"""Please analyze the following Dutch text and extract the most useful vocabulary for language learners.
+TEXT TO ANALYZE: 
+"{text}"
+
+REQUIREMENTS:
+- Extract {n_words} important and useful Dutch words, phrases, or expressions from the provided text
+{examples_requirement}{_exclude_requirement(exclude)}- Provide {lang_full} translations for all content
+- For Korean translations, use ONLY Korean characters. Do NOT include romanization. -
+
+SELECTION RULES:
+✓ INCLUDE: Common nouns, verbs, adjectives, adverbs useful for language learning
+✓ INCLUDE: Idioms, fixed constructions (verb+noun, adjective+noun, prepositional phrases)
+✓ INCLUDE: Common phrasal verbs and expressions with special meanings
+✓ EXCLUDE: Proper nouns (person names, place names, companies, brands, organizations)
+✓ EXCLUDE: Simple word listings without special meaning
+✓ PRIORITY: Practical vocabulary frequently used in everyday Dutch
+  
+OUTPUT FORMAT:
+provide the result in JSON format with this structure:
+
+{{
+  "words": [
+    {{
+      "nl": "useful Dutch word from text",
+      "target": "{lang_full} translation "{examples_structure}
+    }}
+  ]
+}}"""
+
+
+def _candidate_line(candidate):
+    forms = f" ({', '.join(candidate['forms'])})" if candidate["forms"] else ""
+    unknown_level = " [?]" if candidate.get("level") is None else ""
+    return f"- {candidate['nl']}{forms}{unknown_level}"
+
+
+def build_candidates_prompt(candidates, lang_full, with_examples=True, n_examples=4):
+    """Prompt for the text vocab extractor when the words were pre-selected locally.
+
+    ``candidates`` come from :func:`~dutch_words_coach.candidates.extract_candidates`;
+    the model only explains them, so the text itself is not sent. A CEFR level
+    is only asked for candidates without a ``level`` from the lexicon.
+    """
+    word_lines = "\n".join(_candidate_line(candidate) for candidate in candidates)
+    if any(candidate.get("level") is None for candidate in candidates):
+        level_requirement = "- Indicate the CEFR level ONLY for the words marked with [?]\n"
+        level_structure = ', "level": "CEFR level (A1/A2/B1/B2/C1/C2), only for words marked with [?]"'
+    else:
+        level_requirement = level_structure = ""
+    examples_requirement = (f"- Provide {n_examples} example sentences for each word or expression\n"
+                            if with_examples else "")
+    examples_structure = (f', "examples": [{{"nl": "Dutch example", "target": "{lang_full} example"}}] '
+                          f'({n_examples} items)' if with_examples else "")
+    return f"""Could you explain the following Dutch words and expressions from a Dutch text for language learners?
+The forms used in the text are given in brackets.
+
+WORDS:
+{word_lines}
+
+REQUIREMENTS:
+- Keep every word and expression, in the given order and exactly as given
+{examples_requirement}- Provide {lang_full} translations for all content
+{level_requirement}- For Korean translations, use ONLY Korean characters. Do NOT include romanization.
+- Provide result in JSON format
+
+JSON structure:
+- words: [{{"nl": "the Dutch word exactly as given", "target": "{lang_full} translation"{level_structure}{examples_structure} }}] ({len(candidates)} items)"""
+
+
+def build_rewrite_prompt(text, lang_full, lang_level):
+    """Prompt for the text vocab extractor: rewrite the text for ``lang_level``."""
+    return f"""Please rewrite the following Dutch text to be suitable for {lang_level} level learners.
+TEXT TO REWRITE: 
+"{text}"
+
+REQUIREMENTS:
+- Keep the content and the order of the original text
+- Use vocabulary and grammar suitable for {lang_level} level learners
+- Provide a {lang_full} translation of the rewritten text
+- For Korean translations, use ONLY Korean characters. Do NOT include romanization.
+
+OUTPUT FORMAT:
+provide the result in JSON format with this structure:
+
+{{
+  "rewritten_text": {{
+    "nl": "Dutch text adapted for {lang_level} level",
+    "target": "{lang_full} translation"
+  }}
+}}"""
+
+
+def build_examples_prompt(words, context, lang_full, lang_level=None, n_examples=4):
+    """Prompt for the second phase: example sentences for words already listed.
+
+    The words are numbered; the response refers to them by number, so words
+    the model changes are still matched to the right examples.
+    """
+    word_lines = "\n".join(f"{index}. {word}" for index, word in enumerate(words, 1))
+    level_requirement = f"- Use sentences suitable for {lang_level} level learners\n" if lang_level else ""
+    return f"""Could you provide {n_examples} natural Dutch example sentences for each of the following Dutch words or phrases?
+CONTEXT: {context}
+
+WORDS:
+{word_lines}
+
+Requirements:
+- use each word or phrase as it is meant in the context
+- provide {lang_full} translations
+{level_requirement}- For Korean translations, use ONLY Korean characters. Do NOT include romanization.
+- Provide result in JSON format
+
+JSON structure:
+- words: [{{"index": number of the word, "examples": [{{"nl": "Dutch example", "target": "{lang_full} example"}}] ({n_examples} items) }}] ({len(words)} items)"""
+
+
+def build_levels_prompt(words):
+    """Prompt for the CEFR levels of Dutch words the lexicon does not know; the response refers to the words by
+    number."""
+    word_lines = "\n".join(f"{index}. {word}" for index, word in enumerate(words, 1))
+    return f"""Could you give the CEFR level of each of the following Dutch words or phrases for language learners?
+WORDS:
+{word_lines}
+
+Requirements:
+- give the level of every word or phrase with its number
+- use the level at which learners usually learn the word or phrase
+- Provide result in JSON format
+
+JSON structure:
+- levels: [{{"index": number of the word, "level": "CEFR level (A1/A2/B1/B2/C1/C2)"}}] ({len(words)} items)"""
+
+
+def build_translation_prompt(texts, lang_full):
+    """Prompt for translating the Dutch content of a result into another language; the response refers to the
+    texts by number."""
+    item_lines = "\n".join(f"{index}. {text}" for index, text in enumerate(texts, 1))
+    return f"""Could you translate each of the following Dutch words, phrases and texts into {lang_full}?
+ITEMS:
+{item_lines}
+
+Requirements:
+- translate every item and give its number with the translation
+- translate single words and phrases the way a dictionary would
+- For Korean translations, use ONLY Korean characters. Do NOT include romanization.
+- Provide result in JSON format
+
+JSON structure:
+- translations: [{{"index": number of the item, "target": "{lang_full} translation"}}] ({len(texts)} items)"""
@@ -0,0 +1,160 @@
+"""Routing requests to a model tier by input size and learner level.
+
+:class:`ModelRouter` holds one model per tier and keeps the
+``generate_content`` API of the standard tier, so it can be passed to the
+pipelines of :mod:`~dutch_words_coach.generation` like a single model. For
+each request the pipelines ask it for a :class:`Route`: the model to call,
+how many words and examples to ask for and the request's deadline.
+
+The rules (:class:`RoutingPolicy`):
+
+- output for A1/A2 learners (rewrites, examples) is simple language, which
+  the lite tier writes well and fast; C1/C2 output goes to the pro tier;
+- long inputs always go to the standard tier;
+- a short text gets fewer words than a long one, instead of words padded
+  out to 20;
+- A1/A2 learners get three examples per word instead of four.
+
+Models without routing (a plain gateway or the fake model) get the default
+route: the model itself, 20 words, 4 examples and no deadline.
+"""
+import os
+
+from .chunking import estimate_tokens
+from .core import MODEL_NAME, normalize_level
+from .metrics import inc
+
+TIERS = ("lite", "standard", "pro")
+DEFAULT_TIER_MODELS = {"lite": "gemini-1.5-flash-8b", "standard": MODEL_NAME, "pro": "gemini-1.5-pro-latest"}
+DEFAULT_WORDS = 20
+DEFAULT_EXAMPLES = 4
+# Seconds a routed request may take once it has started
+DEFAULT_DEADLINE = 60.0
+
+
+class Route:
+    """Where one request goes and how much it asks for."""
+
+    def __init__(self, model, tier="standard", n_words=DEFAULT_WORDS, n_examples=DEFAULT_EXAMPLES, deadline=None):
+        self.model = model
+        self.tier = tier
+        self.n_words = n_words
+        self.n_examples = n_examples
+        self.deadline = deadline
+
+    @property
+    def is_default(self):
+        """Whether the prompt asks for the default numbers of words and examples."""
+        return self.n_words == DEFAULT_WORDS and self.n_examples == DEFAULT_EXAMPLES
+
+
+class RoutingPolicy:
+    """Rules from a request's input size and level to a tier and the numbers of words and examples.
+
+    Inputs above ``long_tokens`` go to the standard tier; otherwise levels in
+    ``lite_levels`` go to the lite tier and those in ``pro_levels`` to the pro
+    tier. Texts get one word per ``tokens_per_word`` tokens, between
+    ``min_words`` and ``max_words``. ``deadline`` is the per-request deadline
+    in seconds (``None`` for none).
+    """
+
+    def __init__(self, lite_levels=("A1", "A2"), pro_levels=("C1", "C2"), long_tokens=1000, tokens_per_word=10,
+                 min_words=8, max_words=DEFAULT_WORDS, examples=DEFAULT_EXAMPLES, beginner_examples=3,
+                 deadline=DEFAULT_DEADLINE):
+        self.lite_levels = lite_levels
+        self.pro_levels = pro_levels
+        self.long_tokens = long_tokens
+        self.tokens_per_word = tokens_per_word
+        self.min_words = min_words
+        self.max_words = max_words
+        self.examples = examples
+        self.beginner_examples = beginner_examples
+        self.deadline = deadline
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Policy with the deadline from ``DUTCH_WORDS_COACH_DEADLINE`` (seconds; 0 for none)."""
+        deadline = os.getenv("DUTCH_WORDS_COACH_DEADLINE")
+        if deadline:
+            kwargs.setdefault("deadline", float(deadline) or None)
+        return cls(**kwargs)
+
+    def tier(self, tokens, level=None):
+        if tokens > self.long_tokens:
+            return "standard"
+        if level in self.lite_levels:
+            return "lite"
+        if level in self.pro_levels:
+            return "pro"
+        return "standard"
+
+    def words(self, tokens):
+        return max(self.min_words, min(self.max_words, tokens // self.tokens_per_word))
+
+    def examples_for(self, level=None):
+        return self.beginner_examples if level in self.lite_levels else self.examples
+
+
+def tier_models_from_env():
+    """``{tier: model name}`` from ``GEMINI_MODEL``, ``GEMINI_MODEL_LITE`` and ``GEMINI_MODEL_PRO``."""
+    return {tier: os.getenv("GEMINI_MODEL" if tier == "standard" else f"GEMINI_MODEL_{tier.upper()}") or default
+            for tier, default in DEFAULT_TIER_MODELS.items()}
+
+
+class ModelRouter:
+    """One model per tier behind a single ``generate_content`` (of the standard tier)."""
+
+    def __init__(self, models, policy=None):
+        self.models = models
+        self.policy = policy or RoutingPolicy()
+        self.model_name = getattr(models["standard"], "model_name", None)
+
+    @classmethod
+    def from_env(cls, make_model, **kwargs):
+        """Router over ``make_model(model_name)`` for the tiers of :func:`tier_models_from_env`.
+
+        ``DUTCH_WORDS_COACH_ROUTING=0`` sends everything to the standard tier
+        with the default numbers of words and examples. Tiers with the same
+        model name share one model.
+        """
+        names = tier_models_from_env()
+        if os.getenv("DUTCH_WORDS_COACH_ROUTING") == "0":
+            names = {"standard": names["standard"]}
+        models = {}
+        for tier, name in names.items():
+            models[tier] = next((models[other] for other in models if names[other] == name), None) or make_model(name)
+        return cls(models, RoutingPolicy.from_env(**kwargs))
+
+    def generate_content(self, prompt, **kwargs):
+        return self.models["standard"].generate_content(prompt, **kwargs)
+
+    def set_share(self, share):
+        """Pass the part of the rate limits this process may use on to the tiers' gateways."""
+        for model in {id(model): model for model in self.models.values()}.values():
+            if hasattr(model, "set_share"):
+                model.set_share(share)
+
+    def route(self, kind, text, level=None):
+        """The route for a ``kind`` request on ``text`` for a learner at ``level``.
+
+        Only the vocabulary of a text (``kind`` ``"vocabulary"``) gets a
+        number of words by its length, and only examples (``"examples"``) a
+        number of examples by level.
+        """
+        if len(self.models) == 1:
+            return Route(self.models["standard"], deadline=self.policy.deadline)
+        tokens = estimate_tokens(text)
+        level = normalize_level(level)
+        tier = self.policy.tier(tokens, level)
+        inc("model_routes_total", kind=kind, tier=tier)
+        return Route(self.models.get(tier, self.models["standard"]), tier,
+                     self.policy.words(tokens) if kind == "vocabulary" else DEFAULT_WORDS,
+                     self.policy.examples_for(level) if kind == "examples" else DEFAULT_EXAMPLES,
+                     self.policy.deadline)
+
+
+def route_of(model, kind, text, level=None):
+    """The route for a request to ``model``; models other than a :class:`ModelRouter` get the default route."""
+    if isinstance(model, ModelRouter):
+        return model.route(kind, text, level)
+    return Route(model)
@@ -0,0 +1,177 @@
+"""Response schemas for structured (JSON) output.
+
+Passing these as ``response_schema`` makes Gemini return a bare JSON document
+in exactly the shape the apps expect, instead of free text around a code
+fence.
+"""
+from .core import CEFR_LEVELS
+
+_TRANSLATED_TEXT = {
+    "type": "object",
+    "properties": {
+        "nl": {"type": "string"},
+        "target": {"type": "string"},
+    },
+    "required": ["nl", "target"],
+}
+
+_LEVEL = {"type": "string", "format": "enum", "enum": list(CEFR_LEVELS)}
+
+_EXAMPLES = {"type": "array", "items": _TRANSLATED_TEXT}
+
+# Number of a requested item in the prompt, starting at 1
+_INDEX = {"type": "integer"}
+
+# Levels come from the CEFR lexicon, or from a LEVELS_SCHEMA request for the words it does not know
+_KEYWORD = {
+    "type": "object",
+    "properties": {
+        "nl": {"type": "string"},
+        "target": {"type": "string"},
+    },
+    "required": ["nl", "target"],
+}
+
+# context-language-coach: {"words": [{"keyword": {...}, "examples": [...]}]}
+SITUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"keyword": _KEYWORD, "examples": _EXAMPLES},
+                "required": ["keyword", "examples"],
+            },
+        },
+    },
+    "required": ["words"],
+}
+
+# text-vocab-extractor, vocabulary stage: {"words": [{"nl", "target", "examples"}]}
+VOCABULARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": dict(_KEYWORD["properties"], examples=_EXAMPLES),
+                "required": ["nl", "target", "examples"],
+            },
+        },
+    },
+    "required": ["words"],
+}
+
+# text-vocab-extractor, rewrite stage: {"rewritten_text": {"nl", "target"}}
+REWRITE_SCHEMA = {
+    "type": "object",
+    "properties": {"rewritten_text": _TRANSLATED_TEXT},
+    "required": ["rewritten_text"],
+}
+
+# Word lists without examples, for two-phase generation
+SITUATION_WORDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"keyword": _KEYWORD},
+                "required": ["keyword"],
+            },
+        },
+    },
+    "required": ["words"],
+}
+
+VOCABULARY_WORDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {"type": "array", "items": _KEYWORD},
+    },
+    "required": ["words"],
+}
+
+# text-vocab-extractor with locally selected candidates: the level is only
+# asked for words the CEFR lexicon does not know, so it is optional
+_CANDIDATE = {
+    "type": "object",
+    "properties": dict(_KEYWORD["properties"], level=_LEVEL),
+    "required": ["nl", "target"],
+}
+
+CANDIDATES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {
+            "type": "array",
+            "items": dict(_CANDIDATE, properties=dict(_CANDIDATE["properties"], examples=_EXAMPLES),
+                          required=["nl", "target", "examples"]),
+        },
+    },
+    "required": ["words"],
+}
+
+CANDIDATES_WORDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {"type": "array", "items": _CANDIDATE},
+    },
+    "required": ["words"],
+}
+
+# Second phase: {"words": [{"index": ..., "examples": [...]}]}
+EXAMPLES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "words": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": _INDEX, "examples": _EXAMPLES},
+                "required": ["index", "examples"],
+            },
+        },
+    },
+    "required": ["words"],
+}
+
+# Levels of words the CEFR lexicon does not know: {"levels": [{"index": ..., "level": ...}]}
+LEVELS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "levels": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": _INDEX, "level": _LEVEL},
+                "required": ["index", "level"],
+            },
+        },
+    },
+    "required": ["levels"],
+}
+
+# Translation of existing Dutch content: {"translations": [{"index": ..., "target": ...}]}
+TRANSLATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "translations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": _INDEX, "target": {"type": "string"}},
+                "required": ["index", "target"],
+            },
+        },
+    },
+    "required": ["translations"],
+}
+
+
+def json_generation_config(schema):
+    """``generation_config`` asking for JSON output that follows ``schema``."""
+    return {"response_mime_type": "application/json", "response_schema": schema}
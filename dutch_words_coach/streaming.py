@@ -0,0 +1,89 @@
+"""Incremental parsing of streamed Gemini responses.
+
+The model returns one JSON document containing a ``words`` array. While the
+response is streamed, :class:`WordsStreamParser` scans the text as it arrives
+and hands back every entry of that array as soon as its closing brace is seen,
+so the apps can render the first words long before the document is complete.
+"""
+import json
+
+from .parsing import repair_json
+
+
+def iter_stream_text(response):
+    """Yield the text of each chunk of a ``generate_content(..., stream=True)`` response."""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. the final safety/finish chunk)
+            continue
+        if text:
+            yield text
+
+
+class WordsStreamParser:
+    """Emit completed entries of the top-level ``words`` array from streamed text."""
+
+    def __init__(self, array_key="words"):
+        self.array_key = array_key
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._array_depth = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        """Add ``chunk`` to the buffer and return the list of newly completed entries."""
+        self.text += chunk
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                if self._array_depth is not None and self._depth == self._array_depth and char == "{":
+                    self._item_start = i
+                if char == "[" and self._depth == 1 and self._last_key == self.array_key and self._array_depth is None:
+                    self._array_depth = self._depth + 1
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._array_depth is not None:
+                    if char == "}" and self._depth == self._array_depth and self._item_start is not None:
+                        item = self._parse_item(text[self._item_start:i + 1])
+                        if item is not None:
+                            items.append(item)
+                        self._item_start = None
+                    elif char == "]" and self._depth == self._array_depth - 1:
+                        self._array_depth = None
+        self._pos = len(text)
+        return items
+
+    @staticmethod
+    def _parse_item(item_text):
+        try:
+            item = json.loads(item_text)
+        except json.JSONDecodeError:
+            try:
+                item = json.loads(repair_json(item_text))
+            except json.JSONDecodeError:
+                return None
+        return item if isinstance(item, dict) else None
@@ -0,0 +1,331 @@
+"""Streamlit helpers shared by both apps."""
+import html
+import uuid
+
+import streamlit as st
+
+from .cache import ResponseCache
+from .core import keyword_of
+from .jobs import JobClient, JobNotFound, JobQueue, WorkerSets, open_corpus
+from .metrics import span, start_export, start_trace
+from .parsing import ResponseParseError
+from .vocabulary import VocabularyStore
+
+
+# Process-wide resources, created once and shared by every session and rerun
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+
+@st.cache_resource
+def get_worker_sets():
+    return WorkerSets(get_job_queue())
+
+
+def get_jobs(api_key):
+    """Job client for ``api_key``; its use starts this process's workers for the key (for a limited number of keys).
+
+    Results the response cache has are served by the client itself, without a job.
+    """
+    return JobClient(get_job_queue(), api_key, get_worker_sets(), get_response_cache(), get_example_corpus(),
+                     get_vocabulary_store())
+
+
+@st.cache_resource
+def get_vocabulary_store():
+    return VocabularyStore()
+
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+
+@st.cache_resource
+def get_example_corpus():
+    return open_corpus()
+
+
+@st.cache_resource
+def _start_metrics_export():
+    return start_export()
+
+
+def start_run_trace():
+    """Start the metrics export (once per process) and a trace for this script run."""
+    _start_metrics_export()
+    return start_trace()
+
+
+def debug_panel(trace):
+    """Optional sidebar panel with the stage timings, tokens and events of this run."""
+    if not st.sidebar.toggle("🔍 Debug-informatie", value=False):
+        return
+    st.sidebar.subheader("🔍 Debug-informatie")
+    totals = trace.stage_totals()
+    if totals:
+        st.sidebar.dataframe([{"Stap": stage, "ms": round(ms, 1)} for stage, ms in totals.items()],
+                             hide_index=True)
+    else:
+        st.sidebar.caption("Geen metingen in deze run.")
+    if trace.tokens:
+        st.sidebar.caption(f"Tokens: {trace.tokens['prompt']} prompt, {trace.tokens['output']} output")
+    if trace.events:
+        st.sidebar.json(dict(trace.events), expanded=False)
+    st.sidebar.caption(f"Trace: {trace.id}")
+
+
+def setup_model(api_key):
+    """Show the API key status in the sidebar and return ``(api_key, jobs)``.
+
+    Asks for a key in the sidebar when none was configured. ``jobs`` is the
+    :class:`~dutch_words_coach.jobs.JobClient` that generation requests are
+    submitted to.
+    """
+    jobs = None
+    if api_key:
+        jobs = get_jobs(api_key)
+        st.sidebar.success("✅ API sleutel ingesteld! (omgevingsvariabele)")
+    else:
+        api_key = st.sidebar.text_input("Voer je Gemini API sleutel in:", type="password",
+                                        help="Gemini API sleutel van Google AI Studio")
+        if api_key:
+            jobs = get_jobs(api_key)
+            st.sidebar.success("✅ API sleutel ingesteld!")
+    return api_key, jobs
+
+
+def resumed_job(stored):
+    """Id of the job in the URL if its result is not shown yet, e.g. after the page was reloaded."""
+    job_id = st.query_params.get("job")
+    if job_id and (stored is None or stored.get("job") != job_id):
+        return job_id
+    return None
+
+
+def learner_vocabulary():
+    """The learner's vocabulary, or ``None`` if it is turned off in the sidebar.
+
+    The learner is identified by ``?learner=...`` in the URL, so a bookmarked
+    link keeps the same vocabulary.
+    """
+    if not st.sidebar.toggle("📒 Mijn woordenlijst gebruiken", value=True,
+                             help="Slaat woorden over die je al kent en hergebruikt de voorbeelden van woorden "
+                                  "die je eerder zag"):
+        return None
+    if "learner" not in st.query_params:
+        st.query_params["learner"] = uuid.uuid4().hex[:12]
+    learner = get_vocabulary_store().learner(st.query_params["learner"])
+    served, known = learner.stats()
+    st.sidebar.caption(f"📒 {served} woorden gezien, {known} bekend. "
+                       "Bewaar de link van deze pagina om je woordenlijst te houden.")
+    return learner
+
+
+def known_words_marker(words, learner, key):
+    """Controls to mark shown words as known, so later results leave them out."""
+    if learner is None or not words:
+        return
+    selected = st.multiselect("✅ Deze woorden ken ik al:", [keyword_of(item).get("nl") for item in words],
+                              key=f"{key}_known_words")
+    if st.button("✅ Opslaan als bekend", key=f"{key}_known_save", disabled=not selected):
+        learner.set_known(selected)
+        st.success("✅ Opgeslagen. Deze woorden worden voortaan overgeslagen.")
+
+
+# Shown for words from a word-list-only generation whose examples are not loaded yet
+NO_EXAMPLES_YET = "Voorbeelden nog niet geladen."
+
+
+def render_word(item):
+    keyword = keyword_of(item)
+    word_nl = keyword.get('nl', 'N/A')
+    word_target = keyword.get('target', 'N/A')
+    word_level = keyword.get('level', 'N/A')
+    with st.expander(f"**{word_nl}** ({word_level})"):
+        st.write(f"{word_target}")
+        if "examples" not in item:
+            st.caption(NO_EXAMPLES_YET)
+            return
+        st.write(f"**Voorbeelden:**")
+        examples = item.get('examples', [])
+        for idx, example in enumerate(examples, 1):
+            example_nl = example.get('nl', 'N/A')
+            example_target = example.get('target', 'N/A')
+            st.write(f"- {example_nl} ({example_target})")
+
+
+# Rendering modes for word lists. "Uitklapbaar" sends one expander with several
+# elements per word; the other modes send a single element per page of words.
+RENDER_MODES = ("Compact", "Tabel", "Uitklapbaar")
+PAGE_SIZE = 50
+
+
+def words_html(words):
+    """All words as one HTML block with a collapsible <details> element per word."""
+    parts = []
+    for item in words:
+        keyword = keyword_of(item)
+        examples = "".join(
+            f"<li>{html.escape(example.get('nl', 'N/A'))} ({html.escape(example.get('target', 'N/A'))})</li>"
+            for example in item.get("examples", [])
+        )
+        examples_html = (f"<p><b>Voorbeelden:</b></p><ul>{examples}</ul>" if "examples" in item
+                         else f"<p><i>{NO_EXAMPLES_YET}</i></p>")
+        parts.append(
+            f"<details><summary><b>{html.escape(keyword.get('nl', 'N/A'))}</b> "
+            f"({html.escape(keyword.get('level', 'N/A'))})</summary>"
+            f"<p>{html.escape(keyword.get('target', 'N/A'))}</p>"
+            f"{examples_html}</details>"
+        )
+    return "\n".join(parts)
+
+
+def words_table(words):
+    """One row per word, with the examples in a single column."""
+    rows = []
+    for item in words:
+        keyword = keyword_of(item)
+        rows.append({
+            "Nederlands": keyword.get("nl", "N/A"),
+            "Vertaling": keyword.get("target", "N/A"),
+            "Niveau": keyword.get("level", "N/A"),
+            "Voorbeelden": "\n".join(
+                f"{example.get('nl', 'N/A')} ({example.get('target', 'N/A')})" for example in item.get("examples", [])
+            ),
+        })
+    return rows
+
+
+def _render_page(words, mode):
+    if mode == "Tabel":
+        st.dataframe(words_table(words), hide_index=True)
+    else:
+        st.markdown(words_html(words), unsafe_allow_html=True)
+
+
+def render_words(words, mode=RENDER_MODES[0], page_size=PAGE_SIZE):
+    """Render a word list in the chosen mode.
+
+    Long lists (e.g. merged chunks of a long text) are split into pages shown
+    as tabs; switching tabs happens in the browser without a rerun.
+    """
+    with span("render", mode=mode):
+        _render_words(words, mode, page_size)
+
+
+def _render_words(words, mode, page_size):
+    if mode == "Uitklapbaar":
+        for item in words:
+            render_word(item)
+        return
+
+    pages = [words[i:i + page_size] for i in range(0, len(words), page_size)]
+    if len(pages) <= 1:
+        _render_page(words, mode)
+        return
+    tabs = st.tabs([f"{i * page_size + 1}–{i * page_size + len(page)}" for i, page in enumerate(pages)])
+    for tab, page in zip(tabs, pages):
+        with tab:
+            _render_page(page, mode)
+
+
+# Seconds between two checks of a running job
+POLL_SECONDS = 0.5
+
+
+def job_result(jobs, job_id, message, header=None, mode=RENDER_MODES[0]):
+    """The result of the job, or ``None`` while it is queued or running.
+
+    Does not wait for the job: while it runs, a fragment shows ``message``
+    or the queue position, the progress of long texts and the streamed words
+    (under ``header``), checks the job again every :data:`POLL_SECONDS` and
+    reruns the script once it ended. A failed job raises its error, as
+    :meth:`~dutch_words_coach.jobs.JobQueue.result` does.
+    """
+    result = jobs.result(job_id)
+    if result is None:
+        _job_progress(jobs, job_id, message, header, mode)
+    return result
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def _job_progress(jobs, job_id, message, header, mode):
+    try:
+        job = jobs.get(job_id)
+    except JobNotFound:
+        st.rerun()
+    if job["status"] in ("done", "failed"):
+        st.rerun()
+
+    position = job["position"] or job["progress"].get("queue", 0)
+    if position:
+        st.info(f"⏳ Het is druk. Je aanvraag staat in de wachtrij op positie {position}...")
+    else:
+        st.info(f"⏳ {message}")
+    show_chunk_errors(job)
+    chunks = job["progress"].get("chunks", [])
+    if chunks:
+        # Long texts are analysed in parallel chunks
+        done, total = chunks[-1][:2]
+        st.progress(done / total, text=f"Lange tekst: {done}/{total} delen geanalyseerd...")
+    words = jobs.words(job_id)
+    if words:
+        if header:
+            st.header(header)
+        render_words(words, mode)
+
+
+def show_chunk_errors(job):
+    """Warnings for the chunks of a long text that could not be analysed."""
+    for done, total, index, error in job["progress"].get("chunks", []):
+        if error is not None:
+            st.warning(f"⚠️ Deel {index + 1} kon niet verwerkt worden: {error}")
+
+
+def examples_loader(words, jobs, params, key):
+    """Controls to fetch the examples of words that do not have them yet.
+
+    The examples come from the response cache or else from an ``"examples"``
+    job with ``params`` (context, language, ...) for the selected words,
+    polled like the generation itself.
+    They are stored in the word entries themselves, so they stay with a
+    result kept in ``st.session_state``.
+    """
+    job_key = f"{key}_examples_job"
+    notice_key = f"{key}_examples_notice"
+    if notice_key in st.session_state:
+        st.warning(st.session_state.pop(notice_key))
+    job_id = st.session_state.get(job_key)
+    if job_id is None:
+        missing = [keyword_of(item).get("nl") for item in words if "examples" not in item]
+        if not missing:
+            return
+        selected = st.multiselect("📚 Voorbeelden laden voor:", missing, key=f"{key}_examples_words",
+                                  placeholder="Alle woorden zonder voorbeelden")
+        if not st.button("📚 Voorbeelden laden", key=f"{key}_examples_load"):
+            return
+        job_params = dict(params, words=selected or missing)
+        examples = jobs.cached("examples", job_params)
+        if examples is None:
+            job_id = st.session_state[job_key] = jobs.submit("examples", job_params)
+    if job_id is not None:
+        try:
+            examples = job_result(jobs, job_id, "Voorbeeldzinnen worden opgehaald...")
+        except Exception as e:
+            examples = e.partial if isinstance(e, ResponseParseError) else None
+            if not examples:
+                del st.session_state[job_key]
+                st.error(f"❌ Voorbeelden ophalen is mislukt. Probeer het later opnieuw. ({e})")
+                return
+            # Keep the examples that did arrive; the other words can be loaded again
+            st.session_state[notice_key] = "⚠️ Niet alle voorbeelden konden worden opgehaald. Probeer de rest opnieuw."
+        if examples is None:
+            return
+        del st.session_state[job_key]
+    for item in words:
+        word = keyword_of(item).get("nl")
+        if word in examples:
+            item["examples"] = examples[word]
+    st.rerun()
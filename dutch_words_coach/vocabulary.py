@@ -0,0 +1,196 @@
+"""Per-learner vocabulary: the words a learner has been shown or already knows.
+
+Entries live in a small SQLite database, keyed by learner and lemma, so
+"de huizen" and "huis" are the same word. For every word the store keeps
+how often it was served, whether the learner marked it as known, and the
+last entry served for it per target language (translation, level and
+examples).
+
+The pipelines in :mod:`~dutch_words_coach.generation` take a
+:class:`Learner`: known words are left out of the prompts, and words served
+before get their stored examples instead of new ones.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from .candidates import lemma_of
+from .core import keyword_of
+
+DEFAULT_VOCABULARY_PATH = Path.home() / ".cache" / "dutch-words-coach" / "vocabulary.sqlite3"
+# Known words listed in a prompt, most recently marked first
+DEFAULT_MAX_EXCLUSIONS = 100
+
+
+def _entry_of(item):
+    """The flat ``{"nl", "target", "level", "examples"}`` form of a word entry of either app."""
+    entry = {key: value for key, value in keyword_of(item).items() if key in ("nl", "target", "level")}
+    if "examples" in item:
+        entry["examples"] = item["examples"]
+    return entry
+
+
+class VocabularyStore:
+    """SQLite-backed vocabulary of every learner on this machine."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.getenv("DUTCH_WORDS_COACH_VOCABULARY", DEFAULT_VOCABULARY_PATH)
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS words (
+                    learner TEXT NOT NULL,
+                    lemma TEXT NOT NULL,
+                    nl TEXT NOT NULL,
+                    known REAL,
+                    served INTEGER NOT NULL DEFAULT 0,
+                    last_served REAL,
+                    PRIMARY KEY (learner, lemma)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    learner TEXT NOT NULL,
+                    lemma TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (learner, lemma, language)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS words_known ON words (learner, known)")
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def learner(self, learner_id):
+        return Learner(self, learner_id)
+
+    def record(self, learner_id, words, language, served=True):
+        """Store the entries of ``words`` for ``language``.
+
+        With ``served=True`` the words also count as shown to the learner once
+        more; use ``served=False`` to only update the stored entries (e.g.
+        after loading examples).
+        """
+        now = time.time()
+        rows = []
+        for item in words:
+            entry = _entry_of(item)
+            if entry.get("nl"):
+                rows.append((lemma_of(entry["nl"]), entry))
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN")
+            for lemma, entry in rows:
+                conn.execute(
+                    """INSERT INTO words (learner, lemma, nl, served, last_served) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (learner, lemma) DO UPDATE SET served = served + excluded.served,
+                        last_served = COALESCE(excluded.last_served, last_served)""",
+                    (learner_id, lemma, entry["nl"], int(served), now if served else None),
+                )
+                existing = conn.execute(
+                    "SELECT value FROM entries WHERE learner = ? AND lemma = ? AND language = ?",
+                    (learner_id, lemma, language),
+                ).fetchone()
+                if existing is not None:
+                    # Keep what is not in the new entry, e.g. examples loaded earlier
+                    entry = dict(json.loads(existing[0]), **entry)
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (learner, lemma, language, value) VALUES (?, ?, ?, ?)",
+                    (learner_id, lemma, language, json.dumps(entry, ensure_ascii=False)),
+                )
+            conn.execute("COMMIT")
+
+    def set_known(self, learner_id, words, known=True):
+        """Mark Dutch ``words`` as known (or no longer known) by the learner."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for word in words:
+                conn.execute(
+                    """INSERT INTO words (learner, lemma, nl, known) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (learner, lemma) DO UPDATE SET known = excluded.known""",
+                    (learner_id, lemma_of(word), word, now if known else None),
+                )
+
+    def known_words(self, learner_id, limit=None):
+        """The Dutch words marked as known, most recently marked first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT nl FROM words WHERE learner = ? AND known IS NOT NULL ORDER BY known DESC LIMIT ?",
+                (learner_id, -1 if limit is None else limit),
+            ).fetchall()
+        return [nl for nl, in rows]
+
+    def known_lemmas(self, learner_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT lemma FROM words WHERE learner = ? AND known IS NOT NULL",
+                                (learner_id,)).fetchall()
+        return {lemma for lemma, in rows}
+
+    def entries(self, learner_id, lemmas, language):
+        """Stored entries in ``language`` for the given lemmas: ``{lemma: entry}``."""
+        lemmas = list(dict.fromkeys(lemmas))
+        found = {}
+        with self._connect() as conn:
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(lemmas), 500):
+                batch = lemmas[start:start + 500]
+                rows = conn.execute(
+                    f"""SELECT lemma, value FROM entries WHERE learner = ? AND language = ?
+                    AND lemma IN ({", ".join("?" * len(batch))})""",
+                    (learner_id, language, *batch),
+                ).fetchall()
+                found.update((lemma, json.loads(value)) for lemma, value in rows)
+        return found
+
+    def stats(self, learner_id):
+        """``(served, known)``: the number of different words served and marked known."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FILTER (WHERE served > 0), COUNT(known) FROM words WHERE learner = ?",
+                (learner_id,),
+            ).fetchone()
+
+    def forget(self, learner_id):
+        """Remove everything stored for the learner."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM words WHERE learner = ?", (learner_id,))
+            conn.execute("DELETE FROM entries WHERE learner = ?", (learner_id,))
+
+
+class Learner:
+    """The vocabulary of one learner, as passed to the generation pipelines."""
+
+    def __init__(self, store, learner_id, max_exclusions=DEFAULT_MAX_EXCLUSIONS):
+        self.store = store
+        self.id = learner_id
+        self.max_exclusions = max_exclusions
+
+    def exclusions(self):
+        """Known words to leave out of a prompt."""
+        return self.store.known_words(self.id, self.max_exclusions)
+
+    def known_lemmas(self):
+        return self.store.known_lemmas(self.id)
+
+    def entries(self, words, language):
+        """Stored entries for Dutch ``words`` in ``language``: ``{word: entry}``."""
+        lemmas = {word: lemma_of(word) for word in words}
+        stored = self.store.entries(self.id, lemmas.values(), language)
+        return {word: stored[lemma] for word, lemma in lemmas.items() if lemma in stored}
+
+    def record(self, words, language, served=True):
+        self.store.record(self.id, words, language, served)
+
+    def set_known(self, words, known=True):
+        self.store.set_known(self.id, words, known)
+
+    def stats(self):
+        return self.store.stats(self.id)
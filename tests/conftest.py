@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Make the shared package at the repository root importable, as the apps do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dutch_words_coach.jobs import JobQueue  # noqa: E402
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.sqlite3", stale_seconds=0.2)
+
+
+@pytest.fixture(autouse=True)
+def _no_env_settings(monkeypatch):
+    # Settings of the machine running the tests must not change the limits, tiers or deadlines under test
+    for name in ("GEMINI_RPM", "GEMINI_TPM", "GEMINI_MAX_CONCURRENCY", "GEMINI_HEDGE_QUANTILE", "GEMINI_MODEL",
+                 "GEMINI_MODEL_LITE", "GEMINI_MODEL_PRO", "DUTCH_WORDS_COACH_ROUTING", "DUTCH_WORDS_COACH_DEADLINE",
+                 "DUTCH_WORDS_COACH_MAX_KEYS", "DUTCH_WORDS_COACH_WORKERS"):
+        monkeypatch.delenv(name, raising=False)
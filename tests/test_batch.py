@@ -0,0 +1,92 @@
+import json
+
+from dutch_words_coach.batch import completed_ids, input_id, main, read_inputs, run_batch
+from dutch_words_coach.fake import FakeGenerativeModel
+
+
+class FailingModel(FakeGenerativeModel):
+    """Fake model that fails for prompts containing ``failing``."""
+
+    def __init__(self, failing, **kwargs):
+        super().__init__(**kwargs)
+        self.failing = failing
+
+    def generate_content(self, prompt, **kwargs):
+        if self.failing in prompt:
+            raise RuntimeError("unavailable")
+        return super().generate_content(prompt, **kwargs)
+
+
+def _records(path):
+    records = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            pass
+    return records
+
+
+def test_inputs_from_lines_jsonl_and_directories(tmp_path):
+    situations = tmp_path / "situations.txt"
+    situations.write_text("# comment\nop de markt\n\nbij de bakker\nop de markt\n", encoding="utf-8")
+    assert read_inputs(situations, "situations") == [(input_id("op de markt"), "op de markt"),
+                                                     (input_id("bij de bakker"), "bij de bakker"),
+                                                     (input_id("op de markt"), "op de markt")]
+
+    jsonl = tmp_path / "texts.jsonl"
+    jsonl.write_text('{"id": 7, "text": "Een tekst."}\n\n{"text": "Nog een."}\n', encoding="utf-8")
+    assert read_inputs(jsonl, "texts") == [("7", "Een tekst."), (input_id("Nog een."), "Nog een.")]
+
+    corpus = tmp_path / "corpus"
+    (corpus / "nieuws").mkdir(parents=True)
+    (corpus / "nieuws" / "a.txt").write_text("Een artikel.", encoding="utf-8")
+    (corpus / "leeg.txt").write_text("  \n", encoding="utf-8")
+    assert read_inputs(corpus, "texts") == [("nieuws/a.txt", "Een artikel.")]
+
+
+def test_interrupted_run_continues_with_the_rest(tmp_path):
+    output = tmp_path / "out.jsonl"
+    inputs = [(input_id(situation), situation) for situation in ("op de markt", "bij de bakker", "in de trein")]
+    assert run_batch(FakeGenerativeModel(), "situations", inputs[:1], output) == 1
+    # A line cut off by the interruption is ignored
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "x", "res')
+
+    model = FakeGenerativeModel()
+    assert run_batch(model, "situations", inputs, output) == 2
+    assert sorted(record["input"] for record in _records(output)) == sorted(situation for _, situation in inputs)
+    assert run_batch(model, "situations", inputs, output) == 0
+
+
+def test_failed_inputs_are_retried(tmp_path):
+    output = tmp_path / "out.jsonl"
+    inputs = [(input_id(situation), situation) for situation in ("op de markt", "bij de bakker")]
+    run_batch(FailingModel("bakker"), "situations", inputs, output)
+    failed = [record for record in _records(output) if "error" in record]
+    assert [record["input"] for record in failed] == ["bij de bakker"]
+    assert "RuntimeError: unavailable" in failed[0]["error"]
+
+    assert run_batch(FakeGenerativeModel(), "situations", inputs, output) == 1
+    assert len(completed_ids(output)) == 2
+
+
+def test_other_languages_and_levels_are_new_results(tmp_path):
+    output = tmp_path / "out.jsonl"
+    inputs = [("a", "Ik bestel koffie op het terras.")]
+    assert run_batch(FakeGenerativeModel(), "texts", inputs, output, "English", "B1") == 1
+    assert run_batch(FakeGenerativeModel(), "texts", inputs, output, "English", "B1") == 0
+    assert run_batch(FakeGenerativeModel(), "texts", inputs, output, "English", "A2") == 1
+    assert run_batch(FakeGenerativeModel(), "texts", inputs, output, "Korean", "B1") == 1
+
+
+def test_cli_runs_offline(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("DUTCH_WORDS_COACH_CACHE", str(tmp_path / "cache.sqlite3"))
+    situations = tmp_path / "situations.txt"
+    situations.write_text("op de markt\nbij de bakker\n", encoding="utf-8")
+    output = tmp_path / "out.jsonl"
+    assert main(["situations", str(situations), "-o", str(output), "--fake", "--language", "Korean"]) == 0
+    records = _records(output)
+    assert len(records) == 2 and all(record["language"] == "Korean" and record["result"]["words"]
+                                     for record in records)
+    assert "2 new result(s)" in capsys.readouterr().err
@@ -0,0 +1,51 @@
+import time
+
+from dutch_words_coach.cache import ResponseCache, make_key, normalize_input
+
+
+def test_hit_returns_the_stored_value(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    assert cache.get("k") is None
+    cache.set("k", {"words": [{"nl": "koffie"}]})
+    assert cache.get("k") == {"words": [{"nl": "koffie"}]}
+    # Other processes see the same entries
+    assert ResponseCache(tmp_path / "cache.sqlite3").get("k") == {"words": [{"nl": "koffie"}]}
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", ttl_seconds=0.1)
+    cache.set("k", 1)
+    time.sleep(0.2)
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", max_entries=2)
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    assert cache.get("a") == 1
+    time.sleep(0.01)
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_trivially_different_inputs_share_a_key():
+    assert normalize_input("  Op het\nterras ") == "Op het terras"
+    assert normalize_input("Op het Terras", casefold=True) == normalize_input("op het terras")
+    # Composed and decomposed accents are the same text
+    assert normalize_input("caf\u00e9") == normalize_input("cafe\u0301")
+
+
+def test_keys_depend_on_everything_that_changes_the_output():
+    key = make_key("situation", "op het terras", "English", None, "gemini", "1")
+    assert key == make_key("situation", "op het terras", "English", None, "gemini", "1")
+    assert len({key,
+                make_key("vocabulary", "op het terras", "English", None, "gemini", "1"),
+                make_key("situation", "op het terras", "Korean", None, "gemini", "1"),
+                make_key("situation", "op het terras", "English", "B1", "gemini", "1"),
+                make_key("situation", "op het terras", "English", None, "gemini-pro", "1"),
+                make_key("situation", "op het terras", "English", None, "gemini", "2")}) == 6
@@ -0,0 +1,68 @@
+import pytest
+
+from dutch_words_coach.candidates import extract_candidates, find_expressions, lemma_of, lemmatize, tokenize
+from dutch_words_coach.levels import level_candidates
+
+TEXT = "Ik bestel koffie op het terras. De ober brengt de rekening. Gisteren heeft Jan een fiets gekocht."
+
+
+@pytest.mark.parametrize("word, lemma", [
+    ("katten", "kat"),
+    ("huizen", "huis"),
+    ("brengt", "brengen"),
+    ("bestelt", "bestellen"),
+    ("gekocht", "kopen"),
+    ("opgebeld", "opbellen"),
+    ("Rekening", "rekening"),
+])
+def test_inflected_forms_get_their_lemma(word, lemma):
+    assert lemmatize(word) == lemma
+
+
+def test_articles_are_not_part_of_the_lemma():
+    assert lemma_of("de  Katten") == lemma_of("kat") == "kat"
+
+
+def test_tokens_know_where_sentences_start():
+    assert tokenize("De ober komt. Hij brengt koffie") == [
+        ("De", True, 0), ("ober", False, 0), ("komt", False, 0),
+        ("Hij", True, 1), ("brengt", False, 1), ("koffie", False, 1),
+    ]
+
+
+def test_names_stopwords_and_common_words_are_left_out():
+    words = [candidate["nl"] for candidate in extract_candidates(TEXT, None)]
+    assert "jan" not in words and "Jan" not in words
+    assert not {"ik", "de", "het", "een", "hebben"} & set(words)
+    assert {"koffie", "ober", "rekening", "kopen", "brengen"} <= set(words)
+
+
+def test_forms_are_counted_per_lemma():
+    candidates = extract_candidates("De katten slapen. Mijn kat slaapt. Die kat is oud.", None)
+    entry = next(candidate for candidate in candidates if candidate["nl"] == "kat")
+    assert entry["count"] == 3 and entry["forms"] == ["katten"]
+
+
+def test_expressions_come_first_without_their_words():
+    text = "Hij houdt rekening met het weer. Wij houden altijd rekening met jullie."
+    assert find_expressions(tokenize(text)) == {"rekening houden met": 2}
+    candidates = extract_candidates(text, None)
+    assert candidates[0] == {"nl": "rekening houden met", "forms": [], "count": 2, "frequency": None,
+                             "expression": True}
+    assert "rekening" not in [candidate["nl"] for candidate in candidates]
+
+
+def test_rare_words_rank_before_frequent_ones():
+    words = [candidate["nl"] for candidate in extract_candidates(TEXT, None) if not candidate["expression"]]
+    # "ober" is much rarer in Dutch than "koffie", which is rarer than "kopen"
+    assert words.index("ober") < words.index("koffie") < words.index("kopen")
+
+
+def test_number_of_candidates_is_limited():
+    assert len(extract_candidates(TEXT, 3)) == 3
+
+
+def test_candidates_above_the_level_are_dropped():
+    candidates = level_candidates([{"nl": "koffie"}, {"nl": "de rekening"}, {"nl": "onbekendwoord"}], "A1")
+    assert [(candidate["nl"], candidate["level"]) for candidate in candidates] == [
+        ("koffie", "A1"), ("onbekendwoord", None)]
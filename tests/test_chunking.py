@@ -0,0 +1,68 @@
+import threading
+
+from dutch_words_coach.chunking import estimate_tokens, merge_results, run_chunks, split_text
+
+PARAGRAPH = "Ik bestel koffie op het terras. De ober brengt de rekening. Daarna fiets ik naar huis."
+
+
+def test_short_text_is_one_chunk():
+    assert split_text(PARAGRAPH, 100) == [PARAGRAPH]
+
+
+def test_paragraphs_are_kept_together_within_the_budget():
+    text = "\n\n".join([PARAGRAPH] * 4)
+    chunks = split_text(text, estimate_tokens(PARAGRAPH) * 2 + 5)
+    assert chunks == ["\n\n".join([PARAGRAPH] * 2)] * 2
+
+
+def test_long_paragraphs_are_split_on_sentences():
+    chunks = split_text(PARAGRAPH, 12)
+    assert chunks == ["Ik bestel koffie op het terras.", "De ober brengt de rekening.",
+                      "Daarna fiets ik naar huis."]
+    assert all(estimate_tokens(chunk) <= 12 for chunk in chunks)
+
+
+def test_run_on_sentences_are_split_on_words():
+    chunks = split_text(" ".join(["koffie"] * 40), 10)
+    assert len(chunks) > 1 and all(estimate_tokens(chunk) <= 10 for chunk in chunks)
+    assert " ".join(chunks).split() == ["koffie"] * 40
+
+
+def test_chunks_run_concurrently_and_report_errors():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def extract(chunk):
+        barrier.wait()
+        if chunk == "fout":
+            raise ValueError(chunk)
+        return chunk.upper()
+
+    results = {index: (result, error) for index, result, error in run_chunks(["a", "fout", "c"], extract, 3)}
+    assert results[0] == ("A", None) and results[2] == ("C", None)
+    assert results[1][0] is None and isinstance(results[1][1], ValueError)
+
+
+def test_rewrites_are_stitched_in_order():
+    merged = merge_results([{"rewritten_text": {"nl": "Eerst.", "target": "First."}},
+                            None,
+                            {"rewritten_text": {"nl": "Dan.", "target": "Then."}}])
+    assert merged["rewritten_text"] == {"nl": "Eerst.\n\nDan.", "target": "First.\n\nThen."}
+
+
+def test_duplicate_words_are_merged():
+    first = [{"nl": "Koffie", "target": "", "level": "B1",
+              "examples": [{"nl": "Koffie graag."}, {"nl": "Zwarte koffie."}]}]
+    second = [{"nl": "koffie ", "target": "coffee", "level": "A1",
+               "examples": [{"nl": "Zwarte koffie."}, {"nl": "Nog een koffie."}, {"nl": "Koffie met melk."}]},
+              {"nl": "thee", "level": "b1/b2"}]
+    merged = merge_results([{"words": first}, {"words": second}], max_examples=3)
+    assert merged["words"] == [
+        {"nl": "Koffie", "target": "coffee", "level": "A1",
+         "examples": [{"nl": "Koffie graag."}, {"nl": "Zwarte koffie."}, {"nl": "Nog een koffie."}]},
+        {"nl": "thee", "level": "b1/b2"},
+    ]
+
+
+def test_unknown_levels_do_not_replace_known_ones():
+    merged = merge_results([{"words": [{"nl": "koffie", "level": "A2"}]}, {"words": [{"nl": "koffie"}]}])
+    assert merged["words"] == [{"nl": "koffie", "level": "A2"}]
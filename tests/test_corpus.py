@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from dutch_words_coach.cache import ResponseCache
+from dutch_words_coach.candidates import extract_candidates
+from dutch_words_coach.corpus import ExampleCorpus
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.generation import extract_vocabulary, extract_words, generate_examples, generate_situation_words
+
+TEXT = "Ik bestel koffie op het terras. De ober brengt de rekening."
+
+
+class RecordingModel(FakeGenerativeModel):
+    """Fake model that keeps the prompts it was called with."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt, **kwargs)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    return ExampleCorpus(tmp_path / "corpus.sqlite3")
+
+
+def _generations(model):
+    """The prompts for words, examples or rewrites, without the levels of words the lexicon does not know."""
+    return [prompt for prompt in model.prompts if not prompt.startswith("Could you give the CEFR level")]
+
+
+def _examples(word, count=4):
+    return [{"nl": f"Dit is zin {index} met {word}.", "target": f"sentence {index}"} for index in range(count)]
+
+
+def test_examples_are_found_by_lemma(corpus):
+    corpus.add("koffie drinken", [{"nl": "We drinken samen koffie op het terras.", "target": "We drink coffee."}],
+               "English", "A2")
+    assert corpus.find("de koffie", "English") == [{"nl": "We drinken samen koffie op het terras.",
+                                                    "target": "We drink coffee."}]
+    assert corpus.find("dronk", "English")
+    # Other languages and higher levels than asked for are not served
+    assert corpus.find("koffie", "Korean") == []
+    assert corpus.find("koffie", "English", max_level="A1") == []
+
+
+def test_short_and_repeated_sentences_are_not_stored(corpus):
+    assert corpus.add("koffie", [{"nl": "Koffie!", "target": "Coffee!"}], "English") == 0
+    assert corpus.add("koffie", _examples("koffie", 2), "English") == 2
+    assert corpus.add("koffie", _examples("koffie", 2), "Korean") == 0
+    assert len(corpus) == 2 and len(corpus.find("koffie", "Korean")) == 2
+
+
+def test_only_the_missing_examples_are_requested(corpus):
+    corpus.add("de rekening", _examples("rekening", 1), "English")
+    model = RecordingModel()
+    examples = generate_examples(model, ["de rekening"], "in een café", "English", corpus=corpus)
+    assert "3 natural Dutch example sentences" in model.prompts[0]
+    assert len(examples["de rekening"]) == 4 and examples["de rekening"][0] == _examples("rekening", 1)[0]
+
+
+def test_words_with_all_their_examples_need_no_request(corpus):
+    corpus.add("de rekening", _examples("rekening"), "English")
+    model = RecordingModel()
+    assert generate_examples(model, ["de rekening"], "in een café", "English", corpus=corpus) == {
+        "de rekening": sorted(_examples("rekening"), key=lambda example: example["nl"], reverse=True)}
+    assert model.calls == 0
+
+
+def test_words_and_examples_are_still_one_request(corpus):
+    model = RecordingModel()
+    result = generate_situation_words(model, "bestellen in een café", "English", corpus=corpus)
+    assert len(_generations(model)) == 1
+    assert all(item["examples"] for item in result["words"])
+    # The examples are kept for later requests
+    assert len(corpus) > 0
+
+
+def test_level_change_reruns_only_the_rewrite_with_a_corpus(corpus):
+    model = RecordingModel()
+    cache = ResponseCache(corpus.path.parent / "cache.sqlite3")
+    extract_vocabulary(model, TEXT, "English", "B1", cache=cache, corpus=corpus)
+    assert len(_generations(model)) == 2
+    extract_vocabulary(model, TEXT, "English", "A2", cache=cache, corpus=corpus)
+    assert len(model.prompts) == 4 and "TEXT TO REWRITE" in model.prompts[-1]
+
+
+def test_covered_candidates_take_their_examples_from_the_corpus(corpus):
+    candidates = [candidate["nl"] for candidate in extract_candidates(TEXT, None)]
+    for word in candidates:
+        corpus.add(word, _examples(word), "English")
+    model = RecordingModel(responses=[json.dumps({"words": [{"nl": word, "target": "word"} for word in candidates]})])
+    result = extract_words(model, TEXT, "English", use_candidates=True, corpus=corpus)
+    # One request for the translations alone
+    assert model.calls == 1 and "example" not in model.prompts[0]
+    assert all(len(item["examples"]) == 4 for item in result["words"])
+
+
+def test_candidates_mostly_missing_from_the_corpus_get_examples_in_one_request(corpus):
+    model = RecordingModel()
+    result = extract_words(model, TEXT, "English", use_candidates=True, corpus=corpus)
+    assert model.calls == 1 and "example sentences" in model.prompts[0]
+    assert all(item["examples"] for item in result["words"])
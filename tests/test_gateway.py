@@ -0,0 +1,197 @@
+import threading
+import time
+
+import pytest
+
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.gateway import RequestDeadlineExceeded, RequestGateway, TokenBucket, _Race, is_retryable
+from dutch_words_coach.generation import generate_text
+from dutch_words_coach.metrics import REGISTRY
+from dutch_words_coach.parsing import ResponseParseError
+from dutch_words_coach.schemas import SITUATION_SCHEMA
+
+
+# Named like the API's errors: overload is retried, a refused key is not
+class ServiceUnavailable(Exception):
+    pass
+
+
+class PermissionDenied(Exception):
+    pass
+
+
+class FailingModel(FakeGenerativeModel):
+    """Fake model whose first ``failures`` calls raise ``error``."""
+
+    def __init__(self, error, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.error = error
+        self.failures = failures
+
+    def generate_content(self, prompt, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise self.error("upstream failed")
+        return super().generate_content(prompt, **kwargs)
+
+
+class SlowFirstModel(FakeGenerativeModel):
+    """Fake model whose first call for a prompt containing ``slow`` takes ``delay`` seconds to start."""
+
+    def __init__(self, delay, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.slowed = False
+
+    def generate_content(self, prompt, **kwargs):
+        if "slow" in prompt and not self.slowed:
+            self.slowed = True
+            time.sleep(self.delay)
+        return super().generate_content(prompt, **kwargs)
+
+
+def _text(response, stream):
+    return "".join(chunk.text for chunk in response) if stream else response.text
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_identical_concurrent_calls_share_one_upstream_call(stream):
+    model = FakeGenerativeModel(latency=0.3)
+    gateway = RequestGateway(model)
+    texts = []
+
+    def call():
+        texts.append(_text(gateway.generate_content("bestellen in een café", stream=stream), stream))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.calls == 1
+    assert len(texts) == 5 and len(set(texts)) == 1
+
+
+def test_different_prompts_are_not_coalesced():
+    model = FakeGenerativeModel()
+    gateway = RequestGateway(model)
+    gateway.generate_content("op de markt")
+    gateway.generate_content("bij de bakker")
+    assert model.calls == 2
+
+
+def test_retryable_errors_are_retried():
+    model = FailingModel(ServiceUnavailable, failures=2)
+    gateway = RequestGateway(model, base_delay=0.001)
+    before = REGISTRY.value("model_retries_total", error="ServiceUnavailable")
+    assert gateway.generate_content("op de markt").text
+    assert REGISTRY.value("model_retries_total", error="ServiceUnavailable") - before == 2
+
+
+def test_fatal_errors_are_not_retried():
+    model = FailingModel(PermissionDenied, failures=3)
+    gateway = RequestGateway(model, base_delay=0.001)
+    with pytest.raises(PermissionDenied):
+        gateway.generate_content("op de markt")
+    assert model.failures == 2
+
+
+def test_retries_stop_after_max_retries():
+    model = FailingModel(ServiceUnavailable, failures=10)
+    gateway = RequestGateway(model, max_retries=2, base_delay=0.001)
+    with pytest.raises(ServiceUnavailable):
+        gateway.generate_content("op de markt")
+    assert model.failures == 7
+
+
+def test_is_retryable_uses_error_names_and_status_codes():
+    error = RuntimeError("quota")
+    error.code = 429
+    assert is_retryable(error)
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ValueError("bad request"))
+
+
+def test_slow_call_is_hedged_after_the_observed_quantile():
+    model = SlowFirstModel(delay=3.0, latency=0.01)
+    gateway = RequestGateway(model, min_latency_samples=5)
+    assert gateway.hedge_delay(stream=False) is None
+    for index in range(5):
+        gateway.generate_content(f"vraag {index}")
+    assert gateway.hedge_delay(stream=False) is not None
+
+    before = REGISTRY.value("hedged_requests_total", model="fake-model", winner="hedge")
+    start = time.monotonic()
+    assert gateway.generate_content("slow vraag").text
+    assert time.monotonic() - start < 2.0
+    assert REGISTRY.value("hedged_requests_total", model="fake-model", winner="hedge") - before == 1
+
+
+def test_hedging_can_be_turned_off():
+    gateway = RequestGateway(FakeGenerativeModel(), hedge_quantile=0, min_latency_samples=1)
+    gateway.generate_content("op de markt")
+    assert gateway.hedge_delay(stream=False) is None
+
+
+def test_deadline_stops_waiting():
+    gateway = RequestGateway(FakeGenerativeModel(latency=2.0))
+    start = time.monotonic()
+    with pytest.raises(RequestDeadlineExceeded):
+        gateway.generate_content("op de markt", deadline=0.2)
+    assert time.monotonic() - start < 1.0
+
+
+def test_deadline_returns_the_streamed_words_so_far():
+    # About two seconds of output, cut off after a third of it
+    model = FakeGenerativeModel(tokens_per_second=400, chunk_chars=40)
+    gateway = RequestGateway(model)
+    with pytest.raises(ResponseParseError) as error:
+        generate_text(gateway, "op de markt", SITUATION_SCHEMA, stream=True, deadline=0.7)
+    words = error.value.partial["words"]
+    assert 0 < len(words) < model.n_words
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=600, capacity=1)
+    bucket.acquire()
+    assert not bucket.try_acquire()
+    start = time.monotonic()
+    bucket.acquire()
+    assert 0.05 < time.monotonic() - start < 0.5
+
+
+def test_token_bucket_debt_delays_later_callers():
+    bucket = TokenBucket(per_minute=600, capacity=10)
+    bucket.consume(12)
+    # -2 tokens, refilled at 10 per second: one is available after 0.3 seconds
+    assert not bucket.try_acquire()
+    time.sleep(0.4)
+    assert bucket.try_acquire()
+
+
+def test_share_scales_the_rate_limits():
+    gateway = RequestGateway(FakeGenerativeModel(), requests_per_minute=60, tokens_per_minute=6000, share=0.5)
+    assert gateway.request_bucket.rate == pytest.approx(0.5)
+    gateway.set_share(0.25)
+    assert gateway.request_bucket.rate == pytest.approx(0.25)
+    assert gateway.token_bucket.capacity == pytest.approx(1500)
+
+
+def test_race_first_output_wins():
+    race = _Race()
+    race.started = race.running = 2
+    assert race.claim(1)
+    assert not race.claim(0)
+    race.end(0, ServiceUnavailable("late"))
+    assert not race.finished
+    race.end(1, None, "usage")
+    assert race.finished and race.error is None and race.usage_metadata == "usage"
+
+
+def test_race_fails_only_when_every_attempt_failed():
+    race = _Race()
+    race.started = race.running = 2
+    race.end(0, ServiceUnavailable("first"))
+    assert not race.finished
+    race.end(1, ServiceUnavailable("second"))
+    assert race.finished and str(race.error) == "first"
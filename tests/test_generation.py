@@ -0,0 +1,142 @@
+import json
+import time
+
+import pytest
+
+from dutch_words_coach.cache import ResponseCache
+from dutch_words_coach.candidates import extract_candidates
+from dutch_words_coach.corpus import ExampleCorpus
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.gateway import RequestGateway
+from dutch_words_coach.generation import (_match_items, extract_vocabulary, extract_words, generate_examples,
+                                          generate_situation_words, translate_result)
+from dutch_words_coach.parsing import ResponseParseError
+from dutch_words_coach.routing import ModelRouter, RoutingPolicy
+
+TEXT = "Ik bestel koffie op het terras. De ober brengt de rekening."
+
+
+class SlowModel(FakeGenerativeModel):
+    """Fake model that takes ``delay`` seconds for prompts containing ``slow``."""
+
+    def __init__(self, slow, delay=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.slow = slow
+        self.delay = delay
+
+    def generate_content(self, prompt, **kwargs):
+        if self.slow in prompt:
+            time.sleep(self.delay)
+        return super().generate_content(prompt, **kwargs)
+
+
+def _router(model, deadline=0.3):
+    return ModelRouter({"standard": RequestGateway(model, max_retries=0)}, RoutingPolicy(deadline=deadline))
+
+
+def test_late_rewrite_keeps_the_words():
+    with pytest.raises(ResponseParseError) as error:
+        extract_vocabulary(_router(SlowModel("TEXT TO REWRITE")), TEXT, "English", "B1")
+    assert error.value.partial["rewritten_text"] == {}
+    assert len(error.value.partial["words"]) == 20
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_late_words_keep_the_rewrite(stream):
+    with pytest.raises(ResponseParseError) as error:
+        extract_vocabulary(_router(SlowModel("Extract")), TEXT, "English", "B1", stream=stream)
+    assert error.value.partial["rewritten_text"]["nl"]
+    assert error.value.partial["words"] == []
+
+
+def test_late_chunks_keep_the_others():
+    model = SlowModel("De ober")
+    with pytest.raises(ResponseParseError) as error:
+        extract_vocabulary(_router(model), TEXT, "English", "B1", chunk_tokens=10)
+    assert error.value.partial["rewritten_text"]["nl"]
+    assert error.value.partial["words"]
+
+
+def test_partial_results_are_not_cached(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    with pytest.raises(ResponseParseError):
+        extract_vocabulary(_router(SlowModel("TEXT TO REWRITE")), TEXT, "English", "B1", cache=cache)
+    model = FakeGenerativeModel()
+    extract_vocabulary(_router(model), TEXT, "English", "B1", cache=cache)
+    # Only the rewrite is generated again; the finished words came from the cache
+    assert model.calls == 1
+
+
+def test_late_example_batches_keep_the_others():
+    words = ["koffie", "thee", "brood", "kaas", "melk", "de fiets"]
+    with pytest.raises(ResponseParseError) as error:
+        generate_examples(_router(SlowModel("de fiets")), words, "op de markt", "English", "B1", batch_size=5)
+    assert sorted(error.value.partial) == sorted(words[:5])
+
+
+def test_word_list_without_its_examples_is_partial(tmp_path):
+    corpus = ExampleCorpus(tmp_path / "corpus.sqlite3")
+    candidates = [candidate["nl"] for candidate in extract_candidates(TEXT, None)]
+    # The corpus covers all but one word, so only the translations and that word's examples are requested
+    for word in candidates[1:]:
+        corpus.add(word, [{"nl": f"Dit is zin {index} met {word}.", "target": "example"} for index in range(4)],
+                   "English")
+    model = SlowModel("natural Dutch example",
+                      responses=_responses({"words": [{"nl": word, "target": "word"} for word in candidates]}))
+    with pytest.raises(ResponseParseError) as error:
+        extract_words(_router(model), TEXT, "English", use_candidates=True, corpus=corpus)
+    words = error.value.partial["words"]
+    assert len(words) == len(candidates)
+    assert [item["nl"] for item in words if "examples" not in item] == candidates[:1]
+
+
+def _responses(*documents):
+    return [json.dumps(document, ensure_ascii=False) for document in documents]
+
+
+def test_items_are_matched_by_number():
+    items = [{"index": 2, "target": "terrace"}, {"index": 1, "target": "bill"}]
+    assert _match_items(["de rekening", "het terras"], items) == {"de rekening": items[1], "het terras": items[0]}
+
+
+def test_items_without_a_valid_number_are_dropped():
+    items = [{"target": "no number"}, {"index": 0, "target": "zero"}, {"index": 3, "target": "too high"},
+             {"index": "1", "target": "text"}, {"index": 2, "target": "terrace"}, {"index": 2, "target": "again"}]
+    assert _match_items(["de rekening", "het terras"], items) == {"het terras": items[4]}
+
+
+def test_untranslated_texts_are_requested_again():
+    result = {"words": [{"keyword": {"nl": "de rekening", "target": "la cuenta"}},
+                        {"keyword": {"nl": "het terras", "target": "la terraza"}}]}
+    model = FakeGenerativeModel(responses=_responses({"translations": [{"index": 2, "target": "terrace"}]},
+                                                     {"translations": [{"index": 1, "target": "bill"}]}))
+    translated = translate_result(model, result, "English")
+    assert [item["keyword"]["target"] for item in translated["words"]] == ["bill", "terrace"]
+    assert model.calls == 2
+
+
+def test_texts_that_stay_untranslated_raise():
+    result = {"words": [{"keyword": {"nl": "de rekening", "target": "la cuenta"}}]}
+    model = FakeGenerativeModel(responses=_responses({"translations": [{"index": 5, "target": "bill"}]}))
+    with pytest.raises(ValueError):
+        translate_result(model, result, "English")
+
+
+def test_examples_of_unmatched_words_are_left_out():
+    examples = [{"nl": "Mag ik de rekening?", "target": "Can I have the bill?"}]
+    model = FakeGenerativeModel(responses=_responses({"words": [{"index": 1, "examples": examples},
+                                                                {"index": 7, "examples": examples}]}))
+    assert generate_examples(model, ["de rekening", "het terras"], "in een café", "English") == {
+        "de rekening": examples}
+
+
+def test_translations_of_a_result_take_one_cache_entry(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    result = {"words": [{"keyword": {"nl": "de rekening", "target": "la cuenta"}},
+                        {"keyword": {"nl": "het terras", "target": "la terraza"}}]}
+    model = FakeGenerativeModel(responses=_responses({"translations": [{"index": 1, "target": "bill"},
+                                                                       {"index": 2, "target": "terrace"}]}))
+    translated = translate_result(model, result, "English", cache=cache)
+    assert len(cache) == 1
+    assert translate_result(model, result, "English", cache=cache) == translated
+    assert model.calls == 1
@@ -0,0 +1,213 @@
+import threading
+import time
+
+import pytest
+
+from dutch_words_coach import jobs
+from dutch_words_coach.cache import ResponseCache
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.gateway import RequestGateway
+from dutch_words_coach.jobs import MAX_ATTEMPTS, JobClient, JobFailed, JobNotFound, Worker, WorkerSets, pool_of
+from dutch_words_coach.routing import ModelRouter
+
+
+@pytest.fixture
+def run_worker(queue):
+    """Start a worker thread for the pool ``"p"`` with the given model; stopped after the test."""
+    stop = threading.Event()
+    threads = []
+
+    def start(model=None, pool="p"):
+        worker = Worker(queue, model or FakeGenerativeModel(), pool)
+        thread = threading.Thread(target=worker.run, kwargs={"should_stop": stop.is_set, "poll_interval": 0.01},
+                                  daemon=True)
+        thread.start()
+        threads.append(thread)
+        return worker
+
+    yield start
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_worker_runs_job_and_streams_words(queue, run_worker):
+    run_worker()
+    job_id = queue.submit("p", "situation", {"situation": "op de markt", "language": "English", "stream": True,
+                                              "with_examples": False}, meta={"inputs": "x"})
+    result = queue.wait(job_id)
+    assert len(result["words"]) == 20
+    assert len(queue.words(job_id)) == 20
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["meta"] == {"inputs": "x"} and job["trace"]
+
+
+def test_result_does_not_wait(queue):
+    job_id = queue.submit("p", "situation", {"situation": "op de markt", "language": "English"})
+    assert queue.result(job_id) is None
+    assert queue.get(job_id)["position"] == 1
+
+
+def test_identical_jobs_are_shared_while_they_run(queue):
+    params = {"situation": "op de markt", "language": "English"}
+    job_id = queue.submit("p", "situation", params, meta={"inputs": 1})
+    assert queue.submit("p", "situation", dict(params), meta={"inputs": 2}) == job_id
+    assert queue.submit("p", "situation", dict(params, language="Korean")) != job_id
+    assert queue.submit("q", "situation", params) != job_id
+
+    _, attempt, _, _ = queue.claim("p")
+    assert queue.submit("p", "situation", params) == job_id
+    queue.finish(job_id, attempt, {"words": []})
+    # A finished job is not run again through the queue; its result comes from the response cache
+    assert queue.submit("p", "situation", params) != job_id
+
+
+def test_jobs_of_other_pools_are_not_claimed(queue):
+    queue.submit("p", "situation", {"situation": "op de markt", "language": "English"})
+    assert queue.claim("q") is None
+    assert queue.claim("p") is not None
+
+
+def test_failed_job_raises_its_error(queue, run_worker):
+    run_worker()
+    # Without a level the vocabulary pipeline fails
+    job_id = queue.submit("p", "vocabulary", {"text": "Ik bestel koffie.", "language": "English"})
+    with pytest.raises(JobFailed):
+        queue.wait(job_id)
+
+
+def test_unknown_job_is_not_found(queue):
+    with pytest.raises(JobNotFound):
+        queue.result("nope")
+
+
+def test_stale_job_is_reclaimed_without_the_lost_runs_words(queue):
+    job_id = queue.submit("p", "situation", {"situation": "op de markt", "language": "English"})
+    _, first, _, _ = queue.claim("p")
+    queue.add_word(job_id, first, {"nl": "koffie"})
+    assert queue.words(job_id) == [{"nl": "koffie"}]
+
+    time.sleep(0.3)
+    reclaimed, second, _, _ = queue.claim("p")
+    assert reclaimed == job_id and second == first + 1
+    assert queue.words(job_id) == []
+
+    # The lost run's reports are ignored from now on
+    assert not queue.heartbeat(job_id, first)
+    queue.add_word(job_id, first, {"nl": "thee"})
+    queue.finish(job_id, first, {"words": []})
+    assert queue.words(job_id) == [] and queue.get(job_id)["status"] == "running"
+
+    assert queue.heartbeat(job_id, second)
+    queue.finish(job_id, second, {"words": [{"nl": "brood"}]})
+    assert queue.result(job_id) == {"words": [{"nl": "brood"}]}
+
+
+def test_job_fails_after_max_attempts(queue):
+    job_id = queue.submit("p", "situation", {"situation": "op de markt", "language": "English"})
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.claim("p") is not None
+        time.sleep(0.3)
+    assert queue.claim("p") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"]["type"] == "WorkerLost"
+
+
+def test_workers_split_the_rate_limits(queue, run_worker, monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.05)
+    gateways = [RequestGateway(FakeGenerativeModel(), requests_per_minute=60) for _ in range(3)]
+    for gateway in gateways:
+        run_worker(gateway)
+    time.sleep(0.3)
+    assert [gateway.share for gateway in gateways] == [pytest.approx(1 / 3)] * 3
+    # Workers of other API keys do not count
+    assert queue.register_worker("other", "q") == 1
+
+
+class FakeProcess:
+    def __init__(self):
+        self.stopped = False
+
+    def poll(self):
+        return 0 if self.stopped else None
+
+    def terminate(self):
+        self.stopped = True
+
+    def wait(self):
+        return 0
+
+
+@pytest.fixture
+def started(monkeypatch):
+    """The fake worker processes started per API key."""
+    processes = {}
+
+    def start_workers(api_key, count=None):
+        process = processes[api_key] = FakeProcess()
+        return process
+
+    monkeypatch.setattr(jobs, "start_workers", start_workers)
+    return processes
+
+
+def test_worker_sets_are_capped(queue, started):
+    sets = WorkerSets(queue, max_keys=2)
+    for api_key in ("a", "b", "a", "c"):
+        sets.ensure(api_key)
+    # "b" was used least recently
+    assert started["b"].stopped and not started["a"].stopped and not started["c"].stopped
+
+    sets.ensure("b")
+    assert not started["b"].stopped and started["a"].stopped
+    sets.stop_all()
+    assert all(process.stopped for process in started.values())
+
+
+def test_idle_worker_sets_are_stopped_without_pending_jobs(queue, started):
+    sets = WorkerSets(queue, idle_seconds=0.1)
+    sets.ensure("a")
+    sets.ensure("b")
+    queue.submit(pool_of("b"), "situation", {"situation": "op de markt", "language": "English"})
+    time.sleep(0.2)
+    sets.ensure("c")
+    assert started["a"].stopped and not started["b"].stopped and not started["c"].stopped
+
+    # A stopped set starts again on the next use of its key
+    stopped = started["a"]
+    sets.ensure("a")
+    assert started["a"] is not stopped and not started["a"].stopped
+
+
+@pytest.mark.parametrize("kind, params", [
+    ("situation", {"situation": "op de markt", "language": "English"}),
+    ("vocabulary", {"text": "Ik bestel koffie op het terras.", "language": "English", "level": "B1"}),
+    ("examples", {"words": ["koffie", "de rekening"], "context": "in een café", "language": "English"}),
+])
+def test_cached_results_are_served_without_a_job(queue, tmp_path, kind, params):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    client = JobClient(queue, "k", cache=cache)
+    assert client.cached(kind, params) is None
+
+    model = ModelRouter.from_env(lambda name: FakeGenerativeModel(model_name=name))
+    result = jobs.generate(model, kind, params, cache)
+    assert client.cached(kind, params) == result
+    assert client.cached(kind, dict(params, language="Korean")) is None
+
+
+def test_jobs_of_other_api_keys_are_not_found(queue):
+    owner, other = JobClient(queue, "k"), JobClient(queue, "other")
+    job_id = owner.submit("situation", {"situation": "op de markt", "language": "English"})
+    _, attempt, _, _ = queue.claim(owner.pool)
+    queue.add_word(job_id, attempt, {"nl": "koffie"})
+    assert owner.get(job_id)["status"] == "running" and owner.words(job_id) == [{"nl": "koffie"}]
+    with pytest.raises(JobNotFound):
+        other.get(job_id)
+    with pytest.raises(JobNotFound):
+        other.result(job_id)
+    assert other.words(job_id) == []
+
+    queue.finish(job_id, attempt, {"words": []})
+    assert owner.result(job_id) == {"words": []}
+    with pytest.raises(JobNotFound):
+        other.wait(job_id)
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from dutch_words_coach.cache import ResponseCache
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.generation import generate_situation_words
+from dutch_words_coach.levels import CefrLexicon, assign_level, filter_by_level, lexicon
+
+WORDS = {"words": [{"keyword": {"nl": "de koffie", "target": "coffee"}},
+                   {"keyword": {"nl": "de cappuccinomachine", "target": "cappuccino machine"}}]}
+
+
+class RecordingModel(FakeGenerativeModel):
+    """Fake model that keeps the prompts it was called with."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt, **kwargs)
+
+
+def _model(*documents):
+    return RecordingModel(responses=[json.dumps(document, ensure_ascii=False) for document in documents])
+
+
+def test_lexicon_finds_inflected_forms():
+    assert lexicon().level_of("de fietsen") == lexicon().level_of("fiets") == "A1"
+    assert lexicon().level_of("cappuccinomachine") is None
+
+
+def test_lexicon_lookup_is_exact():
+    entries = CefrLexicon([("kat", "A1"), ("katrol", "B2")])
+    assert len(entries) == 2
+    assert entries.get("kat") == "A1" and entries.get("ka") is None and entries.get("kattenluik") is None
+
+
+@pytest.mark.parametrize("model_level, level", [(None, "A1"), ("A2", "A1"), ("C2", "A1")])
+def test_lexicon_level_replaces_the_models(model_level, level):
+    item = assign_level({"keyword": {"nl": "koffie", "level": model_level}})
+    assert item["keyword"]["level"] == level
+
+
+@pytest.mark.parametrize("model_level, level", [("b1/b2", "B1"), ("C1 (advanced)", "C1"), ("?", None), (None, None)])
+def test_model_levels_of_unknown_words_are_normalized(model_level, level):
+    item = assign_level({"nl": "cappuccinomachine", "level": model_level})
+    assert item.get("level") == level
+
+
+def test_words_above_the_level_are_left_out():
+    words = [{"nl": "koffie", "level": "A1"}, {"nl": "rekening houden met", "level": "B2"}, {"nl": "iets"}]
+    assert [item["nl"] for item in filter_by_level(words, "B1")] == ["koffie", "iets"]
+    assert filter_by_level(words, None) == words
+
+
+def test_model_is_asked_only_for_unknown_words():
+    model = _model(WORDS, {"levels": [{"index": 1, "level": "B2"}]})
+    result = generate_situation_words(model, "in een café", "English")
+    assert "CEFR" not in model.prompts[0]
+    assert "1. de cappuccinomachine" in model.prompts[1] and "koffie" not in model.prompts[1]
+    assert [item["keyword"]["level"] for item in result["words"]] == ["A1", "B2"]
+
+
+def test_levels_are_cached(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    generate_situation_words(_model(WORDS, {"levels": [{"index": 1, "level": "B2"}]}), "in een café", "English",
+                             cache=cache)
+    model = _model({"words": WORDS["words"][1:]})
+    result = generate_situation_words(model, "op het terras", "English", cache=cache)
+    assert model.calls == 1 and result["words"][0]["keyword"]["level"] == "B2"
+
+
+def test_words_without_a_level_from_the_model_keep_none():
+    model = _model(WORDS, {"levels": [{"index": 3, "level": "B2"}]})
+    result = generate_situation_words(model, "in een café", "English")
+    assert [item["keyword"].get("level") for item in result["words"]] == ["A1", None]
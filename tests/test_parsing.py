@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from dutch_words_coach.parsing import ResponseParseError, extract_json, repair_json
+from dutch_words_coach.streaming import WordsStreamParser
+
+WORDS = [
+    {"nl": "de rekening", "target": "the bill", "level": "A2"},
+    {"nl": "rekening houden met", "target": "to take into account", "level": "B2"},
+    {"nl": "\"gezellig\"", "target": "cosy", "level": "A2"},
+]
+
+
+def test_extract_json_reads_code_fences():
+    text = "Hier is het resultaat:\n```json\n" + json.dumps({"words": WORDS}) + "\n```"
+    assert extract_json(text) == {"words": WORDS}
+
+
+@pytest.mark.parametrize("broken", [
+    '{"words": [{"nl": "koffie" "level": "A1"}]}',
+    '{"words": [{"nl": "koffie", "level": "A1",},]}',
+    '{"words": [{"nl": "koffie\nzwart", "level": "A1"}]}',
+])
+def test_repair_json_fixes_common_defects(broken):
+    repaired = json.loads(repair_json(broken))
+    assert repaired["words"][0]["level"] == "A1"
+
+
+def test_repair_json_leaves_truncated_json_open():
+    truncated = json.dumps({"words": WORDS})[:-20]
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(repair_json(truncated))
+
+
+def test_truncated_response_raises_with_the_complete_words():
+    text = json.dumps({"words": WORDS}, ensure_ascii=False)
+    truncated = text[:text.index("gezellig")]
+    with pytest.raises(ResponseParseError) as error:
+        extract_json(truncated)
+    assert error.value.partial == {"words": WORDS[:2]}
+    assert error.value.text == truncated
+
+
+def test_unparseable_response_without_words_has_no_partial():
+    with pytest.raises(ResponseParseError) as error:
+        extract_json('{"words": [{"nl": "koff')
+    assert error.value.partial is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_stream_parser_emits_each_entry_once(chunk_size):
+    text = json.dumps({"situation": {"words": "not this one"}, "words": WORDS}, ensure_ascii=False)
+    parser = WordsStreamParser()
+    items = []
+    for i in range(0, len(text), chunk_size):
+        items += parser.feed(text[i:i + chunk_size])
+    assert items == WORDS
+    assert parser.text == text
+
+
+def test_stream_parser_waits_for_complete_entries():
+    parser = WordsStreamParser()
+    assert parser.feed('{"words": [{"nl": "koffie", "target": "cof') == []
+    assert parser.feed('fee"}, {"nl": "thee"') == [{"nl": "koffie", "target": "coffee"}]
+    assert parser.feed('}]}') == [{"nl": "thee"}]
@@ -0,0 +1,47 @@
+from streamlit.testing.v1 import AppTest
+
+from dutch_words_coach.ui import NO_EXAMPLES_YET, words_html, words_table
+
+WORDS = [
+    {"keyword": {"nl": "de rekening", "target": "the bill", "level": "A2"},
+     "examples": [{"nl": "Mag ik de rekening?", "target": "Can I have the bill?"}]},
+    {"nl": "<b>gezellig</b>", "target": "cosy & warm"},
+]
+
+
+def test_html_has_one_collapsible_block_per_word():
+    html = words_html(WORDS)
+    assert html.count("<details>") == 2
+    assert "<b>de rekening</b> (A2)" in html and "<li>Mag ik de rekening? (Can I have the bill?)</li>" in html
+    # Model output is escaped, and missing fields are shown as N/A
+    assert "&lt;b&gt;gezellig&lt;/b&gt;" in html and "cosy &amp; warm" in html and "(N/A)" in html
+    assert NO_EXAMPLES_YET in html
+
+
+def test_table_has_one_row_per_word():
+    assert words_table(WORDS) == [
+        {"Nederlands": "de rekening", "Vertaling": "the bill", "Niveau": "A2",
+         "Voorbeelden": "Mag ik de rekening? (Can I have the bill?)"},
+        {"Nederlands": "<b>gezellig</b>", "Vertaling": "cosy & warm", "Niveau": "N/A", "Voorbeelden": ""},
+    ]
+
+
+def _app(mode, count, page_size):
+    from dutch_words_coach.ui import render_words
+    render_words([{"nl": f"woord {i}", "target": "word"} for i in range(count)], mode, page_size)
+
+
+def test_long_lists_are_split_into_pages():
+    at = AppTest.from_function(_app, args=("Compact", 120, 50)).run()
+    assert [tab.label for tab in at.tabs] == ["1–50", "51–100", "101–120"]
+    assert len(at.markdown) == 3
+
+
+def test_short_lists_are_one_element():
+    at = AppTest.from_function(_app, args=("Tabel", 10, 50)).run()
+    assert not at.tabs and len(at.dataframe) == 1
+
+
+def test_expanders_show_every_word():
+    at = AppTest.from_function(_app, args=("Uitklapbaar", 60, 50)).run()
+    assert not at.tabs and len(at.expander) == 60
@@ -0,0 +1,64 @@
+import pytest
+
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.gateway import RequestGateway
+from dutch_words_coach.routing import DEFAULT_EXAMPLES, DEFAULT_WORDS, ModelRouter, RoutingPolicy, route_of
+
+SHORT_TEXT = "Ik bestel koffie op het terras."
+LONG_TEXT = SHORT_TEXT * 300
+
+
+@pytest.fixture
+def router():
+    return ModelRouter.from_env(lambda name: FakeGenerativeModel(model_name=name))
+
+
+@pytest.mark.parametrize("text, level, tier", [
+    (SHORT_TEXT, "A1", "lite"),
+    (SHORT_TEXT, "B1", "standard"),
+    (SHORT_TEXT, "C2", "pro"),
+    (LONG_TEXT, "A1", "standard"),
+])
+def test_tier_by_size_and_level(router, text, level, tier):
+    route = router.route("rewrite", text, level)
+    assert route.tier == tier
+    assert route.model is router.models[tier]
+
+
+def test_numbers_of_words_and_examples(router):
+    assert router.route("vocabulary", SHORT_TEXT).n_words == RoutingPolicy().min_words
+    assert router.route("vocabulary", LONG_TEXT).n_words == DEFAULT_WORDS
+    assert router.route("examples", SHORT_TEXT, "A2").n_examples == 3
+    assert router.route("examples", SHORT_TEXT, "B2").n_examples == DEFAULT_EXAMPLES
+    # Only the vocabulary is sized by the text, only examples by the level
+    assert router.route("rewrite", SHORT_TEXT, "A1").is_default
+
+
+def test_tiers_with_the_same_model_share_it(monkeypatch):
+    monkeypatch.setenv("GEMINI_MODEL_LITE", "gemini-1.5-flash-latest")
+    router = ModelRouter.from_env(lambda name: FakeGenerativeModel(model_name=name))
+    assert router.models["lite"] is router.models["standard"]
+    assert router.models["pro"] is not router.models["standard"]
+
+
+def test_routing_can_be_turned_off(monkeypatch):
+    monkeypatch.setenv("DUTCH_WORDS_COACH_ROUTING", "0")
+    monkeypatch.setenv("DUTCH_WORDS_COACH_DEADLINE", "5")
+    router = ModelRouter.from_env(lambda name: FakeGenerativeModel(model_name=name))
+    route = router.route("examples", SHORT_TEXT, "A1")
+    assert route.tier == "standard" and route.is_default and route.deadline == 5
+
+
+def test_plain_models_get_the_default_route():
+    model = FakeGenerativeModel()
+    route = route_of(model, "vocabulary", SHORT_TEXT, "A1")
+    assert route.model is model and route.is_default and route.deadline is None
+
+
+def test_share_reaches_every_gateway_once():
+    shared = RequestGateway(FakeGenerativeModel(), requests_per_minute=60)
+    pro = RequestGateway(FakeGenerativeModel(), requests_per_minute=60)
+    router = ModelRouter({"lite": shared, "standard": shared, "pro": pro})
+    router.set_share(0.5)
+    assert shared.share == pro.share == 0.5
+    assert shared.request_bucket.rate == pytest.approx(0.5)
@@ -0,0 +1,97 @@
+import json
+import time
+
+import pytest
+
+from dutch_words_coach.candidates import extract_candidates
+from dutch_words_coach.fake import FakeGenerativeModel
+from dutch_words_coach.generation import extract_words, generate_situation_words
+from dutch_words_coach.vocabulary import VocabularyStore
+
+TEXT = "Ik bestel koffie op het terras. De ober brengt de rekening."
+
+
+class RecordingModel(FakeGenerativeModel):
+    """Fake model that keeps the prompts it was called with."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt, **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VocabularyStore(tmp_path / "vocabulary.sqlite3")
+
+
+def test_words_are_matched_by_lemma(store):
+    learner = store.learner("a")
+    learner.record([{"keyword": {"nl": "de huizen", "target": "houses", "level": "A1"}}], "English")
+    learner.record([{"nl": "huis", "target": "house"}], "English")
+    assert learner.stats() == (1, 0)
+    assert learner.entries(["een huis", "koffie"], "English") == {
+        "een huis": {"nl": "huis", "target": "house", "level": "A1"}}
+
+
+def test_entries_are_kept_per_language_and_learner(store):
+    store.learner("a").record([{"nl": "koffie", "target": "coffee"}], "English")
+    assert store.learner("a").entries(["koffie"], "Korean") == {}
+    assert store.learner("b").entries(["koffie"], "English") == {}
+    assert store.learner("b").stats() == (0, 0)
+
+
+def test_loaded_examples_are_added_without_counting_as_served(store):
+    learner = store.learner("a")
+    learner.record([{"nl": "koffie", "target": "coffee"}], "English")
+    examples = [{"nl": "Ik drink koffie.", "target": "I drink coffee."}]
+    learner.record([{"nl": "koffie", "examples": examples}], "English", served=False)
+    learner.record([{"nl": "thee", "examples": examples}], "English", served=False)
+    assert learner.entries(["koffie"], "English") == {"koffie": {"nl": "koffie", "target": "coffee",
+                                                                 "examples": examples}}
+    assert learner.stats() == (1, 0)
+
+
+def test_known_words_are_listed_most_recent_first(store):
+    learner = store.learner("a")
+    learner.set_known(["de fiets"])
+    time.sleep(0.01)
+    learner.set_known(["koffie", "thee"])
+    learner.set_known(["thee"], known=False)
+    assert learner.known_lemmas() == {"fiets", "koffie"}
+    assert learner.exclusions() == ["koffie", "de fiets"]
+    learner.max_exclusions = 1
+    assert learner.exclusions() == ["koffie"]
+
+
+def test_forget_removes_everything(store):
+    learner = store.learner("a")
+    learner.record([{"nl": "koffie"}], "English")
+    learner.set_known(["thee"])
+    store.forget("a")
+    assert learner.stats() == (0, 0) and learner.entries(["koffie"], "English") == {}
+
+
+def test_known_words_are_left_out_of_prompts_and_results(store):
+    learner = store.learner("a")
+    learner.set_known(["de rekening"])
+    model = RecordingModel(responses=[json.dumps({"words": [{"keyword": {"nl": "de rekening", "target": "bill"}},
+                                                            {"keyword": {"nl": "de ober", "target": "waiter"}}]})])
+    result = generate_situation_words(model, "in een café", "English", learner=learner)
+    assert "Do NOT include these words, the learner already knows them: de rekening" in model.prompts[0]
+    assert [item["keyword"]["nl"] for item in result["words"]] == ["de ober"]
+
+
+def test_candidates_served_before_come_from_the_vocabulary(store):
+    learner = store.learner("a")
+    candidates = [candidate["nl"] for candidate in extract_candidates(TEXT, None)]
+    learner.record([{"nl": word, "target": f"{word} (en)", "level": "A1"} for word in candidates], "English")
+    learner.set_known(candidates[:1])
+    model = RecordingModel()
+    result = extract_words(model, TEXT, "English", with_examples=False, use_candidates=True, learner=learner)
+    assert model.calls == 0
+    assert [item["nl"] for item in result["words"]] == candidates[1:]
+    assert all(item["target"] == f"{item['nl']} (en)" for item in result["words"])